@@ -1,196 +1,305 @@
 import pandas as pd
 import numpy as np
 from pathlib import Path
-import re
-from datetime import datetime, timedelta
+import io
+import os
+import codecs
+import hashlib
+import json
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # 僅 Parquet 輸出需要
+    pa = None
+    pq = None
+
+# Parquet 壓縮方式
+PARQUET_COMPRESSION = 'zstd'
 
 class WeatherDataProcessor:
-    def __init__(self):
+    # PP01 特殊代碼旗標（PP01_flag 欄位，int8）
+    FLAG_NONE = 0
+    FLAG_RAW_9996 = 1
+    FLAG_SPECIAL_MISSING = 2
+    FLAG_TRACE = 3
+    
+    # 自此年月起的檔案為空白分隔格式，並使用新的特殊代碼（原為 2023 年 12 月）
+    NEW_FORMAT_START = (2023, 12)
+    
+    def __init__(self, workers=1):
+        # 平行讀取月檔的行程數，1 表示依序讀取
+        self.workers = workers
         
         self.special_codes_1_11 = [-9991, -9996, -9997, -9998, -9999]
         self.special_codes_12 = [-999.1, -9995.0, -99.6, -99.1, -9.6, -999.6, -9.5, -99.5, -999.5, 
                                  -9.7, -99.7, -999.7, -9.8, 'None', None]
     
-    def clean_value(self, value, month, keep_special_flag=False):
-        """清理單一數值，保留特殊代碼標記以供後續處理"""
-        if pd.isna(value) or value == 'None':
-            return np.nan
-        
-        try:
-            val = float(value)
-            if month <= 11:
-                if val == -9996:
-                    return 'RAW_9996' if keep_special_flag else np.nan
-                elif val in [-9991, -9997, -9999]:
-                    return 'SPECIAL_MISSING' if keep_special_flag else np.nan
-                elif val == -9998:  # 雨跡
-                    return 'TRACE' if keep_special_flag else 0.0
-            else:  # 12月
-                if val == -99.6:  # 12月的-9996
-                    return 'RAW_9996' if keep_special_flag else np.nan
-                elif val in [-999.1, -99.1, -999.7, -99.7, -9995.0]:
-                    return 'SPECIAL_MISSING' if keep_special_flag else np.nan
-                elif val == -9.8:  # 12月的雨跡
-                    return 'TRACE' if keep_special_flag else 0.0
-                elif val in [-9.6, -999.6, -9.5, -99.5, -999.5]:
-                    return 'RAW_9996' if keep_special_flag else np.nan
-            return val
-        except:
-            return np.nan
-    
-    def read_monthly_file(self, filepath, month):
-        """讀取單月氣象檔案"""
-        data = []
+    def arrow_schema(self, kind):
+        """輸出欄位的 Arrow 型別：kind 為 'hourly'（小時資料）或 'daily'（日資料）"""
+        if kind == 'hourly':
+            return pa.schema([
+                ('stno', pa.string()), ('year', pa.int16()), ('month', pa.int8()),
+                ('day', pa.int8()), ('hour', pa.int8()), ('datetime', pa.timestamp('s')),
+                ('PP01', pa.float64()), ('PP01_flag', pa.int8()),
+                ('PP01_raw', pa.dictionary(pa.int32(), pa.string())), ('TX01', pa.float64()),
+            ])
+        if kind == 'daily':
+            return pa.schema([
+                ('stno', pa.string()), ('year', pa.int16()), ('month', pa.int8()), ('day', pa.int8()),
+                ('PP01', pa.float64()), ('TX01', pa.float64()), ('valid_hours_rainfall', pa.int8()),
+                ('missing_hours_rainfall', pa.int8()), ('total_hours', pa.int8()),
+                ('date', pa.timestamp('s')),
+            ])
+        raise ValueError(f"未知的資料種類: {kind}")
+    
+    def write_parquet(self, df, path, kind=None, partition_cols=None):
+        """
+        以 Arrow 寫出 Parquet
+        - kind 指定時依 arrow_schema 的明確型別轉換，否則由欄位型別推得
+        - partition_cols 指定時寫為分割資料夾（例如 stno=.../year=...），同一分割的舊檔會被取代
+        """
+        if pa is None:
+            raise ImportError("Parquet 輸出需要安裝 pyarrow")
+        schema = self.arrow_schema(kind) if kind else None
+        table = pa.Table.from_pandas(df, schema=schema, preserve_index=False)
+        if partition_cols:
+            pq.write_to_dataset(table, path, partition_cols=partition_cols,
+                                compression=PARQUET_COMPRESSION,
+                                existing_data_behavior='delete_matching')
+        else:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            pq.write_table(table, path, compression=PARQUET_COMPRESSION)
+    
+    def read_hourly_data(self, path, columns=None, stations=None, years=None):
+        """
+        讀取 Parquet 小時資料（單檔或依測站／年度分割的資料夾），只載入需要的欄位與分割
+        - stations、years：測站代碼與年度列表，未指定時讀取全部
+        """
+        filters = []
+        if stations is not None:
+            filters.append(('stno', 'in', list(stations)))
+        if years is not None:
+            filters.append(('year', 'in', [int(year) for year in years]))
+        
+        data = pd.read_parquet(path, columns=columns, filters=filters or None)
+        # 分割欄位讀回為類別，轉回原型別並依輸出欄位順序排列
+        if 'stno' in data.columns:
+            data['stno'] = data['stno'].astype(str)
+        if 'year' in data.columns:
+            data['year'] = data['year'].astype(np.int16)
+        order = [name for name in self.arrow_schema('hourly').names if name in data.columns]
+        return data[order]
+    
+    def is_new_format(self, year, month):
+        """判斷該年月的檔案是否為新格式（空白分隔、新特殊代碼）"""
+        return (year, month) >= self.NEW_FORMAT_START
+    
+    def clean_values(self, values, new_format, keep_special_flag=False):
+        """
+        向量化清理整欄數值，保留特殊代碼標記以供後續處理
+        - new_format：是否為新格式檔案的特殊代碼（見 NEW_FORMAT_START）
+        - 空值、'None' 或無法轉為數字者為 NA
+        - keep_special_flag=False：-9996 與其他缺測代碼為 NA，雨跡為 0，回傳 float 欄位
+        - keep_special_flag=True：回傳 (數值, 旗標)，特殊代碼位置數值為 NA，
+          旗標為 FLAG_RAW_9996、FLAG_SPECIAL_MISSING 或 FLAG_TRACE（int8）
+        """
+        numeric = pd.to_numeric(values, errors='coerce').astype(float)
+        
+        if not new_format:
+            raw_9996 = numeric == -9996
+            special_missing = numeric.isin([-9991, -9997, -9999])
+            trace = numeric == -9998  # 雨跡
+        else:  # 新格式（2023年12月起）
+            raw_9996 = numeric.isin([-99.6, -9.6, -999.6, -9.5, -99.5, -999.5])  # 12月的-9996
+            special_missing = numeric.isin([-999.1, -99.1, -999.7, -99.7, -9995.0])
+            trace = numeric == -9.8  # 新格式的雨跡
+        
+        if not keep_special_flag:
+            cleaned = numeric.mask(raw_9996 | special_missing, np.nan)
+            return cleaned.mask(trace, 0.0)
+        
+        flags = np.select([raw_9996, special_missing, trace],
+                          [self.FLAG_RAW_9996, self.FLAG_SPECIAL_MISSING, self.FLAG_TRACE],
+                          self.FLAG_NONE).astype(np.int8)
+        cleaned = numeric.mask(flags != self.FLAG_NONE, np.nan)
+        return cleaned, pd.Series(flags, index=numeric.index)
+    
+    def detect_encoding(self, raw, sample_size=65536):
+        """以檔案開頭的小樣本判斷編碼，依序嘗試 big5、cp950、gbk、utf-8"""
+        sample = raw[:sample_size]
+        for encoding in ['big5', 'cp950', 'gbk', 'utf-8']:
+            try:
+                # 樣本結尾可能切到多位元組字元，以非最終模式解碼
+                codecs.getincrementaldecoder(encoding)().decode(sample, final=False)
+                return encoding
+            except UnicodeDecodeError:
+                continue
+        return None
+    
+    def read_text_lines(self, filepath):
+        """
+        讀取文字檔並拆行（行尾統一為換行字元）
+        - 編碼由樣本判斷後整個檔案只解碼一次；若樣本之後仍解碼失敗才改試其他編碼
+        """
+        with open(filepath, 'rb') as f:
+            raw = f.read()
         
         encodings = ['big5', 'cp950', 'gbk', 'utf-8']
-        file_content = None
+        detected = self.detect_encoding(raw)
+        if detected is not None:
+            encodings.remove(detected)
+            encodings.insert(0, detected)
         
         for encoding in encodings:
             try:
-                with open(filepath, 'r', encoding=encoding) as f:
-                    file_content = f.readlines()
-                break
+                text = raw.decode(encoding)
             except UnicodeDecodeError:
                 continue
+            return io.StringIO(text, newline=None).readlines()
         
+        return None
+    
+    def read_monthly_file(self, filepath, year, month):
+        """
+        讀取單月氣象檔案（向量化解析）
+        - 舊格式（2023年11月以前）：每欄 7 字元固定寬度，以 NumPy 字元陣列切欄，TX01 為第 2 欄、PP01 為第 6 欄
+        - 新格式（2023年12月起）：空白分隔，以 read_csv 的 C 解析器拆欄，TX01 為第 2 欄、PP01 為第 8 欄
+        """
+        new_format = self.is_new_format(year, month)
+        file_content = self.read_text_lines(filepath)
         if file_content is None:
             print(f"無法讀取檔案 {filepath}")
             return pd.DataFrame()
         
-        for line in file_content:
-            if line.startswith('*') or line.startswith('#'):
-                continue
-            
-            line = line.strip()
-            if not line:
-                continue
-            
-            try:
-                stno = line[0:6].strip()
-                datetime_str = line[7:17].strip()
-
-                if month <= 11:
-                    fields = []
-                    pos = 18
-                    while pos < len(line):
-                        field = line[pos:pos+7].strip()
-                        fields.append(field if field else np.nan)
-                        pos += 7
-                    
-                    if len(fields) >= 6:
-                        pp01_raw = fields[5]
-                        pp01 = self.clean_value(fields[5], month, keep_special_flag=True)
-                        tx01 = self.clean_value(fields[1], month)
-                    else:
-                        pp01, tx01 = np.nan, np.nan
-                        pp01_raw = np.nan
-                else: 
-                    fields = line[18:].split()
-                    if len(fields) >= 8:
-                        tx01 = self.clean_value(fields[1], month)
-                        pp01_raw = fields[7]
-                        pp01 = self.clean_value(fields[7], month, keep_special_flag=True)
-                    else:
-                        pp01, tx01 = np.nan, np.nan
-                        pp01_raw = np.nan
-
-                if len(datetime_str) == 10:
-                    year = int(datetime_str[0:4])
-                    month_num = int(datetime_str[4:6])
-                    day = int(datetime_str[6:8])
-                    hour = int(datetime_str[8:10])
-                    
-                    if month <= 11:
-                        display_hour = hour
-                        dt_hour = hour - 1 if hour <= 24 else hour
-                        if dt_hour == 24:
-                            dt_hour = 23
-                    else:
-                        display_hour = hour + 1
-                        dt_hour = hour
-                        if hour == 23:
-                            display_hour = 24
-                    
-                    try:
-                        dt = datetime(year, month_num, day, dt_hour)
-                    except ValueError:
-                        continue
-                    
-                    data.append({
-                        'stno': stno,
-                        'year': year,
-                        'month': month_num,
-                        'day': day,
-                        'hour': display_hour,
-                        'datetime': dt,
-                        'PP01': pp01,
-                        'PP01_raw': pp01_raw,
-                        'TX01': tx01
-                    })
-            
-            except Exception as e:
-                print(f"解析錯誤 - 行: {line[:50]}..., 錯誤: {e}")
-                continue
+        lines = [line.strip() for line in file_content if not line.startswith(('*', '#'))]
+        lines = np.array([line for line in lines if line], dtype=str)
+        if len(lines) == 0:
+            return pd.DataFrame(columns=['stno', 'year', 'month', 'day', 'hour', 'datetime',
+                                         'PP01', 'PP01_flag', 'PP01_raw', 'TX01'])
+        
+        # 每行轉為等寬字元矩陣，切欄即為矩陣欄位切片
+        width = lines.dtype.itemsize // 4
+        chars = lines.view(np.uint32).reshape(len(lines), width)
+        line_length = np.char.str_len(lines)
+        
+        def column(start, stop=width):
+            stop = min(stop, width)
+            if start >= stop:
+                return np.full(len(lines), '', dtype='U1')
+            block = np.ascontiguousarray(chars[:, start:stop]).view(f'U{stop - start}').ravel()
+            return np.char.strip(block)
+        
+        stno = column(0, 6)
+        
+        if not new_format:
+            # 至少要有 6 個欄位（第 6 欄起始位置 18 + 7*5 之後仍有內容）
+            has_fields = line_length > 18 + 7 * 5
+            tx01_raw = pd.Series(column(25, 32), dtype=object)
+            pp01_raw = pd.Series(column(53, 60), dtype=object)
+        else:
+            # 每行前加上佔位欄位，避免空白行被 read_csv 略過而錯位
+            rest = column(18)
+            fields = pd.read_csv(io.StringIO('\n'.join(np.char.add('_ ', rest))), sep=r'\s+', header=None,
+                                 dtype=object, names=range(width // 2 + 2), keep_default_na=False, na_filter=False)
+            # 欄位數由字串切分計算：'None' 等字樣是合法的欄位值，不可視為缺欄
+            has_fields = pd.Series(rest, dtype=object).str.split().str.len().to_numpy() >= 8
+            tx01_raw = fields[2]
+            pp01_raw = fields[8]
+        
+        pp01_raw = pp01_raw.where(has_fields & (pp01_raw != ''), np.nan)
+        tx01_raw = tx01_raw.where(has_fields & (tx01_raw != ''), np.nan)
+        
+        # 日期時間欄位（yyyymmddhh）：格式錯誤者略過
+        datetime_str = column(7, 17)
+        valid = np.char.str_len(datetime_str) == 10
+        parse_errors = valid & ~np.char.isdigit(datetime_str)
+        if parse_errors.any():
+            print(f"解析錯誤 - 略過 {parse_errors.sum()} 行，例如: {lines[parse_errors][0][:50]}...")
+        valid &= ~parse_errors
+        
+        digits = np.where(valid, datetime_str, '0000000000').astype(np.int64)
+        parts = pd.DataFrame({
+            'year': digits // 1000000,
+            'month': digits // 10000 % 100,
+            'day': digits // 100 % 100,
+            'hour': digits % 100,
+        })
         
-        return pd.DataFrame(data)
+        hour = parts['hour']
+        if not new_format:
+            display_hour = hour
+            dt_hour = hour.where(hour > 24, hour - 1)
+        else:
+            display_hour = hour + 1
+            dt_hour = hour
+        
+        # 小時不在 0-23 或日期無效（例如2月30日）者略過
+        valid &= dt_hour.between(0, 23).to_numpy()
+        dt = pd.to_datetime(parts.assign(hour=dt_hour.clip(0, 23)), errors='coerce')
+        valid &= dt.notna().to_numpy()
+        
+        pp01, pp01_flag = self.clean_values(pp01_raw, new_format, keep_special_flag=True)
+        data = pd.DataFrame({
+            'stno': stno.astype(object),
+            'year': parts['year'],
+            'month': parts['month'],
+            'day': parts['day'],
+            'hour': display_hour,
+            'datetime': dt,
+            'PP01': pp01,
+            'PP01_flag': pp01_flag,
+            'PP01_raw': pp01_raw.astype('category'),
+            'TX01': self.clean_values(tx01_raw, new_format),
+        })
+        
+        return data[valid].reset_index(drop=True)
     
     def apply_rainfall_outlier_removal(self, df):
         """降雨量異常值剔除：>220 mm/hr設為NA"""
         df_copy = df.copy()
         
-        numeric_mask = pd.to_numeric(df_copy['PP01'], errors='coerce').notna()
-        outlier_mask = pd.to_numeric(df_copy['PP01'], errors='coerce') > 220
-        
-        df_copy.loc[numeric_mask & outlier_mask, 'PP01'] = np.nan
+        outlier_mask = df_copy['PP01'] > 220
+        df_copy.loc[outlier_mask, 'PP01'] = np.nan
         
-        outlier_count = (numeric_mask & outlier_mask).sum()
+        outlier_count = outlier_mask.sum()
         if outlier_count > 0:
             print(f"發現且移除 {outlier_count} 筆降雨量異常值 (>220 mm/hr)")
         
         return df_copy
     
-    def ensure_complete_hourly_data(self, df):
-        """確保每個測站每天都有24小時完整資料"""
-        stations = df['stno'].unique()
-        start_date = datetime(2023, 1, 1, 0)
-        end_date = datetime(2023, 12, 31, 23)
+    def ensure_complete_hourly_data(self, df, start=None, end=None):
+        """
+        確保每個測站每天都有24小時完整資料
+        - 以 (stno, datetime) 為索引對完整逐時日曆重新索引，缺漏時段補 NA
+        - 未指定 start/end 時，由資料的最早日 00 時至最晚日 23 時
+        - 同一測站同一時間有多筆時保留第一筆
+        """
+        if start is None:
+            start = df['datetime'].min().normalize()
+        if end is None:
+            end = df['datetime'].max().normalize() + pd.Timedelta(hours=23)
         
-        complete_data = []
+        calendar = pd.date_range(start, end, freq='h')
+        full_index = pd.MultiIndex.from_product([df['stno'].unique(), calendar],
+                                                names=['stno', 'datetime'])
         
-        for station in stations:
-            print(f"處理測站 {station}")
-            station_data = df[df['stno'] == station].copy()
-            
-            current_time = start_date
-            while current_time <= end_date:
-                display_hour = current_time.hour + 1
-                
-                existing = station_data[
-                    (station_data['year'] == current_time.year) &
-                    (station_data['month'] == current_time.month) &
-                    (station_data['day'] == current_time.day) &
-                    (station_data['hour'] == display_hour)
-                ]
-                
-                if len(existing) > 0:
-                    record = existing.iloc[0].copy()
-                else:
-                    record = pd.Series({
-                        'stno': station,
-                        'year': current_time.year,
-                        'month': current_time.month,
-                        'day': current_time.day,
-                        'hour': display_hour,
-                        'datetime': current_time,
-                        'PP01': np.nan,
-                        'PP01_raw': np.nan,
-                        'TX01': np.nan
-                    })
-                
-                complete_data.append(record)
-                current_time += timedelta(hours=1)
+        indexed = (df[df['datetime'].between(start, end)]
+                   .drop_duplicates(['stno', 'datetime'])
+                   .set_index(['stno', 'datetime']))
+        complete_df = indexed[['PP01', 'PP01_flag', 'PP01_raw', 'TX01']].reindex(full_index).reset_index()
+        complete_df['PP01_flag'] = complete_df['PP01_flag'].fillna(self.FLAG_NONE).astype(np.int8)
+        
+        # 日期欄位由時間推得；hour 為顯示用小時（1-24）
+        complete_df['year'] = complete_df['datetime'].dt.year
+        complete_df['month'] = complete_df['datetime'].dt.month
+        complete_df['day'] = complete_df['datetime'].dt.day
+        complete_df['hour'] = complete_df['datetime'].dt.hour + 1
+        complete_df = complete_df[['stno', 'year', 'month', 'day', 'hour', 'datetime',
+                                   'PP01', 'PP01_flag', 'PP01_raw', 'TX01']]
         
-        complete_df = pd.DataFrame(complete_data)
         print(f"完整資料共有 {len(complete_df)} 筆")
         
         return complete_df
@@ -203,37 +312,51 @@ class WeatherDataProcessor:
         # 先處理所有-9996值
         df_processed = self.process_all_9996_values(df_processed)
         
-        # 然後將其他特殊代碼轉為NA
-        special_codes = ['SPECIAL_MISSING', 'TRACE']
-        for code in special_codes:
-            if code == 'TRACE':
-                # 雨跡轉為0
-                df_processed.loc[df_processed['PP01'] == code, 'PP01'] = 0.0
-            else:
-                # 其他特殊代碼轉為NA
-                df_processed.loc[df_processed['PP01'] == code, 'PP01'] = np.nan
+        # 然後處理其他特殊代碼：雨跡轉為0，其他特殊代碼維持NA
+        df_processed.loc[df_processed['PP01_flag'] == self.FLAG_TRACE, 'PP01'] = 0.0
         
         print("特殊代碼處理完成")
         return df_processed
     
     def process_all_9996_values(self, df):
-        """處理所有-9996值，按測站分組處理"""
+        """
+        處理所有-9996值（向量化，全部測站一次處理）
+        - 依測站、時間排序後，以 shift/cumsum 找出連續的 -9996 區段（PP01_flag 為 FLAG_RAW_9996）
+        - 區段後的第一筆為 0 時整段視為 0，其餘（>0、<0、NA、其他特殊代碼、測站末端）視為NA
+        - 結果與逐筆處理的 process_9996_sequence 相同
+        """
         df_processed = df.copy()
+        ordered = df_processed.sort_values(['stno', 'datetime'], kind='stable')
         
-        for station in df['stno'].unique():
-            station_mask = df_processed['stno'] == station
-            station_data = df_processed[station_mask].copy().sort_values('datetime')
-            
-            # 處理該測站的-9996值
-            processed_pp01 = self.process_9996_sequence(station_data['PP01'].tolist())
-            
-            # 更新資料
-            df_processed.loc[station_mask, 'PP01'] = processed_pp01
+        pp01 = ordered['PP01']
+        station = ordered['stno']
+        is_9996 = ordered['PP01_flag'].eq(self.FLAG_RAW_9996)
+        if not is_9996.any():
+            return df_processed
+        
+        # 區段編號：同測站內前一筆不是-9996時開始新區段
+        same_station_prev = station.eq(station.shift())
+        run_start = is_9996 & ~(is_9996.shift(fill_value=False) & same_station_prev)
+        run_id = run_start.cumsum()
+        
+        # 區段最後一筆的下一筆（同測站內）是否恰為數值 0（特殊代碼的 PP01 為 NA，不會等於 0）
+        same_station_next = station.eq(station.shift(-1))
+        next_value = pp01.shift(-1).where(same_station_next)
+        run_end = is_9996 & ~(is_9996.shift(-1, fill_value=False) & same_station_next)
+        zero_after = (next_value == 0) & run_end
+        
+        zero_runs = run_id[zero_after]
+        replacement = pd.Series(np.where(run_id[is_9996].isin(zero_runs), 0.0, np.nan),
+                                index=run_id[is_9996].index)
+        df_processed.loc[replacement.index, 'PP01'] = replacement
         
         return df_processed
     
     def process_9996_sequence(self, pp01_values):
-        """處理-9996序列"""
+        """
+        處理單一測站的-9996序列（逐筆版本，作為向量化 process_all_9996_values 的對照）
+        - 輸入序列以 'RAW_9996'、'SPECIAL_MISSING'、'TRACE' 字串標記特殊代碼
+        """
         processed_values = []
         i = 0
         
@@ -274,46 +397,274 @@ class WeatherDataProcessor:
         
         return processed_values
     
-    def process_all_months(self, data_folder):
-        """處理所有月份資料"""
-        all_data = []
-        
-        # 處理1-11月
-        for month in range(1, 12):
-            filename = f"2023{month:02d}99.auto_hr.txt"
+    def monthly_files(self, data_folder, start, end, lookahead_end=None):
+        """
+        找出日期範圍內各月份的檔案（檔名為 {年}{月}99.auto_hr.txt），回傳 [(路徑, 年, 月)]
+        - lookahead_end：另找 end 之後至該日的前瞻月份；前瞻月份可能尚未發布，缺檔時不提示
+        """
+        files = []
+        last_month = pd.Timestamp(end).to_period('M')
+        for period in pd.period_range(pd.Timestamp(start), pd.Timestamp(lookahead_end or end), freq='M'):
+            filename = f"{period.year}{period.month:02d}99.auto_hr.txt"
             filepath = Path(data_folder) / filename
             
             if filepath.exists():
-                print(f"處理 {month} 月資料")
-                monthly_data = self.read_monthly_file(filepath, month)
-                all_data.append(monthly_data)
-            else:
+                files.append((filepath, period.year, period.month))
+            elif period <= last_month:
                 print(f"找不到檔案: {filename}")
+        return files
+    
+    def yearly_ranges(self, start, end):
+        """將日期範圍依年度切分，回傳 [(年, 起日, 迄日)]"""
+        start = pd.Timestamp(start).normalize()
+        end = pd.Timestamp(end).normalize()
+        return [(year, max(start, pd.Timestamp(year, 1, 1)), min(end, pd.Timestamp(year, 12, 31)))
+                for year in range(start.year, end.year + 1)]
+    
+    def read_months(self, files):
+        """
+        解析一組月份檔案 [(路徑, 年, 月)]，回傳各月的 DataFrame 列表
+        - workers > 1 時以行程池平行解析各月檔案，結果依月份順序排列
+        """
+        for _, year, month in files:
+            print(f"處理 {year} 年 {month} 月資料")
         
-        # 處理12月
-        filename = "20231299.auto_hr.txt"
-        filepath = Path(data_folder) / filename
-        if filepath.exists():
-            print("處理 12 月資料")
-            monthly_data = self.read_monthly_file(filepath, 12)
-            all_data.append(monthly_data)
-        else:
-            print(f"找不到檔案: {filename}")
+        filepaths = [filepath for filepath, _, _ in files]
+        years = [year for _, year, _ in files]
+        months = [month for _, _, month in files]
+        if self.workers > 1 and len(files) > 1:
+            with ProcessPoolExecutor(max_workers=min(self.workers, len(files))) as pool:
+                return list(pool.map(self.read_monthly_file, filepaths, years, months))
+        return [self.read_monthly_file(filepath, year, month) for filepath, year, month in files]
+    
+    def process_months(self, files, start, end, lookahead_end=None):
+        """
+        處理一組月份檔案，輸出 start 日 00 時至 end 日 23 時的完整小時資料
+        - lookahead_end：files 含 end 之後的前瞻資料時，-9996 區段判斷延伸至該日，輸出仍截至 end
+        """
+        all_data = self.read_months(files)
+        if not all_data:
+            return pd.DataFrame()
+        return self.resolve_hourly(pd.concat(all_data, ignore_index=True), start, end, lookahead_end)
+    
+    def resolve_hourly(self, combined_df, start, end, lookahead_end=None):
+        """
+        將已解析的原始小時資料清理、補齊並處理特殊代碼，輸出 start 日 00 時至 end 日 23 時的資料
+        - lookahead_end：資料含 end 之後的前瞻資料時，-9996 區段判斷延伸至該日，輸出仍截至 end
+        """
+        first_hour = pd.Timestamp(start).normalize()
+        last_hour = pd.Timestamp(end).normalize() + pd.Timedelta(hours=23)
+        
+        # 各月類別不同，合併後重新轉為類別欄位
+        combined_df['PP01_raw'] = combined_df['PP01_raw'].astype('category')
+        # 初步清理
+        cleaned_df = self.final_cleaning(combined_df)
+        # 降雨量異常值處理
+        cleaned_df = self.apply_rainfall_outlier_removal(cleaned_df)
+        
+        calendar_end = last_hour
+        if lookahead_end is not None:
+            # 只保留輸出範圍內有資料的測站
+            in_range = cleaned_df['datetime'].between(first_hour, last_hour)
+            cleaned_df = cleaned_df[cleaned_df['stno'].isin(cleaned_df.loc[in_range, 'stno'].unique())]
+            calendar_end = pd.Timestamp(lookahead_end).normalize() + pd.Timedelta(hours=23)
+        
+        # 確保完整的小時資料
+        complete_df = self.ensure_complete_hourly_data(cleaned_df, first_hour, calendar_end)
+        # 處理所有特殊代碼（包括-9996）
+        processed_df = self.process_special_codes_globally(complete_df)
+        
+        if lookahead_end is not None:
+            processed_df = processed_df[processed_df['datetime'] <= last_hour].reset_index(drop=True)
+        return processed_df
+    
+    def iter_yearly_data(self, data_folder, start, end):
+        """
+        逐年處理日期範圍內的資料，依序產生 (年, 起日, 迄日, 小時資料)
+        - 每次只載入一個年度（加上下個月作為前瞻），記憶體用量以一年為上限
+        - 前瞻月份讓年底的 -9996 區段可依隔年第一筆資料判斷，與整段一次處理結果相同
+        """
+        for year, year_start, year_end in self.yearly_ranges(start, end):
+            print(f"處理 {year} 年資料（{year_start:%Y-%m-%d} 至 {year_end:%Y-%m-%d}）")
+            lookahead_end = year_end + pd.offsets.MonthEnd(1)
+            files = self.monthly_files(data_folder, year_start, year_end, lookahead_end)
+            if not any((y, m) <= (year_end.year, year_end.month) for _, y, m in files):
+                print(f"{year} 年無任何資料，略過")
+                continue
+            
+            hourly_df = self.process_months(files, year_start, year_end, lookahead_end)
+            yield year, year_start, year_end, hourly_df
+    
+    def process_all_months(self, data_folder, start='2023-01-01', end='2023-12-31'):
+        """
+        處理日期範圍內所有月份資料（可跨年度），逐年處理後合併
+        """
+        all_data = [hourly_df for _, _, _, hourly_df in self.iter_yearly_data(data_folder, start, end)]
         
         if all_data:
             combined_df = pd.concat(all_data, ignore_index=True)
-            # 初步清理
-            cleaned_df = self.final_cleaning(combined_df)
-            # 降雨量異常值處理
-            cleaned_df = self.apply_rainfall_outlier_removal(cleaned_df)
-            # 確保完整的小時資料
-            complete_df = self.ensure_complete_hourly_data(cleaned_df)
-            # 處理所有特殊代碼（包括-9996）
-            processed_df = self.process_special_codes_globally(complete_df)
-            return processed_df
+            combined_df['PP01_raw'] = combined_df['PP01_raw'].astype('category')
+            return combined_df.sort_values(['stno', 'datetime'], kind='stable').reset_index(drop=True)
         else:
             return pd.DataFrame()
     
+    def file_checksum(self, filepath, chunk_size=1 << 20):
+        """計算檔案的 SHA-256 檢查碼"""
+        digest = hashlib.sha256()
+        with open(filepath, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+    
+    def load_manifest(self, state_dir):
+        """讀取增量處理清單（已處理檔案的檢查碼與研究期間），不存在時回傳空清單"""
+        manifest_path = Path(state_dir) / 'manifest.json'
+        if not manifest_path.exists():
+            return {}
+        with open(manifest_path, encoding='utf-8') as f:
+            return json.load(f)
+    
+    def save_manifest(self, state_dir, manifest):
+        """寫入增量處理清單，先寫暫存檔再替換，中斷時不會留下不完整的清單"""
+        manifest_path = Path(state_dir) / 'manifest.json'
+        tmp_path = manifest_path.with_suffix('.json.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, manifest_path)
+    
+    def parsed_path(self, state_dir, year, month):
+        """單月解析結果的暫存路徑"""
+        return Path(state_dir) / 'parsed' / f"{year}{month:02d}.parquet"
+    
+    def load_parsed_month(self, state_dir, data_folder, year, month):
+        """
+        讀取單月解析結果：優先使用暫存，否則直接解析原始檔案（不寫入暫存），兩者皆無時回傳 None
+        """
+        cached = self.parsed_path(state_dir, year, month)
+        if cached.exists():
+            return self.read_hourly_data(cached)
+        filepath = Path(data_folder) / f"{year}{month:02d}99.auto_hr.txt"
+        if filepath.exists():
+            return self.read_monthly_file(filepath, year, month)
+        return None
+    
+    def process_incremental(self, data_folder, start, end, state_dir='climate_state'):
+        """
+        增量處理：只解析新增或內容變動的月份檔案，回傳 (日資料, 測站統計)
+        - state_dir/manifest.json 記錄已處理檔案的 SHA-256 檢查碼與研究期間，期間改變時全部重建
+        - 各月解析結果存於 state_dir/parsed，作為邊界視窗的資料來源
+        - 變動月份連同前一個月（月底 -9996 區段依下一筆判斷，可能受新資料影響）重新補齊小時、
+          處理 -9996，並讀入下一個月作為前瞻；小時資料逐月存於 state_dir/hourly
+        - 日資料只替換受影響的日期，測站統計只重算受影響的測站與年度
+        """
+        state_dir = Path(state_dir)
+        (state_dir / 'parsed').mkdir(parents=True, exist_ok=True)
+        (state_dir / 'hourly').mkdir(parents=True, exist_ok=True)
+        start = pd.Timestamp(start).normalize()
+        end = pd.Timestamp(end).normalize()
+        daily_path = state_dir / 'daily_weather_data.parquet'
+        stats_path = state_dir / 'station_climate_statistics.parquet'
+        
+        manifest = self.load_manifest(state_dir)
+        study_range = [f"{start:%Y-%m-%d}", f"{end:%Y-%m-%d}"]
+        if manifest.get('range') != study_range or not daily_path.exists() or not stats_path.exists():
+            print("沒有可沿用的處理結果，全部月份重新處理")
+            manifest = {}
+            daily_data = pd.DataFrame()
+            station_stats = pd.DataFrame()
+        else:
+            daily_data = pd.read_parquet(daily_path)
+            station_stats = pd.read_parquet(stats_path)
+        known = manifest.get('files', {})
+        
+        # 以檢查碼找出新增或變動的月份，清單中有但檔案已移除的月份也需重算
+        files = self.monthly_files(data_folder, start, end)
+        checksums = {filepath.name: self.file_checksum(filepath) for filepath, _, _ in files}
+        changed = [(filepath, year, month) for filepath, year, month in files
+                   if known.get(filepath.name, {}).get('sha256') != checksums[filepath.name]
+                   or not self.parsed_path(state_dir, year, month).exists()]
+        removed = [(record['year'], record['month']) for name, record in known.items() if name not in checksums]
+        for year, month in removed:
+            print(f"檔案已移除: {year} 年 {month} 月")
+            self.parsed_path(state_dir, year, month).unlink(missing_ok=True)
+        
+        if not changed and not removed:
+            print("沒有新增或變動的月份，沿用既有結果")
+            return daily_data, station_stats
+        
+        # 解析變動月份並寫入暫存
+        for (filepath, year, month), parsed in zip(changed, self.read_months(changed)):
+            self.write_parquet(parsed, self.parsed_path(state_dir, year, month), kind='hourly')
+        
+        # 依年度將受影響月份分組，每組一個邊界視窗：前一個月至最後變動月份，另加一個月前瞻
+        # 視窗不跨年度（一月的前一個月屬於前一年，另成視窗），與 iter_yearly_data 同樣逐年決定測站，
+        # 只在某年度才有資料的測站不會在另一年度產生日資料
+        affected = sorted({(year, month) for _, year, month in changed} | set(removed))
+        segments = []
+        for year in sorted({year for year, _ in affected}):
+            year_months = [pd.Timestamp(y, m, 1) for y, m in affected if y == year]
+            window_start = max(start, min(year_months) - pd.DateOffset(months=1))
+            window_end = min(end, max(year_months) + pd.offsets.MonthEnd(0))
+            if window_start <= window_end:
+                segments.extend((segment_start, segment_end) for _, segment_start, segment_end
+                                in self.yearly_ranges(window_start, window_end))
+        windows = []
+        for emit_start, emit_end in sorted(segments):
+            # 同年度相鄰或重疊的視窗合併
+            if windows and windows[-1][0].year == emit_start.year and emit_start <= windows[-1][1] + pd.Timedelta(days=1):
+                emit_start, previous_end, _ = windows.pop()
+                emit_end = max(emit_end, previous_end)
+            windows.append((emit_start, emit_end, emit_end + pd.offsets.MonthEnd(1)))
+        
+        affected_stations = set()
+        for emit_start, emit_end, lookahead_end in windows:
+            print(f"重新處理 {emit_start:%Y-%m-%d} 至 {emit_end:%Y-%m-%d}（前瞻至 {lookahead_end:%Y-%m-%d}）")
+            frames = []
+            for period in pd.period_range(emit_start, lookahead_end, freq='M'):
+                parsed = self.load_parsed_month(state_dir, data_folder, period.year, period.month)
+                if parsed is not None and len(parsed) > 0:
+                    frames.append(parsed)
+            
+            if len(daily_data) > 0:
+                window_rows = daily_data['date'].between(emit_start, emit_end)
+                affected_stations.update(daily_data.loc[window_rows, 'stno'].unique())
+                daily_data = daily_data[~window_rows]
+            if not frames:
+                continue
+            
+            hourly_data = self.resolve_hourly(pd.concat(frames, ignore_index=True), emit_start, emit_end, lookahead_end)
+            for (year, month), month_data in hourly_data.groupby(['year', 'month'], sort=True):
+                self.write_parquet(month_data, state_dir / 'hourly' / f"{year}{month:02d}.parquet", kind='hourly')
+            
+            daily_window = self.create_daily_data(hourly_data, emit_start, emit_end)
+            affected_stations.update(daily_window['stno'].unique())
+            daily_data = pd.concat([daily_data, daily_window], ignore_index=True)
+        
+        daily_data = self.fill_missing_station_days(daily_data, start, end)
+        
+        # 只重算受影響測站在受影響年度的統計
+        periods = [(label, period_start, period_end)
+                   for label, period_start, period_end in self.yearly_periods(start, end)
+                   if any(emit_start <= period_end and period_start <= emit_end for emit_start, emit_end, _ in windows)]
+        print(f"重新計算 {len(affected_stations)} 個測站、{len(periods)} 個期間的統計資料")
+        if len(station_stats) > 0:
+            stale = station_stats['stno'].isin(affected_stations) & station_stats['期間'].isin([label for label, _, _ in periods])
+            station_stats = station_stats[~stale]
+        refreshed = self.calculate_period_statistics(daily_data[daily_data['stno'].isin(affected_stations)], periods)
+        station_stats = pd.concat([station_stats, refreshed], ignore_index=True)
+        station_stats = station_stats.sort_values(['期間', 'stno'], kind='stable').reset_index(drop=True)
+        
+        self.write_parquet(daily_data, daily_path, kind='daily')
+        self.write_parquet(station_stats, stats_path)
+        
+        # 輸出寫入完成後才更新清單，中斷時下次會重新處理這些月份
+        self.save_manifest(state_dir, {
+            'range': study_range,
+            'files': {filepath.name: {'sha256': checksums[filepath.name], 'year': year, 'month': month}
+                      for filepath, year, month in files},
+        })
+        return daily_data, station_stats
+    
     def final_cleaning(self, df):
         """最終資料清理"""
         df.loc[df['TX01'] < -30, 'TX01'] = np.nan
@@ -321,283 +672,399 @@ class WeatherDataProcessor:
         df = df.sort_values(['stno', 'datetime']).reset_index(drop=True)
         return df
     
-    def create_daily_data(self, hourly_df):
-        """將小時資料聚合為日資料"""
-        daily_data = []
-        stations = hourly_df['stno'].unique()
+    def create_daily_data(self, hourly_df, start=None, end=None):
+        """
+        將小時資料聚合為日資料（以 (stno, date) 單次分組聚合）
+        - 降雨量：只有當全部小時都是NA時，該日才為NA
+        - 溫度：有效值的平均
+        - 未指定 start/end 時，日期範圍為資料的最早日至最晚日；無資料的日期視為24小時缺測
+        """
+        dates = hourly_df['datetime'].dt.normalize()
+        if start is None:
+            start = dates.min()
+        if end is None:
+            end = dates.max()
+        days = pd.date_range(start, end, freq='D')
+        station_codes, stations = pd.factorize(hourly_df['stno'])
         
-        for station in stations:
-            station_hourly = hourly_df[hourly_df['stno'] == station]
-            
-            start_date = datetime(2023, 1, 1)
-            for day_offset in range(365):
-                current_date = start_date + timedelta(days=day_offset)
-                year, month, day = current_date.year, current_date.month, current_date.day
-                
-                day_data = station_hourly[
-                    (station_hourly['year'] == year) &
-                    (station_hourly['month'] == month) &
-                    (station_hourly['day'] == day)
-                ]
-                
-                if len(day_data) > 0:
-                    # 降雨量聚合邏輯：只有當全部24小時都是NA時，該日才為NA
-                    rainfall_values = day_data['PP01']
-                    valid_rainfall = rainfall_values.dropna()
-                    
-                    if len(valid_rainfall) > 0:
-                        # 有任何有效數據（包括0），該日就有數值
-                        daily_rainfall = valid_rainfall.sum()
-                    else:
-                        # 全部24小時都是NA
-                        daily_rainfall = np.nan
-                    
-                    # 溫度(計算有效值的平均)
-                    temp_values = day_data['TX01'].dropna()
-                    daily_temp = temp_values.mean() if len(temp_values) > 0 else np.nan
-                    
-                    valid_rainfall_count = len(valid_rainfall)
-                    missing_rainfall_count = len(rainfall_values) - valid_rainfall_count
-                else:
-                    daily_rainfall = np.nan
-                    daily_temp = np.nan
-                    valid_rainfall_count = 0
-                    missing_rainfall_count = 24
-                
-                daily_data.append({
-                    'stno': station,
-                    'year': year,
-                    'month': month,
-                    'day': day,
-                    'PP01': daily_rainfall,
-                    'TX01': daily_temp,
-                    'valid_hours_rainfall': valid_rainfall_count,
-                    'missing_hours_rainfall': missing_rainfall_count,
-                    'total_hours': 24
-                })
-        
-        daily_df = pd.DataFrame(daily_data)
-        daily_df['date'] = pd.to_datetime(daily_df[['year', 'month', 'day']])
+        # 群組編號 = 測站 × 日數 + 日序，輸出順序即為測站、日期
+        day_codes = ((dates - days[0]) // pd.Timedelta(days=1)).to_numpy()
+        in_range = (day_codes >= 0) & (day_codes < len(days))
+        codes = (station_codes * len(days) + day_codes)[in_range]
+        n_groups = len(stations) * len(days)
+        
+        rainfall = hourly_df['PP01'].to_numpy(dtype=float)[in_range]
+        temperature = hourly_df['TX01'].to_numpy(dtype=float)[in_range]
+        
+        hours = np.bincount(codes, minlength=n_groups)
+        rainfall_sum, valid_rainfall = self.group_sums(rainfall, codes, n_groups, sequential=True)
+        temp_sum, valid_temp = self.group_sums(temperature, codes, n_groups)
+        
+        with np.errstate(invalid='ignore', divide='ignore'):
+            daily_df = pd.DataFrame({
+                'stno': np.repeat(stations, len(days)),
+                'year': np.tile(days.year.to_numpy(dtype=int), len(stations)),
+                'month': np.tile(days.month.to_numpy(dtype=int), len(stations)),
+                'day': np.tile(days.day.to_numpy(dtype=int), len(stations)),
+                'PP01': np.where(valid_rainfall > 0, rainfall_sum, np.nan),
+                'TX01': np.where(valid_temp > 0, temp_sum / valid_temp, np.nan),
+                'valid_hours_rainfall': valid_rainfall,
+                # 無任何小時資料的日期以24小時缺測計
+                'missing_hours_rainfall': np.where(hours > 0, hours - valid_rainfall, 24),
+                'total_hours': 24,
+                'date': np.tile(days, len(stations)),
+            })
         return daily_df
     
+    def fill_missing_station_days(self, daily_df, start, end):
+        """
+        逐年補齊各測站的日資料：該年度有資料的測站，缺少的日期以24小時缺測補上
+        - 與逐年 create_daily_data 的結果相同（無小時資料的日期即為24小時缺測）
+        """
+        columns = ['stno', 'year', 'month', 'day', 'PP01', 'TX01', 'valid_hours_rainfall',
+                   'missing_hours_rainfall', 'total_hours', 'date']
+        frames = []
+        for _, year_start, year_end in self.yearly_ranges(start, end):
+            year_data = daily_df[daily_df['date'].between(year_start, year_end)]
+            if len(year_data) == 0:
+                continue
+            days = pd.date_range(year_start, year_end, freq='D')
+            full_index = pd.MultiIndex.from_product([np.sort(year_data['stno'].unique()), days],
+                                                    names=['stno', 'date'])
+            filled = year_data.set_index(['stno', 'date']).reindex(full_index).reset_index()
+            missing = filled['total_hours'].isna()
+            filled.loc[missing, 'valid_hours_rainfall'] = 0
+            filled.loc[missing, ['missing_hours_rainfall', 'total_hours']] = 24
+            filled['year'] = filled['date'].dt.year
+            filled['month'] = filled['date'].dt.month
+            filled['day'] = filled['date'].dt.day
+            frames.append(filled[columns])
+        
+        if not frames:
+            return pd.DataFrame(columns=columns)
+        filled = pd.concat(frames, ignore_index=True)
+        for column in ['year', 'month', 'day', 'valid_hours_rainfall', 'missing_hours_rainfall', 'total_hours']:
+            filled[column] = filled[column].astype(int)
+        return filled.sort_values(['stno', 'date'], kind='stable').reset_index(drop=True)
+    
+    def group_sums(self, values, codes, n_groups, sequential=False):
+        """
+        依群組加總非NA值，回傳 (加總, 有效筆數)
+        - 加總順序與逐日 Series.sum() 相同，確保輸出與原逐日迴圈逐位元一致
+        - sequential=True：逐項累加（降雨量沿用原 object 欄位的逐項加總）
+        - sequential=False：NumPy 成對加總（float 欄位的加總方式）
+        """
+        valid = ~np.isnan(values)
+        order = np.argsort(codes[valid], kind='stable')
+        values = values[valid][order]
+        counts = np.bincount(codes[valid], minlength=n_groups)
+        starts = np.cumsum(counts) - counts
+        
+        # 相同筆數的群組排成矩陣一次加總
+        sums = np.zeros(n_groups)
+        for count in np.unique(counts[counts > 0]):
+            groups = np.flatnonzero(counts == count)
+            block = values[starts[groups][:, None] + np.arange(count)]
+            sums[groups] = np.cumsum(block, axis=1)[:, -1] if sequential else block.sum(axis=1)
+        
+        return sums, counts
+    
     def calculate_station_statistics(self, daily_df):
-        """計算各測站統計指標"""
-        results = []
+        """
+        計算各測站統計指標（期望天數為資料的日期範圍天數）
+        - 全部測站一次分組計算：加總與平均以 group_sums 依測站分組，與逐站 Series.sum()/mean() 結果相同
+        - 連續日數以 run_lengths 的行程長度編碼計算
+        """
+        expected_days = daily_df['date'].nunique()
+        station_codes, stations = pd.factorize(daily_df['stno'])
+        n_stations = len(stations)
         
-        for stno in daily_df['stno'].unique():
-            station_data = daily_df[daily_df['stno'] == stno].copy()
-            station_data = station_data.sort_values('date')
-            
-            stats = {'stno': stno}
-            
-            if len(station_data) != 365:
-                print(f"提醒：測站 {stno} 資料不完整，只有 {len(station_data)} 天")
-            
-            # 降雨統計
-            rainfall = station_data['PP01']
-            valid_rainfall = rainfall.dropna()
-            na_count = rainfall.isna().sum()
-            valid_count = len(valid_rainfall)
-            
-            # 降雨日數分類
-            small_rain_days = ((valid_rainfall >= 0) & (valid_rainfall < 10)).sum()  # 0 ≤ 降雨量 < 10mm
-            medium_rain_days = ((valid_rainfall >= 10) & (valid_rainfall <= 80)).sum()  # 10mm ≤ 降雨量 ≤ 80mm
-            heavy_rain_days = (valid_rainfall > 80).sum()  # 降雨量 > 80mm
-            
+        # 依測站、日期排序，各測站內的順序與逐站 sort_values('date') 相同
+        order = np.lexsort((daily_df['date'].to_numpy(), station_codes))
+        codes = station_codes[order]
+        rainfall = daily_df['PP01'].to_numpy(dtype=float)[order]
+        temperature = daily_df['TX01'].to_numpy(dtype=float)[order]
+        month = daily_df['month'].to_numpy()[order]
+        
+        def count(mask):
+            return np.bincount(codes[mask], minlength=n_stations)
+        
+        def sums(values, mask):
+            return self.group_sums(np.where(mask, values, np.nan), codes, n_stations)
+        
+        total_days = np.bincount(codes, minlength=n_stations)
+        rain_valid = ~np.isnan(rainfall)
+        temp_valid = ~np.isnan(temperature)
+        
+        # 降雨日數分類
+        na_count = count(~rain_valid)
+        small_rain_days = count((rainfall >= 0) & (rainfall < 10))  # 0 ≤ 降雨量 < 10mm
+        medium_rain_days = count((rainfall >= 10) & (rainfall <= 80))  # 10mm ≤ 降雨量 ≤ 80mm
+        heavy_rain_days = count(rainfall > 80)  # 降雨量 > 80mm
+        total_classified = small_rain_days + medium_rain_days + heavy_rain_days + na_count
+        
+        for stno, days, classified in zip(stations, total_days, total_classified):
+            if days != expected_days:
+                print(f"提醒：測站 {stno} 資料不完整，只有 {days} 天")
             # 驗證分類完整性
-            total_classified = small_rain_days + medium_rain_days + heavy_rain_days + na_count
-            if total_classified != 365:
-                print(f"提醒：測站 {stno} 降雨分類天數不等於365天: {total_classified}")
-            
-            stats['小雨日數'] = small_rain_days
-            stats['中雨日數'] = medium_rain_days 
-            stats['大雨日數'] = heavy_rain_days
-            stats['缺測日數'] = na_count
-            stats['總天數'] = total_classified
-            
-            # 年平均降雨量：分母為有效日數，不是365
-            stats['年平均降雨量'] = valid_rainfall.mean() if valid_count > 0 else np.nan
-            
-            # 有降雨之年平均降雨量
-            rainy_days = valid_rainfall[valid_rainfall > 0]
-            stats['有降雨之年平均降雨量'] = rainy_days.mean() if len(rainy_days) > 0 else np.nan
+            if classified != expected_days:
+                print(f"提醒：測站 {stno} 降雨分類天數不等於{expected_days}天: {classified}")
+        
+        with np.errstate(invalid='ignore', divide='ignore'):
+            # 年平均降雨量：分母為有效日數，不是期間天數
+            rain_sum, valid_count = sums(rainfall, rain_valid)
+            rainy_sum, rainy_count = sums(rainfall, rainfall > 0)
             
-            # 1-5月統計（排除NA）
-            jan_may = station_data[station_data['month'].isin([1,2,3,4,5])]
-            if len(jan_may) > 0:
-                jan_may_valid = jan_may['PP01'].dropna()
-                
-                # 最長濕潤日數 (降雨>0，NA不計入連續)
-                wet_series = (jan_may['PP01'] > 0).astype(int)
-                wet_series[jan_may['PP01'].isna()] = -1  # NA標記為-1
-                stats['1-5月最長濕潤日數'] = self.longest_consecutive_exclude_na(wet_series)
-                
-                # 最長乾燥日數 (降雨<5mm，NA不計入連續)
-                dry_series = (jan_may['PP01'] < 5).astype(int)
-                dry_series[jan_may['PP01'].isna()] = -1  # NA標記為-1
-                stats['1-5月最長乾燥日數'] = self.longest_consecutive_exclude_na(dry_series)
-            else:
-                stats['1-5月最長濕潤日數'] = np.nan
-                stats['1-5月最長乾燥日數'] = np.nan
+            # 1-5月統計：最長濕潤日數（降雨>0）與最長乾燥日數（降雨<5mm），NA不計入連續
+            jan_may = np.isin(month, [1, 2, 3, 4, 5])
+            has_jan_may = count(jan_may) > 0
+            wet_groups, wet_lengths = self.run_lengths((rainfall > 0)[jan_may], codes[jan_may])
+            dry_groups, dry_lengths = self.run_lengths((rainfall < 5)[jan_may], codes[jan_may])
             
             # 6-11月統計
-            jun_nov = station_data[station_data['month'].isin([6,7,8,9,10,11])]
-            if len(jun_nov) > 0:
-                jun_nov_valid = jun_nov['PP01'].dropna()
-                stats['6-11月總降雨量'] = jun_nov_valid.sum() if len(jun_nov_valid) > 0 else np.nan
-                stats['6-11月總降雨日數'] = (jun_nov_valid > 0).sum()
-                stats['6-11月暴雨日數'] = (jun_nov_valid > 200).sum()
-            else:
-                stats['6-11月總降雨量'] = np.nan
-                stats['6-11月總降雨日數'] = np.nan
-                stats['6-11月暴雨日數'] = np.nan
-            
-            # 溫度相關統計
-            temperature = station_data['TX01'].dropna()
+            jun_nov = np.isin(month, [6, 7, 8, 9, 10, 11])
+            has_jun_nov = count(jun_nov) > 0
+            jun_nov_sum, jun_nov_valid = sums(rainfall, jun_nov & rain_valid)
             
-            if len(temperature) > 0:
-                # 累積溫度
-                high_temp = temperature[temperature > 17]
-                stats['累積溫度'] = (high_temp - 17).sum() if len(high_temp) > 0 else 0
-                
-                # 溫度累積效果
-                optimal_temp_days = ((temperature >= 27) & (temperature <= 33)).sum()
-                stats['溫度累積效果'] = optimal_temp_days
-                
-                # 溫度連續效果
-                optimal_temp_series = ((temperature >= 27) & (temperature <= 33)).astype(int)
-                consecutive_days = self.get_all_consecutive_lengths(optimal_temp_series)
-                
-                if consecutive_days:
-                    stats['溫度平均連續效果'] = np.mean(consecutive_days)
-                    stats['溫度最大連續效果'] = max(consecutive_days)
-                else:
-                    stats['溫度平均連續效果'] = 0
-                    stats['溫度最大連續效果'] = 0
-                
-                # 週均溫>18°C的週數
-                weekly_temp = temperature.groupby(temperature.index // 7).mean()
-                stats['週均溫大於18度之週數'] = (weekly_temp > 18).sum()
-            else:
-                stats['累積溫度'] = np.nan
-                stats['溫度累積效果'] = np.nan
-                stats['溫度平均連續效果'] = np.nan
-                stats['溫度最大連續效果'] = np.nan
-                stats['週均溫大於18度之週數'] = np.nan
+            # 溫度相關統計（只看有效溫度日，NA不中斷連續）
+            temp_count = count(temp_valid)
+            has_temp = temp_count > 0
+            high_temp_sum, high_temp_count = sums(temperature - 17, temperature > 17)
+            optimal = (temperature >= 27) & (temperature <= 33)
+            run_groups, lengths = self.run_lengths(optimal[temp_valid], codes[temp_valid])
+            run_count = np.bincount(run_groups, minlength=n_stations)
+            run_total = np.bincount(run_groups, weights=lengths, minlength=n_stations)
             
-            stats['總日數'] = len(station_data)
-            stats['有效降雨日數'] = valid_count
-            stats['有效溫度日數'] = station_data['TX01'].notna().sum()
+            # 週均溫>18°C的週數：依日期分為日曆週（週一至週日），與資料列索引及缺測日無關
+            weekly_temp = daily_df.groupby(['stno', pd.Grouper(key='date', freq='W-SUN')])['TX01'].mean()
+            warm_weeks = (weekly_temp > 18).groupby(level='stno').sum().reindex(stations, fill_value=0).to_numpy()
             
-            results.append(stats)
-        
-        return pd.DataFrame(results)
-    
-    def longest_consecutive_exclude_na(self, binary_series):
-        """計算最長連續1的長度，排除-1（NA）"""
-        if len(binary_series) == 0:
-            return 0
-        
-        max_length = 0
-        current_length = 0
+            station_stats = pd.DataFrame({
+                'stno': stations,
+                '小雨日數': small_rain_days,
+                '中雨日數': medium_rain_days,
+                '大雨日數': heavy_rain_days,
+                '缺測日數': na_count,
+                '總天數': total_classified,
+                '年平均降雨量': np.where(valid_count > 0, rain_sum / valid_count, np.nan),
+                '有降雨之年平均降雨量': np.where(rainy_count > 0, rainy_sum / rainy_count, np.nan),
+                '1-5月最長濕潤日數': np.where(has_jan_may, self.longest_runs(wet_groups, wet_lengths, n_stations), np.nan),
+                '1-5月最長乾燥日數': np.where(has_jan_may, self.longest_runs(dry_groups, dry_lengths, n_stations), np.nan),
+                '6-11月總降雨量': np.where(jun_nov_valid > 0, jun_nov_sum, np.nan),
+                '6-11月總降雨日數': np.where(has_jun_nov, count(jun_nov & (rainfall > 0)), np.nan),
+                '6-11月暴雨日數': np.where(has_jun_nov, count(jun_nov & (rainfall > 200)), np.nan),
+                '累積溫度': np.where(has_temp, np.where(high_temp_count > 0, high_temp_sum, 0), np.nan),
+                '溫度累積效果': np.where(has_temp, count(optimal), np.nan),
+                '溫度平均連續效果': np.where(has_temp, np.where(run_count > 0, run_total / run_count, 0), np.nan),
+                '溫度最大連續效果': np.where(has_temp, self.longest_runs(run_groups, lengths, n_stations), np.nan),
+                '週均溫大於18度之週數': np.where(has_temp, warm_weeks, np.nan),
+                '總日數': total_days,
+                '有效降雨日數': valid_count,
+                '有效溫度日數': temp_count,
+            })
         
-        for value in binary_series:
-            if value == 1:
-                current_length += 1
-                max_length = max(max_length, current_length)
-            elif value == -1:
-                # 遇到NA，重置連續計算
-                current_length = 0
-            else:  # value == 0
-                current_length = 0
+        # 日數欄位在沒有缺值時維持整數
+        count_columns = ['1-5月最長濕潤日數', '1-5月最長乾燥日數', '6-11月總降雨日數', '6-11月暴雨日數',
+                         '溫度累積效果', '溫度最大連續效果', '週均溫大於18度之週數']
+        for column in count_columns:
+            if station_stats[column].notna().all():
+                station_stats[column] = station_stats[column].astype(int)
         
-        return max_length
+        return station_stats
     
-    def get_all_consecutive_lengths(self, binary_series):
-        """取得所有連續1的長度列表"""
-        if len(binary_series) == 0:
-            return []
-        
-        lengths = []
-        current_length = 0
+    def run_lengths(self, condition, groups):
+        """
+        行程長度編碼：回傳各段連續成立（True）的 (所屬群組, 長度)
+        - 以 diff 找出區段起點（條件由不成立轉為成立，或群組改變），cumsum 編號後以 bincount 計長度
+        - 條件不成立（含 NA）即中斷連續
+        """
+        condition = np.asarray(condition, dtype=bool)
+        groups = np.asarray(groups)
+        if len(condition) == 0:
+            return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
         
-        for value in binary_series:
-            if value == 1:
-                current_length += 1
-            else:
-                if current_length > 0:
-                    lengths.append(current_length)
-                current_length = 0
-        
-        if current_length > 0:
-            lengths.append(current_length)
+        new_group = np.r_[True, np.diff(groups) != 0]
+        rising = np.diff(condition.astype(np.int8), prepend=0) == 1
+        starts = condition & (rising | new_group)
+        run_id = np.cumsum(starts) - 1
+        lengths = np.bincount(run_id[condition], minlength=int(starts.sum()))
+        return groups[starts], lengths
+    
+    def longest_runs(self, run_groups, lengths, n_groups):
+        """各群組最長的連續長度，沒有任何區段者為 0"""
+        longest = np.zeros(n_groups, dtype=int)
+        np.maximum.at(longest, run_groups, lengths)
+        return longest
+    
+    def calculate_period_statistics(self, daily_df, periods):
+        """
+        依期間分別計算各測站統計指標，periods 為 [(名稱, 起日, 迄日)]
+        - 輸出加上「期間」欄位，可搭配 yearly_periods 或 rolling_periods 使用
+        """
+        results = []
+        for label, start, end in periods:
+            period_data = daily_df[daily_df['date'].between(pd.Timestamp(start), pd.Timestamp(end))]
+            if len(period_data) == 0:
+                continue
+            stats = self.calculate_station_statistics(period_data)
+            stats.insert(1, '期間', label)
+            results.append(stats)
         
-        return lengths
-
-def main():
-    processor = WeatherDataProcessor()
+        return pd.concat(results, ignore_index=True) if results else pd.DataFrame()
     
-    data_folder = "/Users/ylin/Documents/vivian_lab/20239999_auto_hr"
+    def yearly_periods(self, start, end):
+        """日期範圍內的各年度期間"""
+        return [(str(year), year_start, year_end)
+                for year, year_start, year_end in self.yearly_ranges(start, end)]
     
-    print("開始處理氣象資料")
+    def rolling_periods(self, start, end, window_months=12, step_months=1):
+        """
+        日期範圍內的滾動期間：每 step_months 個月起算一個 window_months 個月的期間
+        - 只保留完整落在範圍內的期間
+        """
+        start = pd.Timestamp(start).normalize()
+        end = pd.Timestamp(end).normalize()
+        periods = []
+        window_start = start
+        while True:
+            window_end = window_start + pd.DateOffset(months=window_months) - pd.Timedelta(days=1)
+            if window_end > end:
+                break
+            periods.append((f"{window_start:%Y-%m-%d}~{window_end:%Y-%m-%d}", window_start, window_end))
+            window_start = window_start + pd.DateOffset(months=step_months)
+        return periods
+
+# 研究期間
+STUDY_START = '2023-05-01'
+STUDY_END = '2024-12-31'
+# 增量處理的清單與中間結果資料夾
+STATE_DIR = 'climate_state'
+# 平行讀取月檔的預設行程數上限
+MAX_WORKERS = 12
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="中央氣象署逐時資料整理與測站氣候統計")
+    parser.add_argument('--data-folder', default="/Users/ylin/Documents/vivian_lab/20239999_auto_hr",
+                        help="月檔（{年}{月}99.auto_hr.txt）所在資料夾")
+    parser.add_argument('--incremental', action='store_true',
+                        help="增量處理：只解析新增或變動的月份，沿用既有的日資料與統計")
+    parser.add_argument('--state-dir', default=STATE_DIR,
+                        help="增量處理的清單與中間結果資料夾")
+    parser.add_argument('--output-format', choices=['parquet', 'csv', 'both'], default='parquet',
+                        help="輸出格式：Parquet（小時資料依測站／年度分割）、CSV 或兩者")
+    parser.add_argument('--start', default=STUDY_START,
+                        help="研究期間起日（YYYY-MM-DD）")
+    parser.add_argument('--end', default=STUDY_END,
+                        help="研究期間迄日（YYYY-MM-DD）")
+    parser.add_argument('--workers', type=int, default=None,
+                        help=f"平行讀取月檔的行程數，1 表示依序讀取，預設為 min({MAX_WORKERS}, CPU 核心數)")
+    return parser.parse_args()
+
+def write_outputs(processor, daily_data, station_stats, output_format):
+    """依輸出格式寫出日資料與測站統計"""
+    if output_format in ('parquet', 'both'):
+        processor.write_parquet(daily_data, 'daily_weather_data.parquet', kind='daily')
+        processor.write_parquet(station_stats, 'station_climate_statistics.parquet')
+    if output_format in ('csv', 'both'):
+        daily_data.to_csv('daily_weather_data.csv', index=False, encoding='utf-8-sig')
+        station_stats.to_csv('station_climate_statistics.csv', index=False, encoding='utf-8-sig')
+
+def main():
+    args = parse_args()
+    workers = args.workers if args.workers is not None else min(MAX_WORKERS, os.cpu_count() or 1)
+    processor = WeatherDataProcessor(workers=max(1, workers))
     
-    # 1.處理所有月份資料
-    hourly_data = processor.process_all_months(data_folder)
-    print(f"總共處理 {len(hourly_data)} 筆小時資料")
+    data_folder = args.data_folder
+    start, end = args.start, args.end
     
-    # 驗證時間格式和完整性
-    print(f"小時範圍: {hourly_data['hour'].min()} - {hourly_data['hour'].max()}")
+    if args.incremental:
+        print(f"增量處理氣象資料（{start} 至 {end}）")
+        daily_data, station_stats = processor.process_incremental(data_folder, start, end,
+                                                                  args.state_dir)
+        write_outputs(processor, daily_data, station_stats, args.output_format)
+        print(f"處理完成：{len(daily_data)} 筆日資料、{len(station_stats)} 筆測站統計"
+              f"（小時資料位於 {Path(args.state_dir) / 'hourly'}）")
+        return daily_data, station_stats
     
-    station_hour_counts = hourly_data.groupby('stno').size()
-    print(f"各測站小時資料統計:")
-    print(f"實際小時數範圍: {station_hour_counts.min()} - {station_hour_counts.max()}")
+    print(f"開始處理氣象資料（{start} 至 {end}）")
     
-    incomplete_stations = station_hour_counts[station_hour_counts != 8760]
-    if len(incomplete_stations) > 0:
-        print(f"發現 {len(incomplete_stations)} 個測站資料不完整:")
-        for stno, count in incomplete_stations.items():
-            print(f"測站 {stno}: {count} 小時 (缺少 {8760-count} 小時)")
-    else:
-        print(f"所有 {len(station_hour_counts)} 個測站都有完整的8760小時資料")
+    # 1. 逐年處理小時資料並轉換為日資料，小時資料逐年寫出，不同時保留多個年度
+    daily_frames = []
+    hourly_path = 'hourly_weather_data.csv'
+    hourly_dataset = 'hourly_weather_data'
+    first_year = True
+    for year, year_start, year_end, hourly_data in processor.iter_yearly_data(data_folder, start, end):
+        print(f"{year} 年共處理 {len(hourly_data)} 筆小時資料")
+        
+        # 驗證時間格式和完整性
+        print(f"小時範圍: {hourly_data['hour'].min()} - {hourly_data['hour'].max()}")
+        
+        expected_hours = ((year_end - year_start).days + 1) * 24
+        station_hour_counts = hourly_data.groupby('stno').size()
+        print(f"各測站小時資料統計:")
+        print(f"實際小時數範圍: {station_hour_counts.min()} - {station_hour_counts.max()}")
+        
+        incomplete_stations = station_hour_counts[station_hour_counts != expected_hours]
+        if len(incomplete_stations) > 0:
+            print(f"發現 {len(incomplete_stations)} 個測站資料不完整:")
+            for stno, count in incomplete_stations.items():
+                print(f"測站 {stno}: {count} 小時 (缺少 {expected_hours-count} 小時)")
+        else:
+            print(f"所有 {len(station_hour_counts)} 個測站都有完整的{expected_hours}小時資料")
+        
+        # 檢查降雨量範圍
+        max_rainfall = hourly_data['PP01'].max()
+        print(f"降雨量範圍檢查: 最大值 = {max_rainfall} mm/hr")
+        if max_rainfall > 220:
+            print("仍有降雨量超過220mm/hr的資料")
+        
+        if args.output_format in ('parquet', 'both'):
+            processor.write_parquet(hourly_data, hourly_dataset, kind='hourly', partition_cols=['stno', 'year'])
+        if args.output_format in ('csv', 'both'):
+            hourly_data.to_csv(hourly_path, index=False, encoding='utf-8-sig' if first_year else 'utf-8',
+                               mode='w' if first_year else 'a', header=first_year)
+        first_year = False
+        
+        # 2. 轉換為日資料
+        daily_year = processor.create_daily_data(hourly_data, year_start, year_end)
+        print(f"{year} 年轉換為 {len(daily_year)} 筆日資料")
+        daily_frames.append(daily_year)
+        del hourly_data
     
-    # 檢查降雨量範圍
-    rainfall_values = pd.to_numeric(hourly_data['PP01'], errors='coerce')
-    max_rainfall = rainfall_values.max()
-    print(f"降雨量範圍檢查: 最大值 = {max_rainfall} mm/hr")
-    if max_rainfall > 220:
-        print("仍有降雨量超過220mm/hr的資料")
+    if not daily_frames:
+        print("研究期間內沒有任何資料")
+        return pd.DataFrame(), pd.DataFrame()
     
-    # 2. 轉換為日資料
-    daily_data = processor.create_daily_data(hourly_data)
-    print(f"轉換為 {len(daily_data)} 筆日資料")
+    daily_data = pd.concat(daily_frames, ignore_index=True)
+    daily_data = daily_data.sort_values(['stno', 'date'], kind='stable').reset_index(drop=True)
     
     # 驗證日資料完整性
+    expected_days = (pd.Timestamp(end) - pd.Timestamp(start)).days + 1
     station_day_counts = daily_data.groupby('stno').size()
-    print(f"期望每站天數: 365天")
+    print(f"期望每站天數: {expected_days}天")
     print(f"實際天數範圍: {station_day_counts.min()} - {station_day_counts.max()}")
     
-    incomplete_daily_stations = station_day_counts[station_day_counts != 365]
+    incomplete_daily_stations = station_day_counts[station_day_counts != expected_days]
     if len(incomplete_daily_stations) > 0:
         print(f"發現 {len(incomplete_daily_stations)} 個測站日資料不完整:")
         for stno, count in incomplete_daily_stations.items():
             print(f"測站 {stno}: {count} 天")
     else:
-        print(f"所有 {len(station_day_counts)} 個測站都有完整的365天資料")
+        print(f"所有 {len(station_day_counts)} 個測站都有完整的{expected_days}天資料")
     
-    # 3. 計算各測站統計指標
-    station_stats = processor.calculate_station_statistics(daily_data)
-    print(f"計算完成 {len(station_stats)} 個測站的統計資料")
+    # 3. 逐年計算各測站統計指標（滾動期間可改用 processor.rolling_periods）
+    periods = processor.yearly_periods(start, end)
+    station_stats = processor.calculate_period_statistics(daily_data, periods)
+    print(f"計算完成 {station_stats['stno'].nunique()} 個測站、{len(periods)} 個期間的統計資料")
     
-
+    period_days = {label: (period_end - period_start).days + 1 for label, period_start, period_end in periods}
     print(f"\n降雨天數統計驗證:")
     for idx, row in station_stats.iterrows():
         total_days = row['小雨日數'] + row['中雨日數'] + row['大雨日數'] + row['缺測日數']
-        if total_days != 365:
-            print(f"測站 {row['stno']}: 總天數 = {total_days} (小雨:{row['小雨日數']}, 中雨:{row['中雨日數']}, 大雨:{row['大雨日數']}, 缺測:{row['缺測日數']})")
+        if total_days != period_days[row['期間']]:
+            print(f"測站 {row['stno']} ({row['期間']}): 總天數 = {total_days} (小雨:{row['小雨日數']}, 中雨:{row['中雨日數']}, 大雨:{row['大雨日數']}, 缺測:{row['缺測日數']})")
     
-    hourly_data.to_csv('hourly_weather_data.csv', index=False, encoding='utf-8-sig')
-    daily_data.to_csv('daily_weather_data.csv', index=False, encoding='utf-8-sig')
-    station_stats.to_csv('station_climate_statistics.csv', index=False, encoding='utf-8-sig')
+    write_outputs(processor, daily_data, station_stats, args.output_format)
     
     print("處理完成")
     
@@ -611,28 +1078,15 @@ def main():
     
     print("\n數據品質統計:")
     print(f"平均每日有效小時數: {daily_data['valid_hours_rainfall'].mean():.1f}")
-    # # print(f"平均每日缺失小時數: {daily_data['missing_hours_
-    # print(f"平均每日缺失小時數: {daily_data['missing_hours_rainfall'].mean():.1f}")
-    # print(f"平均每日原始-9996小時數: {daily_data['raw_9996_hours'].mean():.1f}")
-    
-    # # 顯示-9996處理統計
-    # total_9996 = daily_data['raw_9996_hours'].sum()
-    # if total_9996 > 0:
-    #     print(f"總共處理了 {total_9996} 個-9996值")
     
     total_na_rainfall = daily_data['PP01'].isna().sum()
     print(f"總共有 {total_na_rainfall} 天的降雨量為NA")
 
-    total_expected_records = len(station_stats) * 365
+    total_expected_records = station_day_counts.size * expected_days
     actual_records = len(daily_data)
     print(f"資料完整性: {actual_records}/{total_expected_records} = {actual_records/total_expected_records*100:.1f}%")
     
-    # print("\n統計資料存至以下檔案:")
-    # print("- hourly_weather_data.csv: 完整小時資料")
-    # print("- daily_weather_data.csv: 日聚合資料") 
-    # print("- station_climate_statistics.csv: 測站氣候統計")
-    
-    return hourly_data, daily_data, station_stats
+    return daily_data, station_stats
 
 if __name__ == "__main__":
-    hourly_data, daily_data, station_stats = main()
\ No newline at end of file
+    daily_data, station_stats = main()
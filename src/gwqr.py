@@ -0,0 +1,680 @@
+import pandas as pd
+import numpy as np
+import time
+import argparse
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    from scipy.spatial import cKDTree
+    from scipy import sparse
+    from scipy.optimize import linprog
+except ImportError:  # GWQR 需要
+    cKDTree = None
+    sparse = None
+    linprog = None
+
+
+EARTH_RADIUS_KM = 6371.0088
+
+# GWQR 預設設定
+GWQR_TAU = 0.5
+GWQR_BANDWIDTH = 150              # 適應性頻寬為近鄰數，固定頻寬為公里
+GWQR_KERNEL = 'bisquare'          # 'bisquare' 或 'gaussian'
+GAUSSIAN_TRUNCATION = 3.0         # 固定頻寬高斯核只保留 3h 內的觀測
+GWQR_BATCH_SIZE = 1024            # 每批同時求解的位置數
+IRLS_MAX_ITER = 100
+IRLS_TOL = 1e-6                   # 係數變化相對於 y 尺度的收斂門檻
+IRLS_EPS = 1e-6                   # 殘差下限（相對於 y 尺度），避免權重發散
+RIDGE = 1e-8                      # 正規方程式對角線的微小正則化，避免近鄰共線時無法求解
+
+# 頻寬選擇設定
+SELECTION_TAUS = (0.25, 0.5, 0.75, 0.9)
+ADAPTIVE_RANGE = (30, 500)        # 適應性頻寬（近鄰數）搜尋範圍
+FIXED_RANGE = (0.2, 5.0)          # 固定頻寬（公里）搜尋範圍；高斯核上限除以截斷倍數，截斷半徑同為 5 公里
+GRID_SIZE = 8                     # 由粗到細搜尋每輪的候選數
+GRID_ROUNDS = 3
+
+
+def project_coordinates(lats, lngs, origin_lat=None):
+    """
+    經緯度轉為以公里為單位的平面座標（等距圓柱投影）
+    - 以資料的平均緯度為基準，台北市範圍內的距離誤差遠小於頻寬
+    """
+    lats = np.asarray(lats, dtype=float)
+    lngs = np.asarray(lngs, dtype=float)
+    if origin_lat is None:
+        origin_lat = np.nanmean(lats)
+    x = np.radians(lngs) * np.cos(np.radians(origin_lat)) * EARTH_RADIUS_KM
+    y = np.radians(lats) * EARTH_RADIUS_KM
+    return np.column_stack([x, y])
+
+
+class NeighborIndex:
+    """
+    訓練座標的 KD-tree 近鄰查詢
+    - 回傳依距離排序的 (距離, 索引) 陣列，供不同頻寬的核權重重複使用
+    """
+
+    def __init__(self, coords):
+        if cKDTree is None:
+            raise ImportError("GWQR 需要安裝 scipy")
+        self.coords = np.asarray(coords, dtype=float)
+        self.tree = cKDTree(self.coords)
+        self.size = len(self.coords)
+
+    def query(self, query_coords, k, exclude_self=False, query_indices=None):
+        """
+        查詢最近的 k 個觀測，回傳 (距離, 索引)，皆為 (n, k) 且依距離排序
+        - exclude_self=True：查詢點即訓練點時排除自身（留一交叉驗證）
+        - query_indices：查詢點對應的訓練點索引（只查詢部分訓練點時），預設為依序的全部訓練點
+        """
+        extra = 1 if exclude_self else 0
+        k = min(k + extra, self.size)
+        distances, indices = self.tree.query(query_coords, k=k)
+        distances = distances.reshape(len(query_coords), k)
+        indices = indices.reshape(len(query_coords), k)
+        if exclude_self:
+            # 自身不一定排在第一（重複座標），逐列移除等於自身索引者
+            if query_indices is None:
+                query_indices = np.arange(len(query_coords))
+            own = indices == np.asarray(query_indices)[:, None]
+            own[~own.any(axis=1), -1] = True
+            keep = ~own
+            distances = distances[keep].reshape(len(query_coords), k - 1)
+            indices = indices[keep].reshape(len(query_coords), k - 1)
+        return distances, indices
+
+    def query_radius(self, query_coords, radius, exclude_self=False, query_indices=None,
+                     chunk_size=GWQR_BATCH_SIZE):
+        """
+        查詢半徑內的所有觀測，回傳不等長的 (距離, 索引, 列指標)（CSR 格式，各列依索引排序）
+        - 分塊呼叫 query_ball_point，記憶體與半徑內的觀測總數成正比，不補齊為 (n, 最大近鄰數)
+        - exclude_self、query_indices 同 query
+        """
+        query_coords = np.asarray(query_coords, dtype=float)
+        if exclude_self and query_indices is None:
+            query_indices = np.arange(len(query_coords))
+        lengths, distances, indices = [np.zeros(0, dtype=np.int64)], [np.zeros(0)], [np.zeros(0, dtype=np.int64)]
+        for start in range(0, len(query_coords), chunk_size):
+            chunk = query_coords[start:start + chunk_size]
+            neighbors = self.tree.query_ball_point(chunk, r=radius, return_sorted=True)
+            chunk_lengths = np.array([len(row) for row in neighbors], dtype=np.int64)
+            chunk_indices = np.concatenate([np.zeros(0, dtype=np.int64)] + [np.asarray(row, dtype=np.int64)
+                                                                            for row in neighbors])
+            rows = np.repeat(np.arange(len(chunk)), chunk_lengths)
+            if exclude_self:
+                keep = chunk_indices != np.asarray(query_indices[start:start + chunk_size])[rows]
+                chunk_indices, rows = chunk_indices[keep], rows[keep]
+                chunk_lengths = np.bincount(rows, minlength=len(chunk))
+            lengths.append(chunk_lengths)
+            distances.append(np.linalg.norm(self.coords[chunk_indices] - chunk[rows], axis=1))
+            indices.append(chunk_indices)
+        indptr = np.concatenate([[0], np.cumsum(np.concatenate(lengths))]).astype(np.int64)
+        return np.concatenate(distances), np.concatenate(indices), indptr
+
+
+def truncation_radius(bandwidth, kernel=GWQR_KERNEL):
+    """固定頻寬的截斷半徑（公里）：雙平方核為 h，高斯核為 GAUSSIAN_TRUNCATION·h"""
+    return bandwidth * (GAUSSIAN_TRUNCATION if kernel == 'gaussian' else 1.0)
+
+
+def neighbors_for_bandwidth(index, query_coords, bandwidth, kernel=GWQR_KERNEL, adaptive=True,
+                            exclude_self=False):
+    """
+    依頻寬查詢近鄰，回傳 (距離, 索引, 列指標)
+    - 適應性頻寬：最近的 bandwidth 個，(n, k) 陣列依距離排序，列指標為 None
+    - 固定頻寬：截斷半徑內的所有觀測，不等長的 CSR 格式（見 NeighborIndex.query_radius）
+    """
+    if adaptive:
+        distances, indices = index.query(query_coords, int(bandwidth), exclude_self=exclude_self)
+        return distances, indices, None
+    return index.query_radius(query_coords, truncation_radius(bandwidth, kernel), exclude_self=exclude_self)
+
+
+def kernel_weights(distances, indices, bandwidth, n_obs, kernel=GWQR_KERNEL, adaptive=True, indptr=None):
+    """
+    由近鄰陣列建立截斷核權重稀疏矩陣（查詢點 × 觀測，CSR）
+    - adaptive=True：bandwidth 為近鄰數，各點頻寬 h_i 為第 bandwidth 個近鄰的距離，只用前 bandwidth 欄
+      （需為依距離排序的 (n, k) 陣列）
+    - adaptive=False：bandwidth 為公里，雙平方核截斷於 h，高斯核截斷於 GAUSSIAN_TRUNCATION·h；
+      indptr 指定時距離與索引為不等長的 CSR 格式（見 NeighborIndex.query_radius）
+    - 雙平方核 (1-(d/h)²)²，高斯核 exp(-(d/h)²/2)
+    - 近鄰陣列可來自較大的頻寬，不同候選頻寬可共用同一組查詢結果
+    """
+    if adaptive:
+        if indptr is not None:
+            raise ValueError("適應性頻寬需要依距離排序的 (n, k) 近鄰陣列")
+        k = min(int(bandwidth), distances.shape[1])
+        distances = distances[:, :k]
+        indices = indices[:, :k]
+        h = distances[:, -1:].copy()
+        # 近鄰全在同一座標時以極小頻寬代替，權重退化為等權
+        h[h <= 0] = np.finfo(float).eps
+    else:
+        h = float(bandwidth)
+
+    ratio = distances / h
+    if kernel == 'bisquare':
+        weights = np.where(ratio < 1, (1 - ratio ** 2) ** 2, 0.0)
+        if adaptive:
+            # 第 k 個近鄰恰在頻寬上（權重為 0），整列距離相同時改為等權
+            degenerate = weights.sum(axis=1) == 0
+            weights[degenerate] = 1.0
+    elif kernel == 'gaussian':
+        weights = np.exp(-0.5 * ratio ** 2)
+        if not adaptive:
+            weights[ratio > GAUSSIAN_TRUNCATION] = 0.0
+    else:
+        raise ValueError(f"未知的核函數: {kernel}")
+
+    if indptr is None:
+        rows = np.repeat(np.arange(len(distances)), distances.shape[1])
+        matrix = sparse.csr_matrix((weights.ravel(), (rows, indices.ravel())),
+                                   shape=(len(distances), n_obs))
+    else:
+        matrix = sparse.csr_matrix((weights, indices, indptr), shape=(len(indptr) - 1, n_obs))
+    matrix.eliminate_zeros()
+    return matrix
+
+
+def padded_rows(weights, start, stop):
+    """取出 CSR 矩陣 [start, stop) 列，補齊為等長的 (觀測索引, 權重) 陣列，補位的權重為 0"""
+    block = weights[start:stop]
+    counts = np.diff(block.indptr)
+    width = max(int(counts.max()), 1) if len(counts) else 1
+    # CSR 依列儲存，遮罩的列優先順序即為資料順序
+    mask = np.arange(width)[None, :] < counts[:, None]
+    obs = np.zeros((len(counts), width), dtype=np.int64)
+    values = np.zeros((len(counts), width))
+    obs[mask] = block.indices
+    values[mask] = block.data
+    return obs, values
+
+
+def irls_quantile_batch(X, y, weights, tau, beta=None, scale=1.0, max_iter=IRLS_MAX_ITER, tol=IRLS_TOL):
+    """
+    一批位置同時以 IRLS 求解加權分量迴歸
+    - X (B, m, p)、y (B, m)、weights (B, m)：每個位置的近鄰資料與核權重
+    - 以 |r| 的倒數乘上分量非對稱權重反覆求解加權最小平方，全部位置以批次線性代數一次更新
+    - 已收斂的位置不再更新，每次迭代只計算尚未收斂者
+    - beta：暖啟動係數 (B, p)，未指定時以加權最小平方解起始
+    - 回傳 (係數, 各位置迭代次數)
+    """
+    p = X.shape[2]
+    ridge = RIDGE * np.eye(p)
+    eps = IRLS_EPS * scale
+
+    def solve(X, y, v):
+        weighted = X * v[..., None]
+        A = np.matmul(X.transpose(0, 2, 1), weighted) + ridge
+        b = np.matmul(weighted.transpose(0, 2, 1), y[..., None])
+        return np.linalg.solve(A, b)[..., 0]
+
+    beta = solve(X, y, weights) if beta is None else np.array(beta, dtype=float)
+    iterations = np.zeros(len(X), dtype=int)
+    active = np.arange(len(X))
+
+    for _ in range(max_iter):
+        X_active, y_active = X[active], y[active]
+        residual = y_active - np.matmul(X_active, beta[active][..., None])[..., 0]
+        asymmetric = np.where(residual >= 0, tau, 1 - tau)
+        updated = solve(X_active, y_active, weights[active] * asymmetric / np.maximum(np.abs(residual), eps))
+        change = np.max(np.abs(updated - beta[active]), axis=1)
+        beta[active] = updated
+        iterations[active] += 1
+        active = active[change > tol * scale]
+        if len(active) == 0:
+            break
+    return beta, iterations
+
+
+def lp_quantile(X, y, weights, tau):
+    """單一位置以線性規劃（HiGHS）精確求解加權分量迴歸"""
+    n, p = X.shape
+    # 變數：β（不限正負）、u⁺、u⁻ ≥ 0；min Σ w(τu⁺ + (1-τ)u⁻)，s.t. Xβ + u⁺ - u⁻ = y
+    cost = np.concatenate([np.zeros(p), tau * weights, (1 - tau) * weights])
+    equality = np.hstack([X, np.eye(n), -np.eye(n)])
+    bounds = [(None, None)] * p + [(0, None)] * (2 * n)
+    result = linprog(cost, A_eq=equality, b_eq=y, bounds=bounds, method='highs')
+    return result.x[:p] if result.success else np.full(p, np.nan)
+
+
+def fit_batch(task):
+    """
+    求解一批位置的局部分量迴歸（供行程池呼叫，需為模組層級函式）
+    - task：(X, y, obs, weights, tau, method, beta0, scale)，obs/weights 為補齊後的近鄰索引與權重
+    """
+    X, y, obs, weights, tau, method, beta0, scale = task
+    local_X = X[obs]
+    local_y = y[obs]
+    if method == 'irls':
+        beta, _ = irls_quantile_batch(local_X, local_y, weights, tau, beta=beta0, scale=scale)
+        return beta
+    if method == 'lp':
+        beta = np.empty((len(obs), X.shape[1]))
+        for row in range(len(obs)):
+            used = weights[row] > 0
+            beta[row] = lp_quantile(local_X[row][used], local_y[row][used], weights[row][used], tau)
+        return beta
+    raise ValueError(f"未知的求解方法: {method}")
+
+
+def local_quantile_fits(X, y, weights, tau, method='irls', beta0=None, batch_size=GWQR_BATCH_SIZE,
+                        workers=1):
+    """
+    求解所有位置的局部分量迴歸，回傳係數 (查詢點數, p)
+    - weights：核權重稀疏矩陣（查詢點 × 觀測），每列只含截斷範圍內的近鄰
+    - method='irls'：批次 IRLS（向量化）；method='lp'：逐點線性規劃（精確解，較慢）
+    - beta0：暖啟動係數，例如前一個候選頻寬的結果
+    - workers > 1 時以行程池平行求解各批，結果依原順序合併
+    """
+    X = np.asarray(X, dtype=float)
+    y = np.asarray(y, dtype=float)
+    scale = float(np.std(y)) or 1.0
+    n_query = weights.shape[0]
+
+    tasks = []
+    for start in range(0, n_query, batch_size):
+        stop = min(start + batch_size, n_query)
+        obs, values = padded_rows(weights, start, stop)
+        initial = None if beta0 is None else beta0[start:stop]
+        tasks.append((X, y, obs, values, tau, method, initial, scale))
+
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+            results = list(pool.map(fit_batch, tasks))
+    else:
+        results = [fit_batch(task) for task in tasks]
+    return np.vstack(results) if results else np.empty((0, X.shape[1]))
+
+
+def check_loss(residual, tau):
+    """分量迴歸的檢查損失 ρ_τ(r) 的平均"""
+    residual = np.asarray(residual, dtype=float)
+    return float(np.mean(np.where(residual >= 0, tau * residual, (tau - 1) * residual)))
+
+
+class GWQR:
+    """
+    地理加權分量迴歸（GWQR）
+    - 以 KD-tree 近鄰建立截斷核權重稀疏矩陣，每個位置只用頻寬內的觀測
+    - 所有位置的局部分量迴歸分批求解（IRLS 向量化或線性規劃），可用行程池平行
+    - fit 估計訓練點的局部係數 β_τ(u, v)；predict 在新座標以訓練資料估計局部係數後預測
+    """
+
+    def __init__(self, tau=GWQR_TAU, bandwidth=GWQR_BANDWIDTH, kernel=GWQR_KERNEL, adaptive=True,
+                 method='irls', fit_intercept=True, batch_size=GWQR_BATCH_SIZE, workers=1):
+        self.tau = tau
+        self.bandwidth = bandwidth
+        self.kernel = kernel
+        self.adaptive = adaptive
+        self.method = method
+        self.fit_intercept = fit_intercept
+        self.batch_size = batch_size
+        self.workers = workers
+
+    def design_matrix(self, X):
+        X = np.asarray(X, dtype=float)
+        if X.ndim == 1:
+            X = X[:, None]
+        if self.fit_intercept:
+            X = np.column_stack([np.ones(len(X)), X])
+        return X
+
+    def local_weights(self, coords, exclude_self=False):
+        """查詢座標相對於訓練資料的核權重稀疏矩陣"""
+        distances, indices, indptr = neighbors_for_bandwidth(self.index_, coords, self.bandwidth, self.kernel,
+                                                             self.adaptive, exclude_self=exclude_self)
+        return kernel_weights(distances, indices, self.bandwidth, self.index_.size, self.kernel, self.adaptive,
+                              indptr=indptr)
+
+    def fit(self, lats, lngs, X, y, feature_names=None):
+        start_time = time.time()
+        lats = np.asarray(lats, dtype=float)
+        self.origin_lat_ = float(np.nanmean(lats))
+        self.coords_ = project_coordinates(lats, lngs, self.origin_lat_)
+        self.X_ = self.design_matrix(X)
+        self.y_ = np.asarray(y, dtype=float)
+        self.index_ = NeighborIndex(self.coords_)
+
+        names = list(feature_names) if feature_names is not None else [f"x{i}" for i in range(self.X_.shape[1] - self.fit_intercept)]
+        self.coefficient_names_ = (['截距'] if self.fit_intercept else []) + names
+
+        weights = self.local_weights(self.coords_)
+        print(f"GWQR τ={self.tau}：{len(self.y_)} 個位置，平均每點 {weights.nnz / len(self.y_):.0f} 個近鄰")
+        self.coefficients_ = local_quantile_fits(self.X_, self.y_, weights, self.tau, self.method,
+                                                 batch_size=self.batch_size, workers=self.workers)
+        self.fitted_ = np.einsum('np,np->n', self.X_, self.coefficients_)
+        print(f"GWQR 擬合完成，檢查損失 {check_loss(self.y_ - self.fitted_, self.tau):.4f}，"
+              f"耗時 {time.time() - start_time:.1f} 秒")
+        return self
+
+    def local_coefficients(self, lats, lngs):
+        """以訓練資料估計新座標的局部係數"""
+        coords = project_coordinates(lats, lngs, self.origin_lat_)
+        weights = self.local_weights(coords)
+        return local_quantile_fits(self.X_, self.y_, weights, self.tau, self.method,
+                                   batch_size=self.batch_size, workers=self.workers)
+
+    def predict(self, lats, lngs, X):
+        coefficients = self.local_coefficients(lats, lngs)
+        return np.einsum('np,np->n', self.design_matrix(X), coefficients)
+
+    def coefficient_frame(self):
+        """訓練點的局部係數表"""
+        return pd.DataFrame(self.coefficients_, columns=self.coefficient_names_)
+
+
+class BandwidthSelector:
+    """
+    GWQR 頻寬選擇（留一交叉驗證的檢查損失）
+    - 建立時只查詢一次近鄰距離／索引（排除自身），所有候選頻寬共用，不重算距離；
+      固定頻寬以不等長的 CSR 格式儲存最大截斷半徑內的近鄰，不補齊為 (n, 最大近鄰數)
+    - 候選頻寬的局部擬合以最接近的已評估候選係數暖啟動
+    - cv_sample：只在隨機抽樣的位置評估交叉驗證損失，近鄰仍取自全部資料
+    - folds：各列的空間折別（見 spatial_cv.py），指定時改為空間區塊交叉驗證，
+      每個位置只用其他折的觀測擬合，折別為 -1 者不參與
+    - search='golden'：黃金分割搜尋；search='grid'：由粗到細的網格搜尋，同一輪候選可平行
+    """
+
+    def __init__(self, lats, lngs, X, y, kernel=GWQR_KERNEL, adaptive=True, bounds=None,
+                 fit_intercept=True, cv_sample=None, folds=None, method='irls', batch_size=GWQR_BATCH_SIZE,
+                 seed=0):
+        self.kernel = kernel
+        self.adaptive = adaptive
+        self.bounds = tuple(bounds) if bounds is not None else self.default_bounds(kernel, adaptive)
+        self.method = method
+        self.batch_size = batch_size
+
+        model = GWQR(fit_intercept=fit_intercept)
+        self.X = model.design_matrix(X)
+        self.y = np.asarray(y, dtype=float)
+        coords = project_coordinates(lats, lngs)
+
+        n = len(self.y)
+        candidates = np.arange(n) if folds is None else np.flatnonzero(np.asarray(folds) >= 0)
+        if cv_sample is not None and cv_sample < len(candidates):
+            self.sample = np.sort(np.random.default_rng(seed).choice(candidates, size=cv_sample, replace=False))
+        else:
+            self.sample = candidates
+
+        # 依最大候選頻寬查詢一次近鄰，之後每個候選只取前幾欄或截斷
+        if folds is None:
+            index = NeighborIndex(coords)
+            if self.adaptive:
+                k = self.neighbor_count([(index, self.sample)])
+                self.distances, self.indices = index.query(coords[self.sample], k, exclude_self=True,
+                                                           query_indices=self.sample)
+                self.indptr = None
+            else:
+                self.distances, self.indices, self.indptr = index.query_radius(
+                    coords[self.sample], truncation_radius(self.bounds[1], self.kernel), exclude_self=True,
+                    query_indices=self.sample)
+        else:
+            self.distances, self.indices, self.indptr = self.fold_neighbors(coords, np.asarray(folds))
+        print(f"頻寬選擇：{n} 筆資料，於 {len(self.sample)} 個位置評估，"
+              f"每點預先查詢平均 {self.distances.size / max(len(self.sample), 1):.0f} 個近鄰")
+
+    @staticmethod
+    def default_bounds(kernel, adaptive):
+        """預設搜尋範圍：高斯核的固定頻寬上限除以 GAUSSIAN_TRUNCATION，使最大截斷半徑與雙平方核相同"""
+        if adaptive:
+            return ADAPTIVE_RANGE
+        lower, upper = FIXED_RANGE
+        return (lower, upper / GAUSSIAN_TRUNCATION) if kernel == 'gaussian' else FIXED_RANGE
+
+    def neighbor_count(self, groups):
+        """適應性頻寬上限需要的近鄰數，不超過各組的觀測數；groups 為 (近鄰索引, 查詢列) 的列表"""
+        return max(min([int(self.bounds[1])] + [index.size for index, _ in groups]), 1)
+
+    def fold_neighbors(self, coords, folds):
+        """
+        空間區塊交叉驗證：各折的評估位置只查詢其他折的觀測，回傳與全體索引對應的 (距離, 索引, 列指標)
+        - 適應性頻寬為等寬的 (n, k) 陣列（列指標為 None），固定頻寬為依評估位置排列的不等長 CSR 格式
+        """
+        groups, trains = [], []
+        for fold in np.unique(folds[self.sample]):
+            train = np.flatnonzero((folds >= 0) & (folds != fold))
+            groups.append((NeighborIndex(coords[train]), self.sample[folds[self.sample] == fold]))
+            trains.append(train)
+
+        if self.adaptive:
+            k = self.neighbor_count(groups)
+            distances = np.empty((len(self.sample), k))
+            indices = np.empty((len(self.sample), k), dtype=np.int64)
+            for (index, rows), train in zip(groups, trains):
+                position = np.searchsorted(self.sample, rows)
+                fold_distances, fold_indices = index.query(coords[rows], k)
+                distances[position] = fold_distances
+                indices[position] = train[fold_indices]
+            return distances, indices, None
+
+        cutoff = truncation_radius(self.bounds[1], self.kernel)
+        positions, distances, indices = [np.zeros(0, dtype=np.int64)], [np.zeros(0)], [np.zeros(0, dtype=np.int64)]
+        for (index, rows), train in zip(groups, trains):
+            fold_distances, fold_indices, indptr = index.query_radius(coords[rows], cutoff)
+            positions.append(np.repeat(np.searchsorted(self.sample, rows), np.diff(indptr)))
+            distances.append(fold_distances)
+            indices.append(train[fold_indices])
+
+        # 各折的近鄰依評估位置重新排列（同一位置內維持原順序）
+        positions = np.concatenate(positions)
+        order = np.argsort(positions, kind='stable')
+        indptr = np.concatenate([[0], np.cumsum(np.bincount(positions, minlength=len(self.sample)))])
+        return np.concatenate(distances)[order], np.concatenate(indices)[order], indptr.astype(np.int64)
+
+    def normalize(self, bandwidth):
+        """適應性頻寬取整數，固定頻寬取至 0.1 公尺"""
+        lower, upper = self.bounds
+        bandwidth = min(max(bandwidth, lower), upper)
+        return int(round(bandwidth)) if self.adaptive else round(float(bandwidth), 4)
+
+    def score(self, bandwidth, tau, beta0=None):
+        """單一候選頻寬的交叉驗證檢查損失，回傳 (損失, 評估位置的局部係數)"""
+        weights = kernel_weights(self.distances, self.indices, bandwidth, len(self.y), self.kernel, self.adaptive,
+                                 indptr=self.indptr)
+        beta = local_quantile_fits(self.X, self.y, weights, tau, self.method, beta0=beta0,
+                                   batch_size=self.batch_size)
+        prediction = np.einsum('np,np->n', self.X[self.sample], beta)
+        return check_loss(self.y[self.sample] - prediction, tau), beta
+
+    def golden_section(self, tau, tol=None):
+        """
+        黃金分割搜尋單一分量的最佳頻寬，回傳 (最佳頻寬, {頻寬: 損失})
+        - 假設損失對頻寬為單峰；適應性頻寬搜尋至區間小於 1 個近鄰
+        """
+        ratio = (np.sqrt(5) - 1) / 2
+        lower, upper = self.bounds
+        if tol is None:
+            tol = 1 if self.adaptive else (upper - lower) * 0.01
+        evaluated = {}
+
+        def evaluate(bandwidth):
+            bandwidth = self.normalize(bandwidth)
+            if bandwidth not in evaluated:
+                nearest = min(evaluated, key=lambda done: abs(done - bandwidth)) if evaluated else None
+                evaluated[bandwidth] = self.score(bandwidth, tau, evaluated[nearest][1] if nearest is not None else None)
+            return evaluated[bandwidth][0]
+
+        a, b = lower, upper
+        c, d = b - ratio * (b - a), a + ratio * (b - a)
+        while b - a > tol:
+            if evaluate(c) < evaluate(d):
+                b = d
+            else:
+                a = c
+            c, d = b - ratio * (b - a), a + ratio * (b - a)
+
+        losses = {bandwidth: result[0] for bandwidth, result in evaluated.items()}
+        return min(losses, key=losses.get), losses
+
+    def coarse_to_fine(self, taus, grid_size=GRID_SIZE, rounds=GRID_ROUNDS, pool=None):
+        """
+        由粗到細的網格搜尋，回傳 {分量: (最佳頻寬, {頻寬: 損失})}
+        - 每輪在目前區間取 grid_size 個候選，下一輪縮小至最佳候選的前後一格
+        - 同一輪所有分量與候選一起送入行程池，暖啟動係數取自上一輪最接近的候選
+        """
+        ranges = {tau: self.bounds for tau in taus}
+        evaluated = {tau: {} for tau in taus}
+
+        for _ in range(rounds):
+            tasks = []
+            for tau in taus:
+                lower, upper = ranges[tau]
+                for bandwidth in dict.fromkeys(self.normalize(value) for value in np.linspace(lower, upper, grid_size)):
+                    if bandwidth in evaluated[tau]:
+                        continue
+                    done = evaluated[tau]
+                    nearest = min(done, key=lambda previous: abs(previous - bandwidth)) if done else None
+                    tasks.append((bandwidth, tau, done[nearest][1] if nearest is not None else None))
+            if not tasks:
+                break
+
+            results = pool.map(score_task, tasks) if pool is not None else [self.score(*task) for task in tasks]
+            for (bandwidth, tau, _), result in zip(tasks, results):
+                evaluated[tau][bandwidth] = result
+
+            for tau in taus:
+                lower, upper = ranges[tau]
+                step = (upper - lower) / (grid_size - 1)
+                best = min(evaluated[tau], key=lambda bandwidth: evaluated[tau][bandwidth][0])
+                ranges[tau] = (max(best - step, self.bounds[0]), min(best + step, self.bounds[1]))
+
+        output = {}
+        for tau in taus:
+            losses = {bandwidth: result[0] for bandwidth, result in evaluated[tau].items()}
+            output[tau] = (min(losses, key=losses.get), losses)
+        return output
+
+    def select(self, taus=SELECTION_TAUS, search='golden', workers=1):
+        """
+        選擇各分量的最佳頻寬，回傳 DataFrame（分量、頻寬、交叉驗證損失、評估候選數）
+        - workers > 1 時以行程池平行：黃金分割依分量平行，網格搜尋依分量與候選平行
+        """
+        start_time = time.time()
+        pool = None
+        if workers > 1:
+            # 近鄰陣列只在各行程啟動時傳送一次
+            pool = ProcessPoolExecutor(max_workers=workers, initializer=init_selector, initargs=(self,))
+        try:
+            if search == 'golden':
+                if pool is not None:
+                    searched = dict(zip(taus, pool.map(golden_task, taus)))
+                else:
+                    searched = {tau: self.golden_section(tau) for tau in taus}
+            elif search == 'grid':
+                searched = self.coarse_to_fine(taus, pool=pool)
+            else:
+                raise ValueError(f"未知的搜尋方式: {search}")
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+        self.history_ = {tau: losses for tau, (_, losses) in searched.items()}
+        result = pd.DataFrame([{'分量': tau, '頻寬': best, '交叉驗證損失': losses[best], '評估候選數': len(losses)}
+                               for tau, (best, losses) in searched.items()])
+        print(f"頻寬選擇完成，耗時 {time.time() - start_time:.1f} 秒")
+        return result
+
+
+# 行程池中共用的頻寬選擇器（由 init_selector 於各行程啟動時設定）
+_selector = None
+
+
+def init_selector(selector):
+    global _selector
+    _selector = selector
+
+
+def score_task(task):
+    bandwidth, tau, beta0 = task
+    return _selector.score(bandwidth, tau, beta0)
+
+
+def golden_task(tau):
+    return _selector.golden_section(tau)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="地理加權分量迴歸（GWQR）")
+    parser.add_argument('data',
+                        help="含緯度、經度、目標與特徵欄位的資料（Parquet 或 CSV）")
+    parser.add_argument('--target', required=True,
+                        help="目標欄位，例如 單價元平方公尺")
+    parser.add_argument('--features', nargs='+', required=True,
+                        help="特徵欄位，例如各基學習器的預測值")
+    parser.add_argument('--tau', type=float, default=GWQR_TAU,
+                        help="分量 τ")
+    parser.add_argument('--bandwidth', type=float, default=GWQR_BANDWIDTH,
+                        help="頻寬：適應性為近鄰數，固定為公里")
+    parser.add_argument('--kernel', choices=['bisquare', 'gaussian'], default=GWQR_KERNEL,
+                        help="核函數")
+    parser.add_argument('--fixed', action='store_true',
+                        help="使用固定頻寬（公里），預設為適應性頻寬（近鄰數）")
+    parser.add_argument('--method', choices=['irls', 'lp'], default='irls',
+                        help="局部分量迴歸求解方法")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="平行求解的行程數")
+    parser.add_argument('--select-bandwidth', action='store_true',
+                        help="以交叉驗證選擇各分量的頻寬（不擬合模型）")
+    parser.add_argument('--taus', type=float, nargs='+', default=list(SELECTION_TAUS),
+                        help="頻寬選擇的分量")
+    parser.add_argument('--search', choices=['golden', 'grid'], default='golden',
+                        help="頻寬搜尋方式：黃金分割或由粗到細網格")
+    parser.add_argument('--bounds', type=float, nargs=2, default=None,
+                        help="頻寬搜尋範圍（下限 上限）")
+    parser.add_argument('--cv-sample', type=int, default=None,
+                        help="只在隨機抽樣的位置評估交叉驗證損失")
+    # 延後載入：spatial_cv 本身依賴本模組
+    from spatial_cv import add_cv_arguments
+    add_cv_arguments(parser)
+    parser.add_argument('--output', default='gwqr_coefficients.parquet',
+                        help="局部係數（或頻寬選擇結果）輸出檔路徑（.parquet 或 .csv）")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    path = Path(args.data)
+    data = pd.read_parquet(path) if path.is_dir() or path.suffix == '.parquet' else pd.read_csv(path, encoding='utf-8-sig')
+    columns = ['緯度', '經度', args.target] + args.features
+    usable = data[columns].apply(pd.to_numeric, errors='coerce').dropna()
+    print(f"讀取 {len(data)} 筆資料，可用 {len(usable)} 筆")
+
+    if args.select_bandwidth:
+        from spatial_cv import folds_from_args
+        folds = folds_from_args(args, data, args.data)
+        selector = BandwidthSelector(usable['緯度'], usable['經度'], usable[args.features], usable[args.target],
+                                     kernel=args.kernel, adaptive=not args.fixed, bounds=args.bounds,
+                                     cv_sample=args.cv_sample, method=args.method,
+                                     folds=None if folds is None else folds.loc[usable.index].to_numpy())
+        bandwidths = selector.select(args.taus, search=args.search, workers=args.workers)
+        print(bandwidths)
+        if args.output.endswith('.csv'):
+            bandwidths.to_csv(args.output, index=False, encoding='utf-8-sig')
+        else:
+            bandwidths.to_parquet(args.output, index=False)
+        print(f"頻寬選擇結果已儲存至: {args.output}")
+        return
+
+    bandwidth = args.bandwidth if args.fixed else int(args.bandwidth)
+    model = GWQR(tau=args.tau, bandwidth=bandwidth, kernel=args.kernel, adaptive=not args.fixed,
+                 method=args.method, workers=args.workers)
+    model.fit(usable['緯度'], usable['經度'], usable[args.features], usable[args.target],
+              feature_names=args.features)
+
+    coefficients = model.coefficient_frame().add_prefix('β_')
+    coefficients.index = usable.index
+    output = pd.concat([usable, coefficients], axis=1)
+    output['GWQR預測'] = model.fitted_
+    if args.output.endswith('.csv'):
+        output.to_csv(args.output, index=False, encoding='utf-8-sig')
+    else:
+        output.to_parquet(args.output, index=False)
+    print(f"資料已儲存至: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
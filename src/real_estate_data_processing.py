@@ -1,30 +1,337 @@
 import pandas as pd
+import numpy as np
 import geocoder
 from geopy.geocoders import Nominatim
 import time
 import re
+import os
+import json
+import argparse
+import glob
+from pathlib import Path
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor, CancelledError, FIRST_COMPLETED, as_completed, wait
 
+import requests
+
+try:
+    import geopandas as gpd
+    import shapely
+except ImportError:  # 僅離線村里比對需要
+    gpd = None
+    shapely = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # 僅 Parquet 輸出需要
+    pa = None
+    pq = None
 
 
 # 台灣經緯度範圍
 TW_LAT_MIN, TW_LAT_MAX = 21.0, 26.5
 TW_LNG_MIN, TW_LNG_MAX = 117.0, 123.8
 
-def normalize_address(address: str) -> str:
+# 地址正規化規則
+FULLWIDTH_TABLE = str.maketrans('０１２３４５６７８９－（）', '0123456789-()')
+WHITESPACE_PATTERN = re.compile(r"\s+")
+BRACKET_PATTERN = re.compile(r"\(.*?\)")
+HOUSE_NUMBER_PATTERN = re.compile(r"^(.*?號)")
+SECTION_DIGIT_PATTERN = re.compile(r"(\d+)段")
+LANE_CHINESE_PATTERN = re.compile(r"([〇零一二三四五六七八九十百]+)(巷|弄|號)")
+CHINESE_DIGITS = {'〇': 0, '零': 0, '一': 1, '二': 2, '三': 3, '四': 4,
+                  '五': 5, '六': 6, '七': 7, '八': 8, '九': 9}
+CHINESE_UNITS = {'十': 10, '百': 100}
+
+# 地理編碼快取設定
+GEOCODE_CACHE_PATH = "geocode_cache.sqlite"
+NEGATIVE_TTL = 7 * 24 * 3600      # 失敗結果保留秒數，逾期後重新查詢
+CACHE_MAX_ENTRIES = 500000        # 快取筆數上限，超過時移除最久未使用者
+CACHE_TOUCH_BATCH = 500           # 命中時的最後存取時間累積 N 筆才寫入，避免長時間持有寫入交易
+
+# 並行地理編碼設定（各服務獨立限速）
+ARCGIS_QPS = 4.0                  # ArcGIS 每秒請求數（原間隔 0.25 秒）
+NOMINATIM_QPS = 1.0               # Nominatim 使用政策上限為每秒 1 次
+MAX_IN_FLIGHT = 8                 # 同時進行中的請求數上限
+WAIT_INTERVAL = 1.0               # 等待請求完成時檢查中斷旗標的間隔秒數
+
+# 檢查點設定：每處理 N 筆將結果寫入日誌檔
+CHECKPOINT_EVERY = 50
+
+# 離線村里比對設定：指定村里界圖（SHP 或 GeoJSON）後不再呼叫 Nominatim
+VILLAGE_BOUNDARY_PATH = None
+VILLAGE_NAME_COLUMN = 'VILLNAME'
+
+# Parquet 輸出設定：數值欄位的明確型別（其餘欄位一律為字串），依縣市與交易季度分割
+PARQUET_COMPRESSION = 'zstd'
+PARTITION_COLUMNS = ['縣市代碼', '交易季度']
+TRANSACTION_NUMERIC_TYPES = {
+    '土地移轉總面積平方公尺': 'float64',
+    '建物移轉總面積平方公尺': 'float64',
+    '建物現況格局-房': 'int16',
+    '建物現況格局-廳': 'int16',
+    '建物現況格局-衛': 'int16',
+    '總價元': 'int64',
+    '單價元平方公尺': 'float64',
+    '車位移轉總面積(平方公尺)': 'float64',
+    '車位總價元': 'int64',
+    '主建物面積': 'float64',
+    '附屬建物面積': 'float64',
+    '陽台面積': 'float64',
+    '緯度': 'float64',
+    '經度': 'float64',
+}
+
+
+class GeocodeCache:
     """
-    地址清理函數
-    - 保留到「幾號」為止
-    - 移除括號內補充說明
+    地理編碼持久化快取（SQLite）
+    - 以清理後的地址為鍵，記錄經緯度、來源、時間與失敗狀態
+    - 反向查詢的村里以座標為鍵（見 village_key），來源標記為 nominatim，只快取成功結果
+    - 失敗結果在 negative_ttl 秒內直接回傳失敗，逾期後重新查詢
+    - 超過 max_entries 筆時依最後存取時間移除最舊資料
     """
-    if pd.isna(address):
-        return address
+
+    def __init__(self, path=GEOCODE_CACHE_PATH, negative_ttl=NEGATIVE_TTL,
+                 max_entries=CACHE_MAX_ENTRIES, touch_batch=CACHE_TOUCH_BATCH):
+        self.path = path
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.touch_batch = touch_batch
+        self.hits = 0
+        self.misses = 0
+        # 命中資料的最後存取時間，批次寫入
+        self.touched = {}
+        # 並行地理編碼時由多個執行緒共用，以鎖保護連線
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS geocode_cache (
+                address     TEXT PRIMARY KEY,
+                lat         REAL,
+                lng         REAL,
+                village     TEXT,
+                provider    TEXT NOT NULL,
+                status      TEXT NOT NULL,
+                updated_at  REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        # 舊版快取檔沒有村里欄位
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(geocode_cache)")]
+        if 'village' not in columns:
+            self.conn.execute("ALTER TABLE geocode_cache ADD COLUMN village TEXT")
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_geocode_accessed ON geocode_cache (accessed_at)"
+        )
+        self.conn.commit()
+
+    @staticmethod
+    def village_key(lat, lng):
+        """反向查詢的快取鍵（座標取到小數第 6 位）"""
+        return f"reverse:{float(lat):.6f},{float(lng):.6f}"
+
+    def get(self, address):
+        """
+        查詢快取
+        - 命中成功結果回傳 (lat, lng)
+        - 命中未逾期的失敗結果回傳 (None, None)
+        - 未命中或失敗結果已逾期回傳 None
+        """
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT lat, lng, status, updated_at FROM geocode_cache WHERE address = ?",
+                (address,)
+            ).fetchone()
+            
+            if row is None:
+                self.misses += 1
+                return None
+            
+            lat, lng, status, updated_at = row
+            now = time.time()
+            if status != 'ok' and now - updated_at > self.negative_ttl:
+                self.misses += 1
+                return None
+            
+            self._touch(address, now)
+            self.hits += 1
+        return (lat, lng) if status == 'ok' else (None, None)
+
+    def get_village(self, lat, lng):
+        """查詢座標的村里，未命中回傳 None"""
+        key = self.village_key(lat, lng)
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT village FROM geocode_cache WHERE address = ? AND status = 'ok'", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._touch(key, time.time())
+            self.hits += 1
+        return row[0]
+
+    def put(self, address, lat, lng, provider='arcgis', status='ok', village=None):
+        """寫入查詢結果，status 為 'ok'、'not_found' 或 'out_of_range'"""
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO geocode_cache "
+                "(address, lat, lng, village, provider, status, updated_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (address, lat, lng, village, provider, status, now, now)
+            )
+            self.conn.commit()
+            self._evict()
+
+    def put_village(self, lat, lng, village):
+        """寫入反向查詢取得的村里"""
+        self.put(self.village_key(lat, lng), lat, lng, provider='nominatim', village=village)
+
+    def _touch(self, key, now):
+        """記錄命中時間，累積 touch_batch 筆後寫入（呼叫端需持有鎖）"""
+        self.touched[key] = now
+        if len(self.touched) >= self.touch_batch:
+            self._flush_touches()
+
+    def _flush_touches(self):
+        """寫入累積的最後存取時間並立即提交，不留下未結束的寫入交易（呼叫端需持有鎖）"""
+        if self.touched:
+            self.conn.executemany(
+                "UPDATE geocode_cache SET accessed_at = ? WHERE address = ?",
+                [(now, key) for key, now in self.touched.items()]
+            )
+            self.conn.commit()
+            self.touched = {}
+
+    def _evict(self):
+        """超過筆數上限時移除最久未使用的資料（呼叫端需持有鎖）"""
+        self._flush_touches()
+        count = self.conn.execute("SELECT COUNT(*) FROM geocode_cache").fetchone()[0]
+        overflow = count - self.max_entries
+        if overflow > 0:
+            self.conn.execute(
+                "DELETE FROM geocode_cache WHERE address IN ("
+                "SELECT address FROM geocode_cache ORDER BY accessed_at LIMIT ?)",
+                (overflow,)
+            )
+            self.conn.commit()
+
+    def close(self):
+        with self.lock:
+            self._flush_touches()
+            self.conn.commit()
+            self.conn.close()
+
+
+class TokenBucket:
+    """令牌桶限速器（執行緒安全），rate 為每秒補充的令牌數"""
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """取得一個令牌，不足時等待"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity,
+                                  self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+def chinese_to_int(text: str) -> int:
+    """
+    中文數字轉整數
+    - 含「十、百」者依位值計算（三十五 -> 35、一百零五 -> 105）
+    - 不含者逐位讀取（一〇五 -> 105、二七〇 -> 270）
+    - 無法確定數值的寫法（例如 三五十、十百）拋出 ValueError
+    """
+    if not any(char in CHINESE_UNITS for char in text):
+        return int(''.join(str(CHINESE_DIGITS[char]) for char in text))
     
-    # 保留到「號」為止
-    m = re.search(r".*?號", address)
-    base = m.group(0) if m else address
+    total, digit, last_unit = 0, None, None
+    for char in text:
+        if char in CHINESE_UNITS:
+            unit = CHINESE_UNITS[char]
+            # 位值需由大到小，且單位前不可為「零」
+            if (last_unit is not None and unit >= last_unit) or digit == 0:
+                raise ValueError(f"無法解析的中文數字: {text}")
+            total += (1 if digit is None else digit) * unit
+            digit, last_unit = None, unit
+        else:
+            # 兩個非零數字相連（例如 三五十）無法判斷位值
+            if digit:
+                raise ValueError(f"無法解析的中文數字: {text}")
+            digit = CHINESE_DIGITS[char]
+    return total + (digit or 0)
+
+def int_to_chinese(number: int) -> str:
+    """整數轉中文數字（0-999，用於「段」，例如 35 -> 三十五、105 -> 一百零五）"""
+    digits = '零一二三四五六七八九'
+    if not 0 <= number < 1000:
+        raise ValueError(f"超出範圍的數字: {number}")
+    if number < 10:
+        return digits[number]
+    if number < 100:
+        tens, ones = divmod(number, 10)
+        return ('' if tens == 1 else digits[tens]) + '十' + (digits[ones] if ones else '')
+    hundreds, rest = divmod(number, 100)
+    if rest == 0:
+        return digits[hundreds] + '百'
+    # 百位之後十位為 0 需補「零」，十位為 1 需寫出「一十」
+    if rest < 10:
+        return digits[hundreds] + '百零' + digits[rest]
+    return digits[hundreds] + '百' + ('一' if rest < 20 else '') + int_to_chinese(rest)
+
+def section_to_chinese(match) -> str:
+    """「段」的阿拉伯數字轉中文，超出 int_to_chinese 範圍者保持原樣"""
+    number = int(match.group(1))
+    return int_to_chinese(number) + '段' if number < 1000 else match.group(0)
+
+def lane_to_arabic(match) -> str:
+    """「巷、弄、號」的中文數字轉阿拉伯數字，無法解析者保持原樣"""
+    try:
+        return str(chinese_to_int(match.group(1))) + match.group(2)
+    except ValueError:
+        return match.group(0)
+
+def normalize_addresses(addresses: pd.Series) -> pd.Series:
+    """
+    向量化地址清理（產生快取與去重用的標準地址）
+    - 全形數字與符號轉半形，移除空白，「臺」統一為「台」
+    - 移除括號內補充說明，保留到「幾號」為止
+    - 「段」統一為中文數字（2段 -> 二段），「巷、弄、號」統一為阿拉伯數字（三巷 -> 3巷）
+    """
+    result = (addresses.str.translate(FULLWIDTH_TABLE)
+                       .str.replace(WHITESPACE_PATTERN, '', regex=True)
+                       .str.replace('臺', '台', regex=False)
+                       .str.replace(BRACKET_PATTERN, '', regex=True))
+    
+    # 保留到「號」為止，沒有「號」的地址保持原樣
+    result = result.str.extract(HOUSE_NUMBER_PATTERN, expand=False).fillna(result)
     
-    # 移除括號內補充說明
-    return re.sub(r"（.*?）|\(.*?\)", "", base).strip()
+    # 段、巷、弄、號的數字寫法統一
+    result = result.str.replace(SECTION_DIGIT_PATTERN, section_to_chinese, regex=True)
+    result = result.str.replace(LANE_CHINESE_PATTERN, lane_to_arabic, regex=True)
+    return result
+
+def normalize_address(address: str) -> str:
+    """單一地址清理，規則同 normalize_addresses"""
+    if pd.isna(address):
+        return address
+    return normalize_addresses(pd.Series([address], dtype=object)).iloc[0]
 
 def is_valid_taiwan_coordinate(lat, lng):
     """檢查經緯度是否在台灣範圍內"""
@@ -32,27 +339,65 @@ def is_valid_taiwan_coordinate(lat, lng):
         return False
     return TW_LAT_MIN <= lat <= TW_LAT_MAX and TW_LNG_MIN <= lng <= TW_LNG_MAX
 
-def get_coordinates(address):
-    """取得經緯度（單次嘗試）"""
+def get_coordinates(address, cache=None, refresh=False, session=None, limiter=None):
+    """
+    取得經緯度（單次嘗試）
+    - 若有快取且命中，直接回傳快取結果，不呼叫 API 也不等待
+    - refresh=True 時略過快取讀取，強制重新查詢並更新快取
+    - 查無結果或超出台灣範圍會寫入快取；連線異常不寫入，下次重試
+    - session 用於重複使用連線，limiter 控制 ArcGIS 請求速率
+    """
+    if pd.isna(address):
+        return None, None
+    
+    if cache is not None and not refresh:
+        cached = cache.get(address)
+        if cached is not None:
+            return cached
+    
+    if limiter is not None:
+        limiter.acquire()
+    
     try:
-        g = geocoder.arcgis(address, timeout=60)
+        if session is not None:
+            g = geocoder.arcgis(address, timeout=60, session=session)
+        else:
+            g = geocoder.arcgis(address, timeout=60)
         r = g.json
         
         if r is not None and r.get('lat') and r.get('lng'):
             lat, lng = r.get('lat'), r.get('lng')
             if is_valid_taiwan_coordinate(lat, lng):
-                return lat, lng
+                status = 'ok'
             else:
                 print(f"座標超出台灣範圍: {lat}, {lng}")
-                return None, None
+                lat, lng, status = None, None, 'out_of_range'
+        else:
+            lat, lng, status = None, None, 'not_found'
+        
+        if cache is not None:
+            cache.put(address, lat, lng, provider='arcgis', status=status)
+        return lat, lng
                 
     except Exception as e:
         print(f"經緯度轉換異常: {e}")
     
     return None, None
 
-def get_village(lat, lng, geolocator):
-    """取得村里別（單次嘗試）"""
+def get_village(lat, lng, geolocator, limiter=None, cache=None):
+    """
+    取得村里別（單次嘗試），limiter 控制 Nominatim 請求速率
+    - 若有快取且命中，直接回傳快取結果，不呼叫 API 也不等待
+    - 成功結果寫入快取；失敗不寫入，下次重試
+    """
+    if cache is not None:
+        cached = cache.get_village(lat, lng)
+        if cached is not None:
+            return cached
+    
+    if limiter is not None:
+        limiter.acquire()
+    
     try:
         location = geolocator.reverse(f"{lat}, {lng}")
         
@@ -62,6 +407,8 @@ def get_village(lat, lng, geolocator):
                       address_info.get('suburb') or
                       address_info.get('village') or
                       address_info.get('town'))
+            if village and cache is not None:
+                cache.put_village(lat, lng, village)
             return village
             
     except Exception as e:
@@ -69,6 +416,215 @@ def get_village(lat, lng, geolocator):
     
     return None
 
+class VillageIndex:
+    """
+    離線村里比對
+    - 讀取一次村里界圖並建立 STRtree 空間索引
+    - 以單次向量化的點在多邊形內查詢指派所有座標的村里
+    """
+
+    def __init__(self, boundary_path, name_column=VILLAGE_NAME_COLUMN):
+        if gpd is None:
+            raise ImportError("離線村里比對需要安裝 geopandas 與 shapely")
+        
+        boundary = gpd.read_file(boundary_path)
+        # 政府村里界圖可能為 TWD97 投影座標，統一轉為經緯度
+        if boundary.crs is not None and boundary.crs.to_epsg() != 4326:
+            boundary = boundary.to_crs(epsg=4326)
+        
+        boundary = boundary[boundary.geometry.notna()].reset_index(drop=True)
+        self.names = boundary[name_column].to_numpy(dtype=object)
+        self.tree = shapely.STRtree(boundary.geometry.to_numpy())
+        print(f"已載入村里界圖: {len(self.names)} 個村里")
+
+    def lookup(self, lats, lngs):
+        """
+        批次查詢村里
+        - 輸入經緯度序列（可含 None），回傳等長的村里名稱列表
+        - 無座標或不在任何村里內者回傳 None
+        """
+        lats = pd.to_numeric(pd.Series(lats, dtype=object), errors='coerce').to_numpy(dtype=float)
+        lngs = pd.to_numeric(pd.Series(lngs, dtype=object), errors='coerce').to_numpy(dtype=float)
+        villages = np.full(len(lats), None, dtype=object)
+        
+        valid = np.flatnonzero(~(np.isnan(lats) | np.isnan(lngs)))
+        if len(valid) == 0:
+            return villages.tolist()
+        
+        points = shapely.points(lngs[valid], lats[valid])
+        # covered_by 包含恰好落在界線上的點（within 會排除）
+        point_idx, polygon_idx = self.tree.query(points, predicate='covered_by')
+        
+        # 落在界線上可能對應多個村里，取第一個
+        point_idx, first = np.unique(point_idx, return_index=True)
+        villages[valid[point_idx]] = self.names[polygon_idx[first]]
+        return villages.tolist()
+
+
+class GeocodingEngine:
+    """
+    並行地理編碼引擎
+    - ArcGIS 與 Nominatim 各自以令牌桶限速，互不阻塞
+    - 以執行緒池限制同時進行中的請求數，並共用 HTTP 連線
+    - 正向查詢完成後立即排入反向查詢，不同筆資料的正反向查詢可同時進行
+    - geolocator 為 None 時只做正向查詢（例如離線村里比對模式）
+    - 可由多個檔案同時共用，限速與快取為全域共享
+    - stop() 後等待中的批次於 WAIT_INTERVAL 秒內拋出 CancelledError，呼叫端可寫入檢查點後結束
+    """
+
+    def __init__(self, cache=None, geolocator=None, arcgis_qps=ARCGIS_QPS,
+                 nominatim_qps=NOMINATIM_QPS, max_in_flight=MAX_IN_FLIGHT):
+        self.cache = cache
+        self.geolocator = geolocator
+        self.session = requests.Session()
+        self.arcgis_limiter = TokenBucket(arcgis_qps)
+        self.nominatim_limiter = TokenBucket(nominatim_qps)
+        self.forward_pool = ThreadPoolExecutor(max_workers=max_in_flight)
+        self.reverse_pool = ThreadPoolExecutor(max_workers=max(1, int(nominatim_qps * 2)))
+        self.stopped = threading.Event()
+
+    def forward(self, address, refresh=False):
+        return get_coordinates(address, self.cache, refresh=refresh,
+                               session=self.session, limiter=self.arcgis_limiter)
+
+    def reverse(self, lat, lng):
+        return get_village(lat, lng, self.geolocator, limiter=self.nominatim_limiter, cache=self.cache)
+
+    def geocode(self, items, refresh=False, journal=None):
+        """
+        批次地理編碼
+        - items 為 (索引, 地址) 列表
+        - 每筆完成的結果寫入 journal（檢查點日誌）
+        - 回傳 {索引: (緯度, 經度, 村里)}，失敗欄位為 None
+        """
+        results = {}
+        forward_futures = {self.forward_pool.submit(self.forward, address, refresh): (index, address)
+                           for index, address in items}
+        reverse_futures = {}
+        
+        for future in self._as_completed(forward_futures):
+            index, address = forward_futures[future]
+            lat, lng = future.result()
+            results[index] = (lat, lng, None)
+            
+            if lat and lng:
+                print(f"{address} -> {lat}, {lng}")
+                if self.geolocator is not None:
+                    future = self.reverse_pool.submit(self.reverse, lat, lng)
+                    reverse_futures[future] = (index, address, lat, lng)
+                    continue
+            else:
+                print(f"{address} 地址轉換失敗")
+            
+            # 不需反向查詢的結果直接寫入日誌
+            if journal is not None:
+                journal.record(index, address, lat, lng, None)
+        
+        for index, village in self._collect_villages(reverse_futures, journal).items():
+            lat, lng, _ = results[index]
+            results[index] = (lat, lng, village)
+        
+        return results
+
+    def geocode_villages(self, items, journal=None):
+        """
+        批次反向地理編碼
+        - items 為 (索引, 地址, 緯度, 經度) 列表
+        - 回傳 {索引: 村里}，失敗為 None
+        """
+        futures = {self.reverse_pool.submit(self.reverse, lat, lng): (index, address, lat, lng)
+                   for index, address, lat, lng in items}
+        return self._collect_villages(futures, journal)
+
+    def _collect_villages(self, futures, journal):
+        villages = {}
+        for future in self._as_completed(futures):
+            index, address, lat, lng = futures[future]
+            villages[index] = future.result()
+            if villages[index]:
+                print(f"{address} 完成，村里：{villages[index]}")
+            else:
+                print(f"{address} 完成，村里轉換失敗")
+            if journal is not None:
+                journal.record(index, address, lat, lng, villages[index])
+        return villages
+
+    def _as_completed(self, futures):
+        """
+        同 as_completed，但每 WAIT_INTERVAL 秒檢查中斷旗標，中斷時拋出 CancelledError
+        - 被 shutdown(cancel_futures=True) 取消的工作不會喚醒 as_completed，只靠等待會永遠卡住
+        """
+        pending = set(futures)
+        while pending:
+            if self.stopped.is_set():
+                raise CancelledError("地理編碼已中斷")
+            done, pending = wait(pending, timeout=WAIT_INTERVAL, return_when=FIRST_COMPLETED)
+            yield from done
+
+    def stop(self):
+        """中斷：通知等待中的批次結束，並取消尚未開始的請求（不等待進行中的請求）"""
+        self.stopped.set()
+        self.forward_pool.shutdown(wait=False, cancel_futures=True)
+        self.reverse_pool.shutdown(wait=False, cancel_futures=True)
+
+    def close(self):
+        self.stop()
+        self.forward_pool.shutdown(wait=True)
+        self.reverse_pool.shutdown(wait=True)
+        self.session.close()
+
+
+class GeocodeJournal:
+    """
+    地理編碼檢查點日誌（append-only JSON Lines）
+    - 每筆結果附加一行，每 flush_every 筆寫入磁碟
+    - 中斷後可重新載入，同一地址以最後一筆紀錄為準
+    """
+
+    def __init__(self, path, flush_every=CHECKPOINT_EVERY, resume=False):
+        self.path = path
+        self.flush_every = flush_every
+        self.pending = 0
+        self.lock = threading.Lock()
+        # 非續跑模式重新開始日誌
+        self.file = open(path, 'a' if resume else 'w', encoding='utf-8')
+
+    def record(self, index, address, lat, lng, village):
+        line = json.dumps({'index': index, 'address': address, 'lat': lat,
+                           'lng': lng, 'village': village}, ensure_ascii=False)
+        with self.lock:
+            self.file.write(line + '\n')
+            self.pending += 1
+            if self.pending >= self.flush_every:
+                self._flush()
+
+    def _flush(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.pending = 0
+
+    def close(self):
+        with self.lock:
+            self._flush()
+            self.file.close()
+
+    @staticmethod
+    def load(path):
+        """讀取日誌，回傳 {地址: 紀錄}；中斷時寫到一半的最後一行會被略過"""
+        records = {}
+        if not os.path.exists(path):
+            return records
+        
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                records[record['address']] = record
+        return records
+
+
 def format_time(seconds):
     """將秒數轉換為小時分鐘秒數格式"""
     hours = int(seconds // 3600)
@@ -82,205 +638,399 @@ def format_time(seconds):
     else:
         return f"{secs}秒"
 
-print("開始處理資料")
-print("讀取資料")
-
-# data_a = pd.read_csv("/Users/ylin/Documents/vivian_lab/1124/q_lvr_land_a.csv", encoding='utf-8', skiprows=[1])
-# data_a = pd.read_csv("/Users/ylin/Documents/vivian_lab/1124/t_lvr_land_a.csv", encoding='utf-8', skiprows=[1])
-# data_a = pd.read_csv("/Users/ylin/Documents/vivian_lab/1124/u_lvr_land_a.csv", encoding='utf-8', skiprows=[1])
-data_a = pd.read_csv("/Users/ylin/Documents/vivian_lab/1131/p_lvr_land_a.csv", encoding='utf-8', skiprows=[1])
+def find_input_files(patterns):
+    """展開輸入路徑：資料夾取其中所有 *_lvr_land_a.csv，其餘視為檔案或萬用字元"""
+    files = []
+    for pattern in patterns:
+        if Path(pattern).is_dir():
+            files.extend(sorted(str(path) for path in Path(pattern).glob('*_lvr_land_a.csv')))
+        else:
+            files.extend(sorted(glob.glob(pattern)))
+    # 去除重複並保留順序
+    return list(dict.fromkeys(files))
 
-print(f"成功讀取 {len(data_a)} 筆資料")
 
-# 移除多餘欄位
-if 'The villages and towns urban district' in data_a.columns:
-    data_a = data_a.drop(['The villages and towns urban district'], axis=1)
-    print("已移除多餘的欄位")
+def default_output_path(input_file, output_dir=None, output_format='csv'):
+    """輸出檔名為 <原檔名>_cor.csv（或 .parquet），預設存放於與輸入資料夾同層的 <資料夾>_done"""
+    input_path = Path(input_file)
+    if output_dir is None:
+        # 取絕對路徑，目前資料夾下的檔名（例如 a_lvr_land_a.csv）的上層才有資料夾名稱
+        input_path = input_path.resolve()
+        output_dir = input_path.parent.with_name(input_path.parent.name + '_done')
+    return str(Path(output_dir) / f"{input_path.stem}_cor.{output_format}")
 
-# 檢查是否有交易標的欄位
-has_transaction_type = '交易標的' in data_a.columns
 
-# 地址清理
-print("開始地址清理...")
-data_a['土地位置建物門牌'] = data_a['土地位置建物門牌'].apply(normalize_address)
-print("地址清理完成")
+def add_partition_columns(data, input_file):
+    """
+    加入分割欄位
+    - 縣市代碼：檔名開頭的縣市代碼（例如 a_lvr_land_a.csv 為 A）
+    - 交易季度：由民國年交易年月日（例如 1130105）換算為西元季度（2024Q1），無法解析者為 unknown
+    """
+    data = data.copy()
+    data['縣市代碼'] = Path(input_file).name.split('_')[0].upper()
+    
+    if '交易年月日' in data.columns:
+        dates = pd.to_numeric(data['交易年月日'], errors='coerce')
+        year = dates // 10000 + 1911
+        month = dates // 100 % 100
+        valid = month.between(1, 12)
+        quarter = year.astype('Int64').astype('string') + 'Q' + ((month - 1) // 3 + 1).astype('Int64').astype('string')
+        data['交易季度'] = quarter.where(valid, 'unknown').fillna('unknown')
+    else:
+        data['交易季度'] = 'unknown'
+    return data
 
-# 初始化結果列表和失敗重試列表
-lat_list = [None] * len(data_a)
-lng_list = [None] * len(data_a)
-vil_list = [None] * len(data_a)
 
-failed_coordinates = []  # 儲存經緯度轉換失敗的索引
-failed_villages = []     # 儲存村里轉換失敗的索引
+def transaction_table(data):
+    """
+    轉為 Arrow 表格：TRANSACTION_NUMERIC_TYPES 中的欄位轉為數值（無法轉換者為空值），其餘為字串
+    """
+    if pa is None:
+        raise ImportError("Parquet 輸出需要安裝 pyarrow")
+    
+    fields = []
+    columns = {}
+    for column in data.columns:
+        arrow_type = TRANSACTION_NUMERIC_TYPES.get(column)
+        if arrow_type is None:
+            fields.append(pa.field(column, pa.string()))
+            columns[column] = data[column].astype('string')
+        else:
+            fields.append(pa.field(column, pa.type_for_alias(arrow_type)))
+            values = pd.to_numeric(data[column], errors='coerce')
+            columns[column] = values.astype('Int64' if arrow_type.startswith('int') else 'float64')
+    return pa.Table.from_pandas(pd.DataFrame(columns), schema=pa.schema(fields), preserve_index=False)
 
-print("地址轉經緯度和村里別")
 
-# 初始化 Nominatim
-geolocator = Nominatim(user_agent="geotest")
+def write_transactions(data, path, partition_cols=None, basename=None):
+    """
+    以 Arrow 寫出 Parquet
+    - partition_cols 指定時寫為分割資料夾（例如 縣市代碼=A/交易季度=2024Q1），
+      各分割內檔名以 basename 開頭，重跑同一輸入檔時覆寫其舊檔而不影響其他檔案
+    """
+    table = transaction_table(data)
+    if partition_cols:
+        pq.write_to_dataset(table, path, partition_cols=partition_cols,
+                            compression=PARQUET_COMPRESSION,
+                            basename_template=f"{basename or 'part'}-{{i}}.parquet",
+                            existing_data_behavior='overwrite_or_ignore')
+    else:
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        pq.write_table(table, path, compression=PARQUET_COMPRESSION)
 
-start_time = time.time()
-processed_count = 0
-skipped_land_count = 0
 
-print("=== 第一輪處理 ===")
-for i, row in data_a.iterrows():
-    address = row['土地位置建物門牌']
-    
-    # 檢查是否為土地交易（如果有交易標的欄位）
-    if has_transaction_type and row['交易標的'] == '土地':
-        skipped_land_count += 1
-        print(f"第 {i+1} 筆為土地交易，跳過地理編碼")
-        continue
-    
-    processed_count += 1
-    
-    # ArcGIS 地理編碼
-    lat, lng = get_coordinates(address)
+def read_transactions(path, columns=None, cities=None, quarters=None):
+    """
+    讀取 Parquet 交易資料（單檔或依縣市／季度分割的資料夾），只載入需要的欄位與分割
+    - cities、quarters：縣市代碼與交易季度列表，未指定時讀取全部
+    """
+    filters = []
+    if cities is not None:
+        filters.append(('縣市代碼', 'in', [city.upper() for city in cities]))
+    if quarters is not None:
+        filters.append(('交易季度', 'in', list(quarters)))
     
-    if lat and lng:
-        print(f"{address} -> {lat}, {lng}")
-        lat_list[i] = lat
-        lng_list[i] = lng
-        
-        # Nominatim 反向地理編碼 (1.2秒間隔)
-        # time.sleep(1.2)  # Nominatim API 間隔
-        time.sleep(0.9)
-        village = get_village(lat, lng, geolocator)
-        
-        if village:
-            vil_list[i] = village
-            print(f"第 {i+1} 筆完成，村里：{village}")
-        else:
-            failed_villages.append(i)
-            print(f"第 {i+1} 筆完成，村里轉換失敗")
-        
+    data = pd.read_parquet(path, columns=columns, filters=filters or None)
+    # 分割欄位讀回為類別，轉回字串
+    for column in PARTITION_COLUMNS:
+        if column in data.columns:
+            data[column] = data[column].astype('string')
+    return data
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="實價登錄地址轉經緯度與村里別")
+    parser.add_argument('inputs', nargs='+',
+                        help="輸入檔案、萬用字元（例如 '1131/*_lvr_land_a.csv'）或資料夾")
+    parser.add_argument('--output-dir', default=None,
+                        help="輸出資料夾，預設為輸入資料夾同層的 <資料夾>_done")
+    parser.add_argument('--output-format', choices=['parquet', 'csv'], default='parquet',
+                        help="各檔輸出格式")
+    parser.add_argument('--combined', default=None,
+                        help="合併所有輸出的 Parquet 檔路徑")
+    parser.add_argument('--dataset', default=None,
+                        help="依縣市代碼／交易季度分割的 Parquet 資料夾路徑")
+    parser.add_argument('--file-workers', type=int, default=4,
+                        help="同時處理的檔案數")
+    parser.add_argument('--cache', default=GEOCODE_CACHE_PATH,
+                        help="地理編碼快取檔路徑")
+    parser.add_argument('--village-boundary', default=VILLAGE_BOUNDARY_PATH,
+                        help="村里界圖（SHP 或 GeoJSON），指定後以離線方式比對村里")
+    parser.add_argument('--resume', action='store_true',
+                        help="從檢查點日誌續跑，只處理尚未完成的資料")
+    parser.add_argument('--checkpoint-every', type=int, default=CHECKPOINT_EVERY,
+                        help="每處理 N 筆將結果寫入日誌檔")
+    return parser.parse_args()
+
+
+def process_file(input_file, output_file, engine, village_index=None, resume=False,
+                 checkpoint_every=CHECKPOINT_EVERY):
+    """
+    處理單一實價登錄檔案
+    - engine、village_index 可由多個檔案共用（共用快取與限速）
+    - 回傳加入緯度、經度、村里欄位後的 DataFrame
+    """
+    print("開始處理資料")
+    print("讀取資料")
+
+    data_a = pd.read_csv(input_file, encoding='utf-8', skiprows=[1])
+
+    print(f"成功讀取 {input_file}: {len(data_a)} 筆資料")
+
+    Path(output_file).parent.mkdir(parents=True, exist_ok=True)
+    journal_path = output_file + '.journal.jsonl'
+
+    # 移除多餘欄位
+    if 'The villages and towns urban district' in data_a.columns:
+        data_a = data_a.drop(['The villages and towns urban district'], axis=1)
+        print("已移除多餘的欄位")
+
+    # 檢查是否有交易標的欄位
+    has_transaction_type = '交易標的' in data_a.columns
+
+    # 地址清理
+    print("開始地址清理...")
+    data_a['土地位置建物門牌'] = normalize_addresses(data_a['土地位置建物門牌'])
+    print("地址清理完成")
+
+    print("地址轉經緯度和村里別")
+
+    # 檢查是否為土地交易（如果有交易標的欄位），土地交易不做地理編碼
+    if has_transaction_type:
+        is_land = (data_a['交易標的'] == '土地').to_numpy()
     else:
-        failed_coordinates.append(i)
-        print(f"第 {i+1} 筆地址轉換失敗")
-    
-    # ArcGIS API 間隔控制
-    time.sleep(0.25)  # ArcGIS API 間隔
-    
-    # # 每10筆顯示進度
-    # if (i + 1) % 10 == 0:
-    #     print(f"已處理 {i+1} 筆")
-
-print(f"\n=== 第一輪完成 ===")
-print(f"經緯度轉換失敗: {len(failed_coordinates)} 筆")
-print(f"村里轉換失敗: {len(failed_villages)} 筆")
-
-# 重試失敗的經緯度轉換
-if failed_coordinates:
-    print(f"\n=== 重試經緯度轉換 ({len(failed_coordinates)} 筆) ===")
-    retry_failed_coordinates = []
-    
-    for i, index in enumerate(failed_coordinates):
-        address = data_a.iloc[index]['土地位置建物門牌']
-        print(f"重試第 {i+1}/{len(failed_coordinates)} 筆: {address}")
-        
-        lat, lng = get_coordinates(address)
-        
-        if lat and lng:
-            print(f"重試成功: {address} -> {lat}, {lng}")
-            lat_list[index] = lat
-            lng_list[index] = lng
-            
-            # 為重試成功的地址也嘗試取得村里
-            time.sleep(1)  # Nominatim API 間隔
-            village = get_village(lat, lng, geolocator)
-            
-            if village:
-                vil_list[index] = village
-                print(f"村里：{village}")
-            else:
-                failed_villages.append(index)
-                print(f"村里轉換失敗")
-        else:
-            retry_failed_coordinates.append(index)
-            print(f"重試仍失敗")
-        
-        time.sleep(0.25)  # ArcGIS API 間隔
-    
-    failed_coordinates = retry_failed_coordinates
+        is_land = np.zeros(len(data_a), dtype=bool)
+    skipped_land_count = int(is_land.sum())
+    processed_count = len(data_a) - skipped_land_count
 
-# 重試失敗的村里轉換
-if failed_villages:
-    print(f"\n=== 重試村里轉換 ({len(failed_villages)} 筆) ===")
-    retry_failed_villages = []
-    
-    for i, index in enumerate(failed_villages):
-        # 只重試有經緯度的項目
-        if lat_list[index] is not None and lng_list[index] is not None:
-            lat, lng = lat_list[index], lng_list[index]
-            print(f"重試村里第 {i+1}/{len(failed_villages)} 筆: {lat}, {lng}")
-            
-            time.sleep(1)  # Nominatim API 間隔
-            village = get_village(lat, lng, geolocator)
-            
-            if village:
-                vil_list[index] = village
-                print(f"重試成功，村里：{village}")
+    # 地址去重：每個不重複地址只查詢一次，結果再合併回所有相同地址的資料
+    target_addresses = data_a.loc[~is_land, '土地位置建物門牌']
+    addresses = target_addresses.dropna().unique().tolist()
+    dedup_ratio = 1 - len(addresses) / processed_count if processed_count else 0.0
+    print(f"待處理 {processed_count} 筆，不重複地址 {len(addresses)} 筆，去重比例 {dedup_ratio:.1%}")
+
+    # 初始化結果列表和失敗重試列表（以不重複地址為單位）
+    lat_list = [None] * len(addresses)
+    lng_list = [None] * len(addresses)
+    vil_list = [None] * len(addresses)
+
+    failed_coordinates = []  # 儲存經緯度轉換失敗的地址索引
+    failed_villages = []     # 儲存村里轉換失敗的地址索引
+
+    # 續跑模式：讀取檢查點日誌
+    checkpoint = GeocodeJournal.load(journal_path) if resume else {}
+    journal = GeocodeJournal(journal_path, flush_every=checkpoint_every, resume=resume)
+
+    start_time = time.time()
+
+    # 以 try/finally 確保中斷（例如 Ctrl-C）時檢查點日誌仍會寫入磁碟
+    try:
+        print("=== 第一輪處理 ===")
+        targets = list(enumerate(addresses))
+
+        # 已在檢查點中的地址直接還原，失敗者交給後續重試流程
+        restored = {}
+        for index, address in targets:
+            record = checkpoint.get(address)
+            if record is not None:
+                restored[index] = (record['lat'], record['lng'], record['village'])
+        if restored:
+            print(f"從檢查點還原 {len(restored)} 筆，剩餘 {len(targets) - len(restored)} 筆待處理")
+            targets = [(index, address) for index, address in targets if index not in restored]
+
+        results = engine.geocode(targets, journal=journal)
+        results.update(restored)
+
+        for index, (lat, lng, village) in results.items():
+            if lat and lng:
+                lat_list[index] = lat
+                lng_list[index] = lng
+                if village:
+                    vil_list[index] = village
+                elif village_index is None:
+                    failed_villages.append(index)
             else:
-                retry_failed_villages.append(index)
-                print(f"重試仍失敗")
-        else:
-            print(f"跳過第 {i+1} 筆（無經緯度）")
+                failed_coordinates.append(index)
+
+        print(f"\n=== 第一輪完成 ===")
+        print(f"經緯度轉換失敗: {len(failed_coordinates)} 筆")
+        print(f"村里轉換失敗: {len(failed_villages)} 筆")
+
+        # 重試失敗的經緯度轉換（略過快取中的失敗結果，直接重新查詢）
+        if failed_coordinates:
+            print(f"\n=== 重試經緯度轉換 ({len(failed_coordinates)} 筆) ===")
+            retry_failed_coordinates = []
+
+            retry_items = [(index, addresses[index]) for index in failed_coordinates]
+            for index, (lat, lng, village) in engine.geocode(retry_items, refresh=True, journal=journal).items():
+                if lat and lng:
+                    lat_list[index] = lat
+                    lng_list[index] = lng
+                    if village:
+                        vil_list[index] = village
+                    elif village_index is None:
+                        failed_villages.append(index)
+                else:
+                    retry_failed_coordinates.append(index)
+
+            failed_coordinates = retry_failed_coordinates
+
+        # 離線村里比對：所有座標一次查詢
+        if village_index is not None:
+            print("\n=== 離線村里比對 ===")
+            vil_list = village_index.lookup(lat_list, lng_list)
+
+        # 重試失敗的村里轉換（僅線上模式）
+        if failed_villages and village_index is None:
+            print(f"\n=== 重試村里轉換 ({len(failed_villages)} 筆) ===")
+            retry_items = [(index, addresses[index], lat_list[index], lng_list[index])
+                           for index in failed_villages]
+            villages = engine.geocode_villages(retry_items, journal=journal)
+
+            for index, village in villages.items():
+                if village:
+                    vil_list[index] = village
+    finally:
+        journal.close()
+
+    end_time = time.time()
+    total_time = end_time - start_time
+    print(f"\n{input_file} 執行時間：{format_time(total_time)}")
+
+    # 將不重複地址的結果合併回每一筆交易（土地交易不填）
+    geocoded = pd.DataFrame({
+        '土地位置建物門牌': addresses,
+        '緯度': pd.array(lat_list, dtype='Float64'),
+        '經度': pd.array(lng_list, dtype='Float64'),
+        '村里': pd.array(vil_list, dtype=object),
+    })
+    matched = target_addresses.to_frame().merge(geocoded, on='土地位置建物門牌', how='left')
+    matched.index = target_addresses.index
+    matched = matched.reindex(data_a.index)
+
+    # 將新欄位插入到指定位置
+    # 找到土地位置建物門牌欄位的位置
+    address_col_index = data_a.columns.get_loc('土地位置建物門牌')
+
+    # 將新欄位資料加入 DataFrame
+    new_data = data_a.copy()
+    new_data.insert(address_col_index + 1, '緯度', matched['緯度'].astype(float))
+    new_data.insert(address_col_index + 2, '經度', matched['經度'].astype(float))
+    new_data.insert(address_col_index + 3, '村里', matched['村里'])
+
+    # 以交易筆為單位統計失敗的資料
+    has_coordinate = new_data['緯度'].notna().to_numpy()
+    has_village = new_data['村里'].notna().to_numpy()
+    failed_coordinates = np.flatnonzero(~is_land & ~has_coordinate).tolist()
+    failed_villages = np.flatnonzero(has_coordinate & ~has_village).tolist()
+
+    print(f"\n==={input_file} 處理結果===")
+    print(f"總筆數: {len(data_a)}")
+    if has_transaction_type:
+        print(f"土地交易跳過筆數: {skipped_land_count}")
+    print(f"實際處理筆數: {processed_count}")
+    print(f"不重複地址筆數: {len(addresses)} (去重比例 {dedup_ratio:.1%})")
+    print(f"成功取得經緯度筆數: {int(has_coordinate.sum())}")
+    print(f"成功取得村里筆數: {int(has_village.sum())}")
+    print(f"最終失敗經緯度筆數: {len(failed_coordinates)}")
+    print(f"最終失敗村里筆數: {len(failed_villages)}")
+
+    # 顯示失敗的地址
+    if failed_coordinates:
+        print(f"\n===經緯度轉換失敗的地址 ({len(failed_coordinates)} 筆)===")
+        for i, index in enumerate(failed_coordinates[:]):  # 只顯示前10筆
+            address = data_a.iloc[index]['土地位置建物門牌']
+            print(f"{i+1}. 第{index+1}筆: {address}")
+        if len(failed_coordinates) > 10:
+            print(f"... 還有 {len(failed_coordinates) - 10} 筆")
+
+    if failed_villages:
+        print(f"\n===村里轉換失敗的地址 ({len(failed_villages)} 筆)===")
+        for i, index in enumerate(failed_villages[:]):  # 只顯示前10筆
+            address = data_a.iloc[index]['土地位置建物門牌']
+            lat, lng = new_data.iloc[index]['緯度'], new_data.iloc[index]['經度']
+            print(f"{i+1}. 第{index+1}筆: {address} (座標: {lat}, {lng})")
+        if len(failed_villages) > 10:
+            print(f"... 還有 {len(failed_villages) - 10} 筆")
+
+    # 儲存結果
+    if output_file.endswith('.parquet'):
+        write_transactions(new_data, output_file)
+    else:
+        new_data.to_csv(output_file, index=False, encoding='utf-8-sig')
+    print(f"\n資料已儲存至: {output_file}")
+
+    print("\n===處理結果預覽===")
+    preview_columns = ['土地位置建物門牌', '緯度', '經度', '村里']
+    if has_transaction_type:
+        preview_columns = ['交易標的'] + preview_columns
+    available_columns = [col for col in preview_columns if col in new_data.columns]
+    print(new_data[available_columns].head())
+
+    return new_data
+
+
+def main():
+    args = parse_args()
     
-    failed_villages = retry_failed_villages
-
-end_time = time.time()
-total_time = end_time - start_time
-print(f"\n執行時間：{format_time(total_time)}")
-
-# 將新欄位插入到指定位置
-# 找到土地位置建物門牌欄位的位置
-address_col_index = data_a.columns.get_loc('土地位置建物門牌')
-
-# 將新欄位資料加入 DataFrame
-new_data = data_a.copy()
-new_data.insert(address_col_index + 1, '緯度', lat_list)
-new_data.insert(address_col_index + 2, '經度', lng_list)
-new_data.insert(address_col_index + 3, '村里', vil_list)
-
-print("\n===處理結果===")
-print(f"總筆數: {len(data_a)}")
-if has_transaction_type:
-    print(f"土地交易跳過筆數: {skipped_land_count}")
-print(f"實際處理筆數: {processed_count}")
-print(f"成功取得經緯度筆數: {len([x for x in lat_list if x is not None])}")
-print(f"成功取得村里筆數: {len([x for x in vil_list if x is not None])}")
-print(f"最終失敗經緯度筆數: {len(failed_coordinates)}")
-print(f"最終失敗村里筆數: {len(failed_villages)}")
-
-# 顯示失敗的地址
-if failed_coordinates:
-    print(f"\n===經緯度轉換失敗的地址 ({len(failed_coordinates)} 筆)===")
-    for i, index in enumerate(failed_coordinates[:]):  # 只顯示前10筆
-        address = data_a.iloc[index]['土地位置建物門牌']
-        print(f"{i+1}. 第{index+1}筆: {address}")
-    if len(failed_coordinates) > 10:
-        print(f"... 還有 {len(failed_coordinates) - 10} 筆")
-
-if failed_villages:
-    print(f"\n===村里轉換失敗的地址 ({len(failed_villages)} 筆)===")
-    for i, index in enumerate(failed_villages[:]):  # 只顯示前10筆
-        address = data_a.iloc[index]['土地位置建物門牌']
-        lat, lng = lat_list[index], lng_list[index]
-        print(f"{i+1}. 第{index+1}筆: {address} (座標: {lat}, {lng})")
-    if len(failed_villages) > 10:
-        print(f"... 還有 {len(failed_villages) - 10} 筆")
-
-# 儲存結果
-# output_file = '/Users/ylin/Documents/vivian_lab/1124_done/q_lvr_land_a_cor.csv'
-# output_file = '/Users/ylin/Documents/vivian_lab/1124_done/t_lvr_land_a_cor.csv'
-output_file = '/Users/ylin/Documents/vivian_lab/1131_done/p_lvr_land_a_cor.csv' 
-
-new_data.to_csv(output_file, index=False, encoding='utf-8-sig')
-print(f"\n資料已儲存至: {output_file}")
-
-print("\n===處理結果預覽===")
-preview_columns = ['土地位置建物門牌', '緯度', '經度', '村里']
-if has_transaction_type:
-    preview_columns = ['交易標的'] + preview_columns
-available_columns = [col for col in preview_columns if col in new_data.columns]
-print(new_data[available_columns].head())
\ No newline at end of file
+    input_files = find_input_files(args.inputs)
+    if not input_files:
+        print("找不到任何輸入檔案")
+        return
+    print(f"共 {len(input_files)} 個檔案待處理")
+
+    # 所有檔案共用同一組村里索引、快取與地理編碼引擎（含限速器）
+    village_index = VillageIndex(args.village_boundary) if args.village_boundary else None
+    geolocator = Nominatim(user_agent="geotest") if village_index is None else None
+    cache = GeocodeCache(args.cache)
+    engine = GeocodingEngine(cache=cache, geolocator=geolocator)
+
+    start_time = time.time()
+    outputs = {}
+    file_pool = ThreadPoolExecutor(max_workers=args.file_workers)
+    try:
+        futures = {
+            file_pool.submit(process_file, input_file,
+                             default_output_path(input_file, args.output_dir, args.output_format),
+                             engine, village_index, args.resume,
+                             args.checkpoint_every): input_file
+            for input_file in input_files
+        }
+        for future in as_completed(futures):
+            outputs[futures[future]] = future.result()
+    except KeyboardInterrupt:
+        # Ctrl-C 只送到主執行緒：設定中斷旗標並取消尚未開始的請求與檔案，各檔案執行緒
+        # 取得 CancelledError 後由其 finally 寫入檢查點日誌，等這些執行緒結束後才等待進行中的請求
+        print("\n中斷處理，寫入檢查點日誌...")
+        engine.stop()
+        file_pool.shutdown(wait=True, cancel_futures=True)
+        raise
+    finally:
+        file_pool.shutdown(wait=True)
+        engine.close()
+        cache.close()
+
+    print(f"\n全部執行時間：{format_time(time.time() - start_time)}")
+    print(f"快取命中: {cache.hits} 筆，未命中: {cache.misses} 筆")
+
+    # 依縣市代碼／交易季度寫出分割資料集，各輸入檔以「資料夾_檔名」為檔名開頭
+    if args.dataset:
+        for input_file in input_files:
+            input_path = Path(input_file)
+            write_transactions(add_partition_columns(outputs[input_file], input_file), args.dataset,
+                               partition_cols=PARTITION_COLUMNS,
+                               basename=f"{input_path.parent.name}_{input_path.stem}")
+        print(f"分割資料集已儲存至: {args.dataset}")
+
+    # 合併所有輸出為單一欄式資料集
+    if args.combined:
+        combined = pd.concat(
+            [add_partition_columns(outputs[input_file], input_file).assign(來源檔案=Path(input_file).name)
+             for input_file in input_files],
+            ignore_index=True
+        )
+        write_transactions(combined, args.combined)
+        print(f"合併資料 {len(combined)} 筆已儲存至: {args.combined}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+import pandas as pd
+import numpy as np
+import time
+import json
+import hashlib
+import argparse
+from pathlib import Path
+
+from gwqr import project_coordinates
+from spatial_features import read_table, array_digest
+
+try:
+    from sklearn.cluster import MiniBatchKMeans
+except ImportError:  # 僅 k-means 區塊需要
+    MiniBatchKMeans = None
+
+
+# 空間區塊交叉驗證設定
+SPATIAL_CV_METHODS = ('grid', 'kmeans', 'village')
+SPATIAL_FOLDS = 5
+GRID_CELL_KM = 1.0                # 網格區塊邊長（公里）
+KMEANS_BLOCKS = 100               # k-means 區塊數
+FOLD_COLUMN = '空間折'
+BLOCK_COLUMN = '空間區塊'
+
+
+class SpatialBlockCV:
+    """
+    空間區塊交叉驗證
+    - 先將交易分為空間區塊（網格、k-means 或 村里），再以區塊為單位分折，同一區塊的交易必在同一折
+    - 區塊與分折皆為向量化計算；分折依區塊大小由大至小放入目前筆數最少的折，使各折筆數接近
+    - 缺座標（網格、k-means）或缺村里者區塊與折別為 -1
+    """
+
+    def __init__(self, method='grid', n_splits=SPATIAL_FOLDS, cell_km=GRID_CELL_KM, n_blocks=KMEANS_BLOCKS, seed=0):
+        if method not in SPATIAL_CV_METHODS:
+            raise ValueError(f"未知的空間區塊方式: {method}")
+        self.method = method
+        self.n_splits = n_splits
+        self.cell_km = float(cell_km)
+        self.n_blocks = n_blocks
+        self.seed = seed
+
+    def params(self):
+        return {'method': self.method, 'n_splits': self.n_splits, 'cell_km': self.cell_km,
+                'n_blocks': self.n_blocks, 'seed': self.seed}
+
+    def blocks(self, data):
+        """各列的空間區塊編號"""
+        labels = np.full(len(data), -1, dtype=np.int64)
+
+        if self.method == 'village':
+            keys = data['村里'].astype('string')
+            if '鄉鎮市區' in data.columns:
+                # 不同鄉鎮市區可能有同名村里
+                keys = data['鄉鎮市區'].astype('string') + keys
+            codes, _ = pd.factorize(keys)
+            labels[:] = codes
+            return labels
+
+        lats = pd.to_numeric(data['緯度'], errors='coerce').to_numpy(dtype=float)
+        lngs = pd.to_numeric(data['經度'], errors='coerce').to_numpy(dtype=float)
+        valid = ~(np.isnan(lats) | np.isnan(lngs))
+        if not valid.any():
+            return labels
+        coords = project_coordinates(lats[valid], lngs[valid])
+
+        if self.method == 'grid':
+            cells = np.floor(coords / self.cell_km).astype(np.int64)
+            _, labels[valid] = np.unique(cells, axis=0, return_inverse=True)
+        else:
+            if MiniBatchKMeans is None:
+                raise ImportError("k-means 空間區塊需要安裝 scikit-learn")
+            n_blocks = min(self.n_blocks, int(valid.sum()))
+            kmeans = MiniBatchKMeans(n_clusters=n_blocks, random_state=self.seed, n_init=3, batch_size=4096)
+            labels[valid] = kmeans.fit_predict(coords)
+        return labels
+
+    def assign_folds(self, blocks):
+        """以區塊為單位分折，回傳各列的折別"""
+        folds = np.full(len(blocks), -1, dtype=np.int64)
+        valid = blocks >= 0
+        if not valid.any():
+            return folds
+        sizes = np.bincount(blocks[valid])
+
+        # 隨機打散後依大小穩定排序，同大小的區塊不依編號順序分配
+        order = np.random.default_rng(self.seed).permutation(len(sizes))
+        order = order[np.argsort(-sizes[order], kind='stable')]
+        block_fold = np.empty(len(sizes), dtype=np.int64)
+        totals = np.zeros(self.n_splits, dtype=np.int64)
+        for block in order:
+            fold = int(np.argmin(totals))
+            block_fold[block] = fold
+            totals[fold] += sizes[block]
+
+        folds[valid] = block_fold[blocks[valid]]
+        return folds
+
+    def assign(self, data):
+        """回傳區塊與折別表（與 data 同索引）"""
+        blocks = self.blocks(data)
+        folds = self.assign_folds(blocks)
+        return pd.DataFrame({BLOCK_COLUMN: blocks, FOLD_COLUMN: folds}, index=data.index)
+
+    def source_columns(self, data):
+        if self.method == 'village':
+            return [column for column in ('鄉鎮市區', '村里') if column in data.columns]
+        return ['緯度', '經度']
+
+    def folds_path(self, data, dataset_path):
+        """
+        分折檔路徑：與資料集同資料夾，檔名含分折方式與鍵
+        - 鍵由分折參數與區塊依據欄位的內容雜湊而成，資料或參數改變時自動對應新檔
+        """
+        if self.method == 'village':
+            values = [data[column].astype('string').fillna('').to_numpy().astype('U')
+                      for column in self.source_columns(data)]
+        else:
+            values = [pd.to_numeric(data[column], errors='coerce').to_numpy(dtype=float)
+                      for column in self.source_columns(data)]
+        payload = json.dumps({'params': self.params(), 'data': array_digest(*values)}, sort_keys=True)
+        key = hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+        dataset_path = Path(dataset_path)
+        stem = dataset_path.name if dataset_path.is_dir() else dataset_path.stem
+        return dataset_path.parent / f"{stem}.folds-{self.method}-{key}.parquet"
+
+    def load_or_assign(self, data, dataset_path):
+        """讀取與資料集並存的分折檔，不存在時計算並儲存，回傳區塊與折別表（與 data 同索引）"""
+        path = self.folds_path(data, dataset_path)
+        if path.exists():
+            print(f"使用既有的空間分折: {path}")
+            assignment = pd.read_parquet(path)
+            assignment.index = data.index
+            return assignment
+
+        start_time = time.time()
+        assignment = self.assign(data)
+        assignment.reset_index(drop=True).to_parquet(path, index=False)
+        counts = assignment.loc[assignment[FOLD_COLUMN] >= 0, FOLD_COLUMN].value_counts().sort_index()
+        print(f"空間分折（{self.method}）：{assignment[BLOCK_COLUMN].max() + 1} 個區塊，"
+              f"各折筆數 {counts.tolist()}，耗時 {time.time() - start_time:.1f} 秒")
+        print(f"空間分折已儲存至: {path}")
+        return assignment
+
+    def split(self, folds):
+        """依折別產生 (訓練列, 驗證列)，折別為 -1 者不參與"""
+        folds = np.asarray(folds)
+        for fold in np.unique(folds[folds >= 0]):
+            yield np.flatnonzero((folds >= 0) & (folds != fold)), np.flatnonzero(folds == fold)
+
+
+def add_cv_arguments(parser):
+    """加入空間區塊交叉驗證的命令列參數（stacking.py、gwqr.py 共用）"""
+    parser.add_argument('--spatial-cv', choices=list(SPATIAL_CV_METHODS), default=None,
+                        help="空間區塊交叉驗證：網格、k-means 或村里，分折檔存於資料集旁")
+    parser.add_argument('--cv-folds', type=int, default=SPATIAL_FOLDS,
+                        help="空間分折數")
+    parser.add_argument('--cell-km', type=float, default=GRID_CELL_KM,
+                        help="網格區塊邊長（公里）")
+    parser.add_argument('--blocks', type=int, default=KMEANS_BLOCKS,
+                        help="k-means 區塊數")
+
+
+def folds_from_args(args, data, dataset_path):
+    """依命令列參數讀取或計算空間分折，回傳與 data 同索引的折別 Series，未指定時回傳 None"""
+    if not args.spatial_cv:
+        return None
+    cv = SpatialBlockCV(args.spatial_cv, args.cv_folds, args.cell_km, args.blocks)
+    return cv.load_or_assign(data, dataset_path)[FOLD_COLUMN]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="計算並儲存空間區塊交叉驗證的分折")
+    parser.add_argument('data',
+                        help="含緯度、經度（或村里）欄位的資料（Parquet 或 CSV）")
+    parser.add_argument('--method', choices=list(SPATIAL_CV_METHODS), default='grid',
+                        help="空間區塊方式")
+    parser.add_argument('--folds', type=int, default=SPATIAL_FOLDS,
+                        help="分折數")
+    parser.add_argument('--cell-km', type=float, default=GRID_CELL_KM,
+                        help="網格區塊邊長（公里）")
+    parser.add_argument('--blocks', type=int, default=KMEANS_BLOCKS,
+                        help="k-means 區塊數")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    data = read_table(args.data)
+    print(f"讀取 {len(data)} 筆資料")
+    SpatialBlockCV(args.method, args.folds, args.cell_km, args.blocks).load_or_assign(data, args.data)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,368 @@
+import pandas as pd
+import numpy as np
+import hashlib
+import argparse
+from pathlib import Path
+
+try:
+    from sklearn.neighbors import BallTree
+except ImportError:  # 僅空間特徵需要
+    BallTree = None
+
+try:
+    import geopandas as gpd
+except ImportError:  # 僅讀取 SHP、GeoJSON 圖層需要
+    gpd = None
+
+
+EARTH_RADIUS_KM = 6371.0088
+
+# 測站氣候指標插值設定
+IDW_K = 4                         # 每筆交易取最近的 k 個測站
+IDW_POWER = 2.0                   # 反距離權重次方，0 即 k 個最近測站的平均
+FEATURE_CACHE_DIR = "feature_cache"
+CLIMATE_PREFIX = '氣候_'
+
+# 設施距離特徵設定
+POI_RADII_KM = (0.5, 1.0)         # 計算範圍內設施數量的半徑（公里）
+POI_K = 3                         # 最近 k 處設施的平均距離
+POI_CHUNK_SIZE = 200000           # 每批查詢的交易筆數，限制暫存陣列大小
+GEO_SUFFIXES = ('.shp', '.geojson', '.gpkg', '.json')
+
+# 測站清單欄位別名（中央氣象署測站清單與本專案輸出的欄位名稱）
+STATION_COLUMN_ALIASES = {
+    '站號': 'stno', 'StationID': 'stno', 'station_id': 'stno',
+    '緯度': '緯度', 'lat': '緯度', 'Latitude': '緯度', 'latitude': '緯度',
+    '經度': '經度', 'lng': '經度', 'lon': '經度', 'Longitude': '經度', 'longitude': '經度',
+}
+
+
+def read_table(path):
+    """依副檔名讀取 Parquet（檔案或分割資料夾）或 CSV"""
+    path = Path(path)
+    if path.is_dir() or path.suffix == '.parquet':
+        return pd.read_parquet(path)
+    return pd.read_csv(path, encoding='utf-8-sig')
+
+
+def load_station_coordinates(path):
+    """
+    讀取測站座標，回傳 stno、緯度、經度 三欄
+    - 欄位名稱依 STATION_COLUMN_ALIASES 對應，缺座標的測站略過
+    """
+    stations = read_table(path)
+    stations = stations.rename(columns={column: STATION_COLUMN_ALIASES[column]
+                                        for column in stations.columns if column in STATION_COLUMN_ALIASES})
+    missing = {'stno', '緯度', '經度'} - set(stations.columns)
+    if missing:
+        raise ValueError(f"測站清單缺少欄位: {sorted(missing)}")
+
+    stations = stations[['stno', '緯度', '經度']].copy()
+    stations['stno'] = stations['stno'].astype(str).str.strip()
+    stations['緯度'] = pd.to_numeric(stations['緯度'], errors='coerce')
+    stations['經度'] = pd.to_numeric(stations['經度'], errors='coerce')
+    stations = stations.dropna(subset=['緯度', '經度']).drop_duplicates('stno').reset_index(drop=True)
+    print(f"已載入 {len(stations)} 個測站座標")
+    return stations
+
+
+def array_digest(*arrays):
+    """以陣列內容計算雜湊，作為快取鍵"""
+    digest = hashlib.sha256()
+    for array in arrays:
+        array = np.ascontiguousarray(array)
+        digest.update(str(array.dtype).encode())
+        digest.update(str(array.shape).encode())
+        digest.update(array.tobytes())
+    return digest.hexdigest()[:16]
+
+
+class StationIDW:
+    """
+    測站氣候指標的空間插值（haversine BallTree）
+    - 以測站座標建立一次 BallTree，所有交易座標單次批次查詢最近的 k 個測站
+    - 權重為反距離 1/d^power，交易恰在測站上時只取該測站
+    - 近鄰與權重依 (測站集合, k, power, 交易座標) 快取於記憶體與 cache_dir，指標更新時不需重新查詢
+    """
+
+    def __init__(self, stations, k=IDW_K, power=IDW_POWER, cache_dir=FEATURE_CACHE_DIR):
+        if BallTree is None:
+            raise ImportError("空間特徵需要安裝 scikit-learn")
+
+        self.stations = stations.reset_index(drop=True)
+        self.k = min(k, len(self.stations))
+        self.power = power
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+
+        coordinates = np.radians(self.stations[['緯度', '經度']].to_numpy(dtype=float))
+        self.station_key = array_digest(self.stations['stno'].to_numpy(dtype=str), coordinates)
+        self.tree = BallTree(coordinates, metric='haversine')
+        self._memory = {}
+
+    def neighbors(self, lats, lngs):
+        """
+        查詢每個座標最近的 k 個測站，回傳 (測站位置, 距離 km, 權重)，皆為 (n, k) 陣列
+        - 缺座標者的位置為 -1、距離與權重為 NA
+        """
+        points = np.column_stack([np.asarray(lats, dtype=float), np.asarray(lngs, dtype=float)])
+        key = f"{self.station_key}_k{self.k}_p{self.power:g}_{array_digest(points)}"
+        if key in self._memory:
+            return self._memory[key]
+
+        cache_path = self.cache_dir / f"idw_{key}.npz" if self.cache_dir else None
+        if cache_path is not None and cache_path.exists():
+            cached = np.load(cache_path)
+            result = (cached['index'], cached['distance'], cached['weight'])
+            self._memory[key] = result
+            return result
+
+        valid = ~np.isnan(points).any(axis=1)
+        index = np.full((len(points), self.k), -1, dtype=np.int64)
+        distance = np.full((len(points), self.k), np.nan)
+        weight = np.full((len(points), self.k), np.nan)
+
+        if valid.any():
+            arc, nearest = self.tree.query(np.radians(points[valid]), k=self.k)
+            km = arc * EARTH_RADIUS_KM
+            with np.errstate(divide='ignore'):
+                raw_weight = 1.0 / km ** self.power
+            # 恰在測站上（距離為 0）時只取該測站
+            exact = km == 0
+            on_station = exact.any(axis=1)
+            raw_weight[on_station] = exact[on_station].astype(float)
+
+            index[valid] = nearest
+            distance[valid] = km
+            weight[valid] = raw_weight
+
+        result = (index, distance, weight)
+        self._memory[key] = result
+        if cache_path is not None:
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            np.savez(cache_path, index=index, distance=distance, weight=weight)
+        return result
+
+    def interpolate(self, lats, lngs, station_values):
+        """
+        以反距離權重插值測站指標
+        - station_values：以 stno 為索引的指標表，列順序不需與測站清單相同
+        - 測站指標為 NA 時，以其餘近鄰測站的權重重新正規化；全部為 NA 時結果為 NA
+        """
+        index, _, weight = self.neighbors(lats, lngs)
+        values = station_values.reindex(self.stations['stno']).to_numpy(dtype=float)
+        lookup = np.where(index >= 0, index, 0)
+
+        # 逐指標計算，暫存陣列維持 (n, k)：缺座標者的位置為 -1，以 NA 取代
+        result = {}
+        for position, column in enumerate(station_values.columns):
+            neighbor_values = values[lookup, position]
+            neighbor_values[index < 0] = np.nan
+            usable = ~np.isnan(neighbor_values)
+            weights = np.where(usable, weight, 0.0)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                result[column] = (np.where(usable, neighbor_values, 0.0) * weights).sum(axis=1) / weights.sum(axis=1)
+        return pd.DataFrame(result)
+
+
+def join_climate_features(transactions, stations, climate_stats, k=IDW_K, power=IDW_POWER,
+                          period=None, cache_dir=FEATURE_CACHE_DIR, engine=None):
+    """
+    將測站氣候指標以反距離權重插值至每筆交易
+    - transactions 需有 緯度、經度 欄位；climate_stats 為 station_climate_statistics，以 stno 為鍵
+    - climate_stats 含「期間」欄位（逐年統計）時需指定 period
+    - 新增欄位：氣候_<指標>、最近測站、最近測站距離_km
+    - engine：可傳入既有的 StationIDW 以共用 BallTree 與快取
+    """
+    if '期間' in climate_stats.columns:
+        if period is None:
+            raise ValueError(f"氣候統計含多個期間，需指定 period: {climate_stats['期間'].unique().tolist()}")
+        climate_stats = climate_stats[climate_stats['期間'].astype(str) == str(period)]
+
+    indicators = (climate_stats.assign(stno=climate_stats['stno'].astype(str))
+                  .drop(columns=['期間'], errors='ignore')
+                  .drop_duplicates('stno')
+                  .set_index('stno')
+                  .select_dtypes(include='number'))
+
+    # 只用有氣候統計的測站建樹，避免近鄰落在沒有資料的測站
+    stations = stations[stations['stno'].isin(indicators.index)]
+    if engine is None:
+        engine = StationIDW(stations, k=k, power=power, cache_dir=cache_dir)
+    print(f"以 {len(engine.stations)} 個測站、k={engine.k}、power={engine.power:g} 插值 {indicators.shape[1]} 個氣候指標")
+
+    lats = pd.to_numeric(transactions['緯度'], errors='coerce').to_numpy(dtype=float)
+    lngs = pd.to_numeric(transactions['經度'], errors='coerce').to_numpy(dtype=float)
+    features = engine.interpolate(lats, lngs, indicators).add_prefix(CLIMATE_PREFIX)
+
+    index, distance, _ = engine.neighbors(lats, lngs)
+    station_ids = engine.stations['stno'].to_numpy(dtype=object)
+    features['最近測站'] = np.where(index[:, 0] >= 0, station_ids[np.maximum(index[:, 0], 0)], None)
+    features['最近測站距離_km'] = distance[:, 0]
+
+    features.index = transactions.index
+    return pd.concat([transactions, features], axis=1)
+
+
+def load_poi_layer(path):
+    """
+    讀取設施圖層，回傳 緯度、經度 兩欄
+    - CSV、Parquet：欄位名稱依 STATION_COLUMN_ALIASES 對應（例如 lat/lng、Latitude/Longitude）
+    - SHP、GeoJSON、GPKG：轉為經緯度，面或線圖層取其中心點
+    """
+    path = Path(path)
+    if path.suffix.lower() in GEO_SUFFIXES:
+        if gpd is None:
+            raise ImportError("讀取 SHP、GeoJSON 圖層需要安裝 geopandas")
+        layer = gpd.read_file(path)
+        if layer.crs is not None and layer.crs.to_epsg() != 4326:
+            layer = layer.to_crs(epsg=4326)
+        layer = layer[layer.geometry.notna() & ~layer.geometry.is_empty]
+        points = layer.geometry.representative_point()
+        poi = pd.DataFrame({'緯度': points.y.to_numpy(), '經度': points.x.to_numpy()})
+    else:
+        poi = read_table(path)
+        poi = poi.rename(columns={column: STATION_COLUMN_ALIASES[column]
+                                  for column in poi.columns if column in STATION_COLUMN_ALIASES})
+        missing = {'緯度', '經度'} - set(poi.columns)
+        if missing:
+            raise ValueError(f"設施圖層 {path} 缺少欄位: {sorted(missing)}")
+        poi = poi[['緯度', '經度']].apply(pd.to_numeric, errors='coerce')
+
+    return poi.dropna().reset_index(drop=True)
+
+
+class PoiLayer:
+    """
+    單一設施圖層的空間索引
+    - 載入時建立一次 haversine BallTree，之後各批交易座標共用
+    """
+
+    def __init__(self, name, poi):
+        if BallTree is None:
+            raise ImportError("空間特徵需要安裝 scikit-learn")
+        if len(poi) == 0:
+            raise ValueError(f"設施圖層 {name} 沒有任何座標")
+
+        self.name = name
+        self.size = len(poi)
+        self.tree = BallTree(np.radians(poi[['緯度', '經度']].to_numpy(dtype=float)), metric='haversine')
+        print(f"已建立設施圖層 {name}: {self.size} 處")
+
+    def features(self, lats, lngs, radii_km=POI_RADII_KM, k=POI_K):
+        """
+        計算一批座標（不可含 NA）的設施距離特徵
+        - 最近距離、半徑內數量、最近 k 處平均距離，距離單位皆為公里
+        """
+        points = np.radians(np.column_stack([lats, lngs]))
+        k = min(k, self.size)
+        arc, _ = self.tree.query(points, k=k)
+        km = arc * EARTH_RADIUS_KM
+
+        result = {f"{self.name}_最近距離_km": km[:, 0]}
+        for radius in radii_km:
+            result[f"{self.name}_{radius:g}km內數量"] = self.tree.query_radius(
+                points, r=radius / EARTH_RADIUS_KM, count_only=True)
+        result[f"{self.name}_最近{k}處平均距離_km"] = km.mean(axis=1)
+        return result
+
+
+def add_poi_features(transactions, layers, radii_km=POI_RADII_KM, k=POI_K, chunk_size=POI_CHUNK_SIZE):
+    """
+    為每筆交易加入各設施圖層的距離特徵
+    - layers：PoiLayer 列表，每個圖層只建一次索引
+    - 有座標的交易依 chunk_size 分批查詢，暫存陣列大小不隨總筆數增加；缺座標者特徵為 NA
+    """
+    lats = pd.to_numeric(transactions['緯度'], errors='coerce').to_numpy(dtype=float)
+    lngs = pd.to_numeric(transactions['經度'], errors='coerce').to_numpy(dtype=float)
+    rows = np.flatnonzero(~(np.isnan(lats) | np.isnan(lngs)))
+    print(f"計算 {len(layers)} 個設施圖層的距離特徵：{len(rows)} 筆有座標，每批 {chunk_size} 筆")
+
+    columns = {}
+    for layer in layers:
+        for start in range(0, len(rows), chunk_size):
+            batch = rows[start:start + chunk_size]
+            for column, values in layer.features(lats[batch], lngs[batch], radii_km, k).items():
+                if column not in columns:
+                    columns[column] = np.full(len(transactions), np.nan)
+                columns[column][batch] = values
+
+    features = pd.DataFrame(columns, index=transactions.index)
+    # 數量欄位為整數，缺座標者為 NA
+    for column in features.columns:
+        if column.endswith('km內數量'):
+            features[column] = features[column].astype('Int64')
+    return pd.concat([transactions, features], axis=1)
+
+
+def parse_poi_argument(value):
+    """解析 --poi 參數：名稱=路徑（例如 捷運出口=mrt_exits.csv）"""
+    name, separator, path = value.partition('=')
+    if not separator or not name or not path:
+        raise argparse.ArgumentTypeError(f"--poi 格式應為 名稱=路徑: {value}")
+    return name, path
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="交易資料的空間特徵（測站氣候指標插值、設施距離）")
+    parser.add_argument('transactions',
+                        help="含緯度、經度的交易資料（Parquet 檔、分割資料夾或 CSV）")
+    parser.add_argument('--stations', default=None,
+                        help="測站清單（含站號、緯度、經度），指定後加入氣候指標")
+    parser.add_argument('--climate-stats', default='station_climate_statistics.parquet',
+                        help="測站氣候統計（station_climate_statistics）")
+    parser.add_argument('--period', default=None,
+                        help="氣候統計的期間（例如 2024），統計含多個期間時必填")
+    parser.add_argument('--k', type=int, default=IDW_K,
+                        help="每筆交易取最近的測站數")
+    parser.add_argument('--power', type=float, default=IDW_POWER,
+                        help="反距離權重次方，0 為 k 個測站的平均")
+    parser.add_argument('--poi', action='append', type=parse_poi_argument, default=[],
+                        help="設施圖層 名稱=路徑（CSV、Parquet、SHP 或 GeoJSON），可重複指定")
+    parser.add_argument('--radius', type=float, action='append', default=None,
+                        help=f"計算設施數量的半徑（公里），可重複指定，預設 {list(POI_RADII_KM)}")
+    parser.add_argument('--poi-k', type=int, default=POI_K,
+                        help="最近 k 處設施的平均距離")
+    parser.add_argument('--chunk-size', type=int, default=POI_CHUNK_SIZE,
+                        help="設施距離每批查詢的交易筆數")
+    parser.add_argument('--cache-dir', default=FEATURE_CACHE_DIR,
+                        help="近鄰與權重的快取資料夾")
+    parser.add_argument('--output', default='transactions_features.parquet',
+                        help="輸出檔路徑（.parquet 或 .csv）")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    if args.stations is None and not args.poi:
+        print("請至少指定 --stations 或 --poi")
+        return
+
+    features = read_table(args.transactions)
+    print(f"讀取 {len(features)} 筆交易資料")
+
+    if args.stations is not None:
+        stations = load_station_coordinates(args.stations)
+        climate_stats = read_table(args.climate_stats)
+        features = join_climate_features(features, stations, climate_stats, k=args.k, power=args.power,
+                                         period=args.period, cache_dir=args.cache_dir)
+        print(f"最近測站距離中位數: {np.nanmedian(features['最近測站距離_km']):.2f} km")
+
+    if args.poi:
+        layers = [PoiLayer(name, load_poi_layer(path)) for name, path in args.poi]
+        features = add_poi_features(features, layers, radii_km=args.radius or POI_RADII_KM,
+                                    k=args.poi_k, chunk_size=args.chunk_size)
+
+    missing = (pd.to_numeric(features['緯度'], errors='coerce').isna()
+               | pd.to_numeric(features['經度'], errors='coerce').isna()).sum()
+    print(f"完成 {len(features)} 筆，缺座標 {missing} 筆")
+
+    if args.output.endswith('.csv'):
+        features.to_csv(args.output, index=False, encoding='utf-8-sig')
+    else:
+        features.to_parquet(args.output, index=False)
+    print(f"資料已儲存至: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,594 @@
+import pandas as pd
+import numpy as np
+import os
+import time
+import json
+import hashlib
+import argparse
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import joblib
+from scipy import sparse
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.model_selection import KFold
+
+from gwqr import GWQR, GWQR_BANDWIDTH, GWQR_KERNEL
+from spatial_features import read_table, array_digest
+from spatial_cv import add_cv_arguments, folds_from_args
+
+try:
+    from threadpoolctl import threadpool_limits
+except ImportError:  # 僅限制子行程的 BLAS/OpenMP 執行緒需要
+    threadpool_limits = None
+
+try:
+    import xgboost as xgb
+except ImportError:  # 僅 XGBoost 基學習器需要
+    xgb = None
+
+try:
+    import lightgbm as lgb
+except ImportError:  # 僅 LightGBM 基學習器需要
+    lgb = None
+
+try:
+    import torch
+except ImportError:  # 僅 CNN 基學習器需要
+    torch = None
+
+
+# 堆疊架構設定
+STACKING_TAUS = (0.25, 0.5, 0.75, 0.9)
+BASE_LEARNERS = ('rf', 'xgboost', 'lightgbm', 'cnn')
+LEARNER_LABELS = {'rf': 'RF', 'xgboost': 'XGBoost', 'lightgbm': 'LightGBM', 'cnn': 'CNN'}
+N_SPLITS = 5
+STACKING_CACHE_DIR = "stacking_cache"
+FULL_FIT = 'full'                 # 以全部訓練資料擬合、預測測試資料的工作
+QRF_CHUNK_SIZE = 2000             # 分量迴歸森林每批預測的筆數，限制權重稀疏矩陣大小
+
+# 基學習器預設參數（可由 params 覆寫）；XGBoost、LightGBM 為原生訓練介面的參數名稱
+DEFAULT_PARAMS = {
+    'rf': {'n_estimators': 300, 'min_samples_leaf': 5, 'max_features': 1.0, 'random_state': 0},
+    'xgboost': {'num_boost_round': 500, 'eta': 0.05, 'max_depth': 6, 'subsample': 0.8,
+                'tree_method': 'hist', 'seed': 0},
+    'lightgbm': {'num_boost_round': 500, 'learning_rate': 0.05, 'num_leaves': 63, 'bagging_fraction': 0.8,
+                 'bagging_freq': 1, 'seed': 0, 'verbose': -1},
+    'cnn': {'channels': 32, 'kernel_size': 3, 'hidden': 64, 'epochs': 100, 'batch_size': 256,
+            'learning_rate': 1e-3, 'seed': 0},
+}
+
+# 子行程中限制執行緒數的環境變數（須在載入數值函式庫前設定才完全生效）
+THREAD_ENV_VARS = ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS')
+
+
+class QuantileForest:
+    """
+    分量迴歸森林（Meinshausen, 2006）
+    - 只訓練一座隨機森林，所有 τ 由同一組葉節點權重的加權分位數求得，預測不會交叉
+    - 訓練時記錄各葉節點內的訓練樣本（依 y 排序），預測時以稀疏矩陣乘法一次求出
+      每個查詢點對所有訓練樣本的權重
+    """
+
+    def __init__(self, taus, threads=1, **params):
+        self.taus = list(taus)
+        self.forest = RandomForestRegressor(n_jobs=threads, **params)
+
+    def leaves(self, X):
+        """各樣本在各棵樹的葉節點，加上每棵樹的偏移成為全域編號"""
+        return self.forest.apply(X) + self.offsets_
+
+    def fit(self, X, y):
+        y = np.asarray(y, dtype=float)
+        self.forest.fit(X, y)
+        node_counts = np.array([tree.tree_.node_count for tree in self.forest.estimators_])
+        self.offsets_ = np.concatenate([[0], np.cumsum(node_counts)[:-1]])
+
+        # 權重矩陣的欄依 y 排序，累積權重即為經驗分布
+        order = np.argsort(y, kind='stable')
+        self.y_sorted_ = y[order]
+        rank = np.empty(len(y), dtype=np.int64)
+        rank[order] = np.arange(len(y))
+
+        leaves = self.leaves(X)
+        n_trees = leaves.shape[1]
+        sizes = np.bincount(leaves.ravel(), minlength=node_counts.sum())
+        self.membership_ = sparse.csr_matrix(
+            (1.0 / (n_trees * sizes[leaves.ravel()]), (leaves.ravel(), np.repeat(rank, n_trees))),
+            shape=(node_counts.sum(), len(y)))
+        return self
+
+    def predict(self, X):
+        """回傳 (n, τ 數) 的分量預測"""
+        X = np.asarray(X, dtype=float)
+        prediction = np.empty((len(X), len(self.taus)))
+        for start in range(0, len(X), QRF_CHUNK_SIZE):
+            leaves = self.leaves(X[start:start + QRF_CHUNK_SIZE])
+            n_rows, n_trees = leaves.shape
+            hits = sparse.csr_matrix((np.ones(leaves.size), leaves.ravel(), np.arange(0, leaves.size + 1, n_trees)),
+                                     shape=(n_rows, self.membership_.shape[0]))
+            weights = hits @ self.membership_
+            weights.sort_indices()
+
+            # 各列內的累積權重（每列總和為 1），第一個 ≥ τ 的位置即為加權分位數
+            cumulative = np.cumsum(weights.data)
+            row_start = np.repeat(np.concatenate([[0.0], cumulative])[weights.indptr[:-1]], np.diff(weights.indptr))
+            cumulative -= row_start
+            for column, tau in enumerate(self.taus):
+                below = np.add.reduceat((cumulative < tau - 1e-9).astype(np.int64), weights.indptr[:-1])
+                position = weights.indptr[:-1] + np.minimum(below, np.diff(weights.indptr) - 1)
+                prediction[start:start + n_rows, column] = self.y_sorted_[weights.indices[position]]
+        return prediction
+
+
+class LightGBMQuantiles:
+    """
+    LightGBM 多分量訓練
+    - 只建立一次分箱後的 Dataset，所有 τ 的分量目標共用，不重複建立直方圖分箱
+    """
+
+    def __init__(self, taus, threads=1, num_boost_round=500, **params):
+        if lgb is None:
+            raise ImportError("LightGBM 基學習器需要安裝 lightgbm")
+        self.taus = list(taus)
+        self.threads = threads
+        self.num_boost_round = num_boost_round
+        self.params = params
+
+    def fit(self, X, y):
+        dataset = lgb.Dataset(np.asarray(X, dtype=float), np.asarray(y, dtype=float),
+                              params={'verbose': -1, 'num_threads': self.threads}).construct()
+        self.boosters_ = [lgb.train({**self.params, 'objective': 'quantile', 'alpha': tau,
+                                     'num_threads': self.threads}, dataset, num_boost_round=self.num_boost_round)
+                          for tau in self.taus]
+        return self
+
+    def predict(self, X):
+        X = np.asarray(X, dtype=float)
+        return np.column_stack([booster.predict(X, num_threads=self.threads) for booster in self.boosters_])
+
+
+class XGBoostQuantiles:
+    """
+    XGBoost 多分量訓練
+    - 只建立一次 QuantileDMatrix（分箱），以 reg:quantileerror 搭配多個 quantile_alpha
+      訓練單一多輸出模型，一次產生所有 τ 的預測
+    """
+
+    def __init__(self, taus, threads=1, num_boost_round=500, **params):
+        if xgb is None:
+            raise ImportError("XGBoost 基學習器需要安裝 xgboost")
+        self.taus = list(taus)
+        self.threads = threads
+        self.num_boost_round = num_boost_round
+        self.params = params
+
+    def fit(self, X, y):
+        matrix = xgb.QuantileDMatrix(np.asarray(X, dtype=float), np.asarray(y, dtype=float), nthread=self.threads)
+        params = {**self.params, 'objective': 'reg:quantileerror', 'quantile_alpha': np.array(self.taus),
+                  'nthread': self.threads}
+        self.booster_ = xgb.train(params, matrix, num_boost_round=self.num_boost_round)
+        return self
+
+    def predict(self, X):
+        prediction = self.booster_.inplace_predict(np.asarray(X, dtype=float))
+        return np.asarray(prediction, dtype=float).reshape(len(X), len(self.taus))
+
+
+class QuantileCNN:
+    """
+    一維卷積網路的多分量迴歸
+    - 將標準化後的特徵向量視為長度 p 的單通道序列，兩層卷積後接全連接層，輸出層每個 τ 一個節點
+    - 以各 τ 檢查損失（pinball loss）的總和訓練單一網路，目標同樣標準化後還原
+    """
+
+    def __init__(self, taus, threads=1, channels=32, kernel_size=3, hidden=64, epochs=100, batch_size=256,
+                 learning_rate=1e-3, seed=0):
+        if torch is None:
+            raise ImportError("CNN 基學習器需要安裝 torch")
+        self.taus = list(taus)
+        self.threads = threads
+        self.channels = channels
+        self.kernel_size = kernel_size
+        self.hidden = hidden
+        self.epochs = epochs
+        self.batch_size = batch_size
+        self.learning_rate = learning_rate
+        self.seed = seed
+
+    def fit(self, X, y):
+        torch.set_num_threads(self.threads)
+        torch.manual_seed(self.seed)
+        X = np.asarray(X, dtype=np.float32)
+        y = np.asarray(y, dtype=np.float32)
+        self.x_mean_, self.x_std_ = X.mean(axis=0), X.std(axis=0) + 1e-8
+        self.y_mean_, self.y_std_ = float(y.mean()), float(y.std()) + 1e-8
+
+        n_features = X.shape[1]
+        padding = self.kernel_size // 2
+        self.network_ = torch.nn.Sequential(
+            torch.nn.Conv1d(1, self.channels, self.kernel_size, padding=padding),
+            torch.nn.ReLU(),
+            torch.nn.Conv1d(self.channels, self.channels, self.kernel_size, padding=padding),
+            torch.nn.ReLU(),
+            torch.nn.Flatten(),
+            torch.nn.Linear(self.channels * n_features, self.hidden),
+            torch.nn.ReLU(),
+            torch.nn.Linear(self.hidden, len(self.taus)),
+        )
+        features = torch.from_numpy((X - self.x_mean_) / self.x_std_)[:, None, :]
+        target = torch.from_numpy((y - self.y_mean_) / self.y_std_)[:, None]
+        taus = torch.tensor(self.taus, dtype=torch.float32)
+        optimizer = torch.optim.Adam(self.network_.parameters(), lr=self.learning_rate)
+        generator = torch.Generator().manual_seed(self.seed)
+
+        self.network_.train()
+        for _ in range(self.epochs):
+            for batch in torch.randperm(len(target), generator=generator).split(self.batch_size):
+                residual = target[batch] - self.network_(features[batch])
+                loss = torch.maximum(taus * residual, (taus - 1) * residual).mean(dim=0).sum()
+                optimizer.zero_grad()
+                loss.backward()
+                optimizer.step()
+        return self
+
+    def predict(self, X):
+        torch.set_num_threads(self.threads)
+        X = (np.asarray(X, dtype=np.float32) - self.x_mean_) / self.x_std_
+        self.network_.eval()
+        with torch.no_grad():
+            prediction = self.network_(torch.from_numpy(X)[:, None, :]).numpy()
+        return prediction.astype(float) * self.y_std_ + self.y_mean_
+
+
+def make_learner(name, taus, params=None, threads=1):
+    """
+    建立一次產生所有 τ 預測的基學習器，predict 回傳 (n, τ 數)
+    - params 覆寫 DEFAULT_PARAMS，threads 為該工作可用的執行緒數
+    """
+    params = {**DEFAULT_PARAMS[name], **(params or {})}
+    if name == 'rf':
+        return QuantileForest(taus, threads, **params)
+    if name == 'xgboost':
+        return XGBoostQuantiles(taus, threads, **params)
+    if name == 'lightgbm':
+        return LightGBMQuantiles(taus, threads, **params)
+    if name == 'cnn':
+        return QuantileCNN(taus, threads, **params)
+    raise ValueError(f"未知的基學習器: {name}")
+
+
+def crossing_rates(predictions, taus):
+    """
+    分量交叉比例：相鄰 τ 中較高分量的預測低於較低分量者的比例，以及任一相鄰對交叉的比例
+    - predictions 為 (n, τ 數)，τ 由小到大排列
+    """
+    crossed = np.diff(np.asarray(predictions, dtype=float), axis=1) < 0
+    rates = {f"τ{low}>τ{high}": float(crossed[:, i].mean()) for i, (low, high) in enumerate(zip(taus[:-1], taus[1:]))}
+    rates['任一交叉'] = float(crossed.any(axis=1).mean()) if crossed.shape[1] else 0.0
+    return rates
+
+
+def thread_budget(n_jobs, workers=None, total_threads=None):
+    """
+    分配行程數與每個工作的執行緒數，回傳 (行程數, 執行緒數)
+    - 行程數 × 執行緒數 不超過可用核心，避免各模型的 n_jobs 在行程池中重複超額使用
+    """
+    total = total_threads or os.cpu_count() or 1
+    processes = max(1, min(workers or total, n_jobs, total))
+    return processes, max(1, total // processes)
+
+
+def fold_assignments(n, n_splits=N_SPLITS, seed=0):
+    """隨機 K 折的折別編號（0 至 n_splits-1）"""
+    folds = np.empty(n, dtype=np.int64)
+    for fold, (_, rows) in enumerate(KFold(n_splits, shuffle=True, random_state=seed).split(np.arange(n))):
+        folds[rows] = fold
+    return folds
+
+
+def cache_key(payload):
+    """以參數內容（JSON）計算快取鍵"""
+    text = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]
+
+
+# 行程池中共用的訓練資料（由 init_worker 於各行程啟動時設定）
+_data = None
+
+
+def init_worker(X, y, X_test, threads):
+    """子行程初始化：保存共用資料並限制 BLAS/OpenMP 執行緒數"""
+    global _data
+    _data = (X, y, X_test)
+    for name in THREAD_ENV_VARS:
+        os.environ[name] = str(threads)
+    if threadpool_limits is not None:
+        threadpool_limits(threads)
+
+
+def fit_job(job):
+    """
+    擬合單一 (基學習器, 折) 工作並寫入快取（供行程池呼叫，需為模組層級函式）
+    - 一個模型同時產生所有 τ 的預測
+    - 折為 FULL_FIT 時以全部訓練資料擬合並預測測試資料，否則預測該折的驗證資料
+    - 回傳 (預測值 (n, τ 數), 耗時秒數)
+    """
+    name, taus, params, threads, train, rows, path = job
+    X, y, X_test = _data
+    start_time = time.time()
+    model = make_learner(name, taus, params, threads).fit(X[train], y[train])
+    prediction = model.predict(X_test if rows is None else X[rows])
+
+    # 先寫暫存檔再替換，中斷時不會留下不完整的快取
+    tmp_path = path.with_suffix('.tmp')
+    joblib.dump({'model': model, 'prediction': prediction}, tmp_path)
+    os.replace(tmp_path, path)
+    return prediction, time.time() - start_time
+
+
+class StackingPipeline:
+    """
+    堆疊架構的基學習層：各基學習器 × 各分量 × 各折的樣本外（out-of-fold）預測
+    - 每個基學習器每折只訓練一次即產生所有 τ 的預測（見 make_learner）
+    - 所有 (基學習器, 折) 工作與全資料擬合工作一起排入行程池，依執行緒預算分配各模型的 n_jobs
+    - 每個工作的模型與預測依資料、折別與參數的雜湊快取於磁碟，重跑時只擬合缺少的工作
+    - 樣本外預測矩陣與交叉比例另存一份，只更換元學習器（GWQR）設定時直接讀取
+    - 完成後回報各基學習器的分量交叉比例（crossing_）；noncrossing=True 時再將每列預測依 τ 排序（重排法）消除交叉
+    """
+
+    def __init__(self, learners=BASE_LEARNERS, taus=STACKING_TAUS, n_splits=N_SPLITS, params=None,
+                 workers=None, total_threads=None, cache_dir=STACKING_CACHE_DIR, seed=0, noncrossing=False):
+        self.learners = list(learners)
+        self.taus = sorted(taus)
+        self.n_splits = n_splits
+        self.params = {name: {**DEFAULT_PARAMS[name], **(params or {}).get(name, {})} for name in self.learners}
+        self.workers = workers
+        self.total_threads = total_threads
+        self.cache_dir = Path(cache_dir)
+        self.seed = seed
+        self.noncrossing = noncrossing
+
+    @staticmethod
+    def column(name, tau):
+        """基學習器預測欄位名稱，例如 RF_τ0.25"""
+        return f"{LEARNER_LABELS[name]}_τ{tau}"
+
+    def columns(self, tau=None):
+        taus = self.taus if tau is None else [tau]
+        return [self.column(name, t) for t in taus for name in self.learners]
+
+    def learner_columns(self, name):
+        return [self.column(name, tau) for tau in self.taus]
+
+    def base_predictions(self, X, y, folds=None, X_test=None):
+        """
+        產生樣本外預測（與訓練資料同列）與測試資料預測（全資料擬合），回傳 (oof, test)
+        - folds：各列的折別編號（例如空間區塊折），未指定時為隨機 K 折
+        - X_test 未指定時 test 為 None
+        """
+        X = np.asarray(X, dtype=float)
+        y = np.asarray(y, dtype=float)
+        X_test = None if X_test is None else np.asarray(X_test, dtype=float)
+        folds = fold_assignments(len(y), self.n_splits, self.seed) if folds is None else np.asarray(folds)
+        fold_ids = np.unique(folds)
+
+        data_key = array_digest(X, y)
+        folds_key = array_digest(folds)
+        test_key = None if X_test is None else array_digest(X_test)
+        matrix_key = cache_key({'data': data_key, 'folds': folds_key, 'test': test_key,
+                                'taus': self.taus, 'params': self.params, 'noncrossing': self.noncrossing})
+        oof_path = self.cache_dir / f"oof_{matrix_key}.parquet"
+        test_path = self.cache_dir / f"test_{matrix_key}.parquet"
+        crossing_path = self.cache_dir / f"crossing_{matrix_key}.parquet"
+        if oof_path.exists() and crossing_path.exists() and (X_test is None or test_path.exists()):
+            print(f"使用快取的樣本外預測: {oof_path}")
+            self.crossing_ = pd.read_parquet(crossing_path)
+            print("樣本外預測的分量交叉比例：")
+            print(self.crossing_)
+            return pd.read_parquet(oof_path), (None if X_test is None else pd.read_parquet(test_path))
+
+        (self.cache_dir / 'models').mkdir(parents=True, exist_ok=True)
+        oof = pd.DataFrame(np.nan, index=range(len(y)), columns=self.columns())
+        test = None if X_test is None else pd.DataFrame(np.nan, index=range(len(X_test)), columns=self.columns())
+
+        # 列出所有工作，已有快取者直接讀取預測
+        pending = []
+        targets = [(fold, folds != fold, np.flatnonzero(folds == fold)) for fold in fold_ids]
+        if X_test is not None:
+            targets.append((FULL_FIT, np.ones(len(y), dtype=bool), None))
+        for name in self.learners:
+            columns = self.learner_columns(name)
+            for fold, train, rows in targets:
+                key = cache_key({'data': data_key, 'folds': folds_key, 'fold': str(fold),
+                                 'test': test_key if rows is None else None,
+                                 'learner': name, 'taus': self.taus, 'params': self.params[name]})
+                path = self.cache_dir / 'models' / f"{name}_{key}.joblib"
+                if path.exists():
+                    self.store(oof, test, columns, rows, joblib.load(path)['prediction'])
+                else:
+                    pending.append((name, columns, np.flatnonzero(train), rows, path))
+
+        total_jobs = len(self.learners) * len(targets)
+        print(f"基學習層共 {total_jobs} 個工作，已快取 {total_jobs - len(pending)} 個，需擬合 {len(pending)} 個")
+        if pending:
+            self.run(pending, X, y, X_test, oof, test)
+
+        self.crossing_ = self.crossing_report(oof)
+        print("樣本外預測的分量交叉比例：")
+        print(self.crossing_)
+        if self.noncrossing:
+            for frame in (oof, test):
+                if frame is not None:
+                    self.rearrange(frame)
+
+        # 交叉比例為重排前的結果，與預測矩陣一併快取，讀取快取時照常回報
+        self.crossing_.to_parquet(crossing_path)
+        oof.to_parquet(oof_path, index=False)
+        if test is not None:
+            test.to_parquet(test_path, index=False)
+        return oof, test
+
+    @staticmethod
+    def store(oof, test, columns, rows, prediction):
+        if rows is None:
+            test[columns] = prediction
+        else:
+            oof.loc[rows, columns] = prediction
+
+    def crossing_report(self, predictions):
+        """各基學習器的分量交叉比例表"""
+        return pd.DataFrame({LEARNER_LABELS[name]: crossing_rates(predictions[self.learner_columns(name)], self.taus)
+                             for name in self.learners}).T
+
+    def rearrange(self, predictions):
+        """將各基學習器每列的分量預測由小到大排序，使其隨 τ 單調（原地修改）"""
+        for name in self.learners:
+            columns = self.learner_columns(name)
+            predictions[columns] = np.sort(predictions[columns].to_numpy(), axis=1)
+
+    def run(self, pending, X, y, X_test, oof, test):
+        """依執行緒預算排程待擬合工作，全資料擬合（較大）者優先送出"""
+        global _data
+        processes, threads = thread_budget(len(pending), self.workers, self.total_threads)
+        print(f"使用 {processes} 個行程，每個工作 {threads} 個執行緒")
+        pending = sorted(pending, key=lambda job: job[3] is not None)
+        start_time = time.time()
+
+        if processes == 1:
+            _data = (X, y, X_test)
+            for done, (name, columns, train, rows, path) in enumerate(pending, 1):
+                prediction, seconds = fit_job((name, self.taus, self.params[name], threads, train, rows, path))
+                self.store(oof, test, columns, rows, prediction)
+                print(f"  [{done}/{len(pending)}] {LEARNER_LABELS[name]} {'全資料' if rows is None else '折'} "
+                      f"完成（{seconds:.1f} 秒）")
+            _data = None
+        else:
+            with ProcessPoolExecutor(max_workers=processes, initializer=init_worker,
+                                     initargs=(X, y, X_test, threads)) as pool:
+                futures = {pool.submit(fit_job, (name, self.taus, self.params[name], threads, train, rows, path)):
+                           (name, columns, rows) for name, columns, train, rows, path in pending}
+                for done, future in enumerate(as_completed(futures), 1):
+                    name, columns, rows = futures[future]
+                    prediction, seconds = future.result()
+                    self.store(oof, test, columns, rows, prediction)
+                    print(f"  [{done}/{len(pending)}] {LEARNER_LABELS[name]} {'全資料' if rows is None else '折'} "
+                          f"完成（{seconds:.1f} 秒）")
+        print(f"基學習層擬合完成，耗時 {time.time() - start_time:.1f} 秒")
+
+
+def load_bandwidths(path):
+    """讀取 gwqr.py --select-bandwidth 的輸出，回傳 {分量: 頻寬}"""
+    table = read_table(path)
+    return dict(zip(table['分量'].astype(float), table['頻寬']))
+
+
+def fit_meta(oof, lats, lngs, y, pipeline, bandwidths, kernel=GWQR_KERNEL, adaptive=True, workers=1):
+    """
+    元學習層：每個分量以同一 τ 的基學習器樣本外預測為特徵擬合 GWQR
+    - bandwidths：{分量: 頻寬}，或所有分量共用的單一頻寬
+    - 回傳 {分量: GWQR}
+    """
+    models = {}
+    for tau in pipeline.taus:
+        bandwidth = bandwidths[tau] if isinstance(bandwidths, dict) else bandwidths
+        model = GWQR(tau=tau, bandwidth=bandwidth, kernel=kernel, adaptive=adaptive, workers=workers)
+        models[tau] = model.fit(lats, lngs, oof[pipeline.columns(tau)], y, feature_names=pipeline.columns(tau))
+    return models
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="堆疊架構：基學習器樣本外預測與 GWQR 元學習器")
+    parser.add_argument('data',
+                        help="含緯度、經度、目標與特徵欄位的訓練資料（Parquet 或 CSV）")
+    parser.add_argument('--target', required=True,
+                        help="目標欄位，例如 單價元平方公尺")
+    parser.add_argument('--features', nargs='+', required=True,
+                        help="基學習器使用的特徵欄位")
+    parser.add_argument('--test', default=None,
+                        help="測試資料（Parquet 或 CSV），提供時輸出其預測")
+    parser.add_argument('--learners', nargs='+', choices=list(BASE_LEARNERS), default=list(BASE_LEARNERS),
+                        help="基學習器")
+    parser.add_argument('--taus', type=float, nargs='+', default=list(STACKING_TAUS),
+                        help="分量")
+    parser.add_argument('--folds', type=int, default=N_SPLITS,
+                        help="隨機 K 折的折數")
+    parser.add_argument('--fold-column', default=None,
+                        help="使用資料中的折別欄位，取代隨機 K 折")
+    add_cv_arguments(parser)
+    parser.add_argument('--noncrossing', action='store_true',
+                        help="將各基學習器的分量預測依 τ 排序，消除分量交叉")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="行程數，預設依可用核心與工作數決定")
+    parser.add_argument('--threads', type=int, default=None,
+                        help="可用的執行緒總數，預設為 CPU 核心數")
+    parser.add_argument('--cache-dir', default=STACKING_CACHE_DIR,
+                        help="基學習器模型與樣本外預測的快取資料夾")
+    parser.add_argument('--bandwidth', type=float, default=GWQR_BANDWIDTH,
+                        help="GWQR 頻寬：適應性為近鄰數，固定為公里")
+    parser.add_argument('--bandwidths', default=None,
+                        help="各分量頻寬（gwqr.py --select-bandwidth 的輸出），取代 --bandwidth")
+    parser.add_argument('--kernel', choices=['bisquare', 'gaussian'], default=GWQR_KERNEL,
+                        help="GWQR 核函數")
+    parser.add_argument('--fixed', action='store_true',
+                        help="GWQR 使用固定頻寬（公里）")
+    parser.add_argument('--output', default='stacking_predictions.parquet',
+                        help="預測輸出檔路徑（.parquet 或 .csv）")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    data = read_table(args.data)
+    columns = ['緯度', '經度', args.target] + args.features
+    usable = data[columns].apply(pd.to_numeric, errors='coerce').dropna()
+    print(f"讀取 {len(data)} 筆資料，可用 {len(usable)} 筆")
+    folds = folds_from_args(args, data, args.data)
+    if folds is None and args.fold_column:
+        folds = data[args.fold_column]
+    if folds is not None:
+        # 缺村里等無法分折者不參與
+        usable = usable[folds.loc[usable.index] >= 0]
+        folds = folds.loc[usable.index].to_numpy()
+        print(f"使用既定分折，{len(usable)} 筆參與交叉驗證")
+
+    test = None
+    if args.test:
+        test = read_table(args.test)
+        test = test[['緯度', '經度'] + args.features].apply(pd.to_numeric, errors='coerce').dropna()
+        print(f"測試資料可用 {len(test)} 筆")
+
+    pipeline = StackingPipeline(args.learners, args.taus, args.folds, workers=args.workers,
+                                total_threads=args.threads, cache_dir=args.cache_dir, noncrossing=args.noncrossing)
+    oof, test_base = pipeline.base_predictions(usable[args.features], usable[args.target], folds,
+                                               None if test is None else test[args.features])
+
+    if args.bandwidths:
+        bandwidths = load_bandwidths(args.bandwidths)
+    else:
+        bandwidths = args.bandwidth if args.fixed else int(args.bandwidth)
+    print("擬合 GWQR 元學習器...")
+    models = fit_meta(oof, usable['緯度'], usable['經度'], usable[args.target], pipeline, bandwidths,
+                      kernel=args.kernel, adaptive=not args.fixed)
+
+    output = usable.reset_index(drop=True)
+    output = pd.concat([output, oof], axis=1)
+    for tau, model in models.items():
+        output[f"堆疊GWQR_τ{tau}"] = model.fitted_
+    if test is not None:
+        test_output = pd.concat([test.reset_index(drop=True), test_base], axis=1)
+        for tau, model in models.items():
+            test_output[f"堆疊GWQR_τ{tau}"] = model.predict(test_output['緯度'], test_output['經度'],
+                                                          test_output[pipeline.columns(tau)])
+        output = pd.concat([output.assign(資料集='訓練'), test_output.assign(資料集='測試')], ignore_index=True)
+
+    if args.output.endswith('.csv'):
+        output.to_csv(args.output, index=False, encoding='utf-8-sig')
+    else:
+        output.to_parquet(args.output, index=False)
+    print(f"資料已儲存至: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+import importlib.util
+import sys
+from pathlib import Path
+
+import pytest
+
+SRC = Path(__file__).resolve().parents[1] / 'src'
+sys.path.insert(0, str(SRC))
+
+
+def load_module(name, filename):
+    """以檔案路徑載入 src 下的模組（climate_data_processing.py.py 無法直接 import）"""
+    spec = importlib.util.spec_from_file_location(name, SRC / filename)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture(scope='session')
+def climate():
+    return load_module('climate_data_processing', 'climate_data_processing.py.py')
+
+
+@pytest.fixture
+def processor(climate):
+    return climate.WeatherDataProcessor()
@@ -0,0 +1,91 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+
+def hourly_frame(processor, stations):
+    """
+    由 {測站: [值...]} 建立小時資料，值為數字、None（NA）或 'RAW_9996'、'SPECIAL_MISSING'、'TRACE'
+    - 特殊代碼的 PP01 為 NA，另以 PP01_flag 標記（同 clean_values 的輸出）
+    """
+    flags = {'RAW_9996': processor.FLAG_RAW_9996, 'SPECIAL_MISSING': processor.FLAG_SPECIAL_MISSING,
+             'TRACE': processor.FLAG_TRACE}
+    rows = []
+    for stno, values in stations.items():
+        for hour, value in enumerate(values):
+            rows.append({
+                'stno': stno,
+                'datetime': pd.Timestamp('2023-01-01') + pd.Timedelta(hours=hour),
+                'PP01': np.nan if value is None or isinstance(value, str) else float(value),
+                'PP01_flag': flags.get(value, processor.FLAG_NONE) if isinstance(value, str) else processor.FLAG_NONE,
+            })
+    return pd.DataFrame(rows).astype({'PP01_flag': 'int8'})
+
+
+def reference(processor, stations):
+    """逐測站以 process_9996_sequence 處理，回傳與 hourly_frame 同列順序的 PP01（特殊代碼轉回 NA）"""
+    result = []
+    for values in stations.values():
+        sequence = [np.nan if value is None else value for value in values]
+        result.extend(np.nan if isinstance(value, str) else value
+                      for value in processor.process_9996_sequence(sequence))
+    return np.array(result, dtype=float)
+
+
+def assert_same(processor, stations, shuffle_seed=None):
+    df = hourly_frame(processor, stations)
+    expected = pd.Series(reference(processor, stations), index=df.index)
+    if shuffle_seed is not None:
+        # 向量化版本需自行依測站、時間排序，與輸入列順序無關
+        df = df.sample(frac=1, random_state=shuffle_seed)
+    result = processor.process_all_9996_values(df)
+    np.testing.assert_array_equal(result['PP01'].to_numpy(dtype=float),
+                                  expected.loc[result.index].to_numpy(dtype=float))
+
+
+@pytest.mark.parametrize('values, expected', [
+    # 區段後為 0：整段視為 0
+    ([1.0, 'RAW_9996', 'RAW_9996', 0.0], [1.0, 0.0, 0.0, 0.0]),
+    # 區段後為 >0、<0、NA、雨跡、其他特殊代碼：視為 NA
+    (['RAW_9996', 2.5], [np.nan, 2.5]),
+    (['RAW_9996', -1.0], [np.nan, -1.0]),
+    (['RAW_9996', None, 0.0], [np.nan, np.nan, 0.0]),
+    (['RAW_9996', 'TRACE', 0.0], [np.nan, np.nan, 0.0]),
+    (['RAW_9996', 'SPECIAL_MISSING'], [np.nan, np.nan]),
+    # 測站末端的區段：視為 NA
+    ([0.0, 'RAW_9996', 'RAW_9996'], [0.0, np.nan, np.nan]),
+])
+def test_single_station_cases(processor, values, expected):
+    result = processor.process_all_9996_values(hourly_frame(processor, {'A': values}))
+    np.testing.assert_array_equal(result['PP01'].to_numpy(dtype=float), np.array(expected, dtype=float))
+
+
+def test_run_does_not_continue_into_next_station(processor):
+    # A 的末端區段不可因 B 的第一筆為 0 而視為 0，B 開頭的區段也與 A 的區段分開
+    stations = {'A': [1.0, 'RAW_9996'], 'B': [0.0, 'RAW_9996', 0.0], 'C': ['RAW_9996', 'RAW_9996', 3.0]}
+    result = processor.process_all_9996_values(hourly_frame(processor, stations))
+    np.testing.assert_array_equal(result['PP01'].to_numpy(dtype=float),
+                                  [1.0, np.nan, 0.0, 0.0, 0.0, np.nan, np.nan, 3.0])
+    assert_same(processor, stations)
+
+
+def test_frame_without_9996_is_unchanged(processor):
+    df = hourly_frame(processor, {'A': [0.0, None, 'TRACE', 1.5]})
+    pd.testing.assert_frame_equal(processor.process_all_9996_values(df), df)
+
+
+@pytest.mark.parametrize('seed', range(25))
+def test_matches_sequential_reference(processor, seed):
+    """隨機多測站資料：向量化版本與逐筆版本結果相同"""
+    rng = np.random.default_rng(seed)
+    # -9996 機率較高以產生連續區段，並涵蓋 0、>0、<0、NA、雨跡、其他特殊代碼
+    choices = np.array(['RAW_9996', 'ZERO', 'POSITIVE', 'NEGATIVE', 'NA', 'TRACE', 'SPECIAL_MISSING'])
+    probabilities = [0.4, 0.2, 0.15, 0.05, 0.1, 0.05, 0.05]
+    values = {'ZERO': 0.0, 'NEGATIVE': -0.5, 'NA': None}
+
+    stations = {}
+    for stno in range(rng.integers(1, 6)):
+        kinds = rng.choice(choices, size=rng.integers(1, 40), p=probabilities)
+        stations[f"S{stno:02d}"] = [round(float(rng.uniform(0.1, 20)), 1) if kind == 'POSITIVE'
+                                    else values.get(kind, kind) for kind in kinds]
+    assert_same(processor, stations, shuffle_seed=seed)
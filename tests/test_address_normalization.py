@@ -0,0 +1,53 @@
+import pandas as pd
+import pytest
+
+from real_estate_data_processing import chinese_to_int, int_to_chinese, normalize_addresses
+
+
+def normalize(*addresses):
+    return normalize_addresses(pd.Series(list(addresses), dtype=object)).tolist()
+
+
+@pytest.mark.parametrize('text, expected', [
+    # 逐位寫法（含〇）
+    ('一〇五', 105), ('二七〇', 270), ('〇五', 5), ('五零', 50),
+    # 十／百位值寫法
+    ('十', 10), ('十五', 15), ('三十五', 35), ('一百', 100), ('一百零五', 105), ('一百〇五', 105),
+    ('一百一十', 110), ('一百二十三', 123),
+])
+def test_chinese_to_int(text, expected):
+    assert chinese_to_int(text) == expected
+
+
+@pytest.mark.parametrize('text', ['三五十', '十百', '零十'])
+def test_chinese_to_int_rejects_ambiguous_forms(text):
+    with pytest.raises(ValueError):
+        chinese_to_int(text)
+
+
+def test_int_to_chinese_round_trips():
+    assert all(chinese_to_int(int_to_chinese(number)) == number for number in range(1000))
+
+
+def test_positional_numerals():
+    assert normalize('台北市中正區重慶南路一段一〇五號', '台北市大安區和平東路二段二七〇巷3號') == [
+        '台北市中正區重慶南路一段105號', '台北市大安區和平東路二段270巷3號']
+
+
+def test_positional_numeral_does_not_collide_with_last_digit():
+    # 舊版逐字覆寫數字，一〇五號被轉為 5號，與真正的 5號共用去重與快取鍵
+    assert normalize('中山路一〇五號', '中山路5號') == ['中山路105號', '中山路5號']
+
+
+def test_unit_numerals():
+    assert normalize('民生東路三十五巷十弄一百零五號', '光復南路一百一十巷一百二十三號') == [
+        '民生東路35巷10弄105號', '光復南路110巷123號']
+
+
+def test_ambiguous_numerals_are_left_unchanged():
+    assert normalize('中山路三五十號') == ['中山路三五十號']
+
+
+def test_sections_and_cleanup():
+    assert normalize('臺北市 中山區 南京東路２段１２號（１樓）', '忠孝東路105段1號', '某路1234段1號') == [
+        '台北市中山區南京東路二段12號', '忠孝東路一百零五段1號', '某路1234段1號']
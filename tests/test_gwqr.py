@@ -0,0 +1,134 @@
+import numpy as np
+import pytest
+
+from gwqr import (GWQR, FIXED_RANGE, BandwidthSelector, NeighborIndex, kernel_weights, project_coordinates,
+                  truncation_radius)
+
+
+@pytest.fixture
+def coords():
+    rng = np.random.default_rng(0)
+    points = rng.uniform(0, 10, size=(300, 2))
+    # 重複座標：自身不一定是距離最近的第一個
+    points[1] = points[0]
+    return points
+
+
+def ragged_rows(distances, indices, indptr):
+    return [dict(zip(indices[start:stop], distances[start:stop])) for start, stop in zip(indptr[:-1], indptr[1:])]
+
+
+@pytest.mark.parametrize('exclude_self', [False, True])
+def test_query_radius_matches_dense_query(coords, exclude_self):
+    index = NeighborIndex(coords)
+    radius = 1.5
+    distances, indices, indptr = index.query_radius(coords, radius, exclude_self=exclude_self, chunk_size=64)
+    dense_distances, dense_indices = index.query(coords, len(coords), exclude_self=exclude_self)
+
+    assert indptr[0] == 0 and indptr[-1] == len(indices) == len(distances)
+    for row, neighbors in enumerate(ragged_rows(distances, indices, indptr)):
+        within = dense_distances[row] <= radius
+        expected = dict(zip(dense_indices[row][within], dense_distances[row][within]))
+        assert neighbors.keys() == expected.keys()
+        np.testing.assert_allclose([neighbors[i] for i in expected], list(expected.values()))
+        if exclude_self:
+            assert row not in neighbors
+    if exclude_self:
+        # 重複座標的另一點仍保留，距離為 0
+        assert ragged_rows(distances, indices, indptr)[0][1] == 0.0
+
+
+def test_query_radius_subset_excludes_own_training_index(coords):
+    index = NeighborIndex(coords)
+    rows = np.array([0, 5, 17])
+    _, indices, indptr = index.query_radius(coords[rows], 2.0, exclude_self=True, query_indices=rows)
+    for row, start, stop in zip(rows, indptr[:-1], indptr[1:]):
+        assert row not in indices[start:stop]
+
+
+@pytest.mark.parametrize('kernel', ['bisquare', 'gaussian'])
+def test_fixed_kernel_weights_from_ragged_match_dense(coords, kernel):
+    index = NeighborIndex(coords)
+    bandwidth = 0.8
+    distances, indices, indptr = index.query_radius(coords, 3 * bandwidth)
+    ragged = kernel_weights(distances, indices, bandwidth, len(coords), kernel, adaptive=False, indptr=indptr)
+    dense = kernel_weights(*index.query(coords, len(coords)), bandwidth, len(coords), kernel, adaptive=False)
+    np.testing.assert_allclose(ragged.toarray(), dense.toarray())
+    # 截斷半徑外的權重為 0，不存入稀疏矩陣
+    assert ragged.nnz < len(coords) ** 2
+
+
+def test_adaptive_kernel_weights_require_dense_neighbors(coords):
+    distances, indices, indptr = NeighborIndex(coords).query_radius(coords, 1.0)
+    with pytest.raises(ValueError):
+        kernel_weights(distances, indices, 10, len(coords), adaptive=True, indptr=indptr)
+
+
+@pytest.mark.parametrize('adaptive, bandwidth, kernel', [(True, 60, 'bisquare'), (False, 3.0, 'gaussian')])
+def test_gwqr_recovers_constant_coefficients(adaptive, bandwidth, kernel):
+    rng = np.random.default_rng(1)
+    lats = 25.0 + rng.uniform(0, 0.1, 400)
+    lngs = 121.5 + rng.uniform(0, 0.1, 400)
+    x = rng.normal(size=400)
+    model = GWQR(tau=0.5, bandwidth=bandwidth, kernel=kernel, adaptive=adaptive)
+    model.fit(lats, lngs, x, 1.0 + 2.0 * x)
+    np.testing.assert_allclose(model.coefficients_, np.tile([1.0, 2.0], (400, 1)), atol=1e-3)
+
+
+def selector_data(n=300, seed=2):
+    rng = np.random.default_rng(seed)
+    lats = 25.0 + rng.uniform(0, 0.05, n)
+    lngs = 121.5 + rng.uniform(0, 0.05, n)
+    # 重複座標：留一交叉驗證只能排除自身，不可排除同座標的其他觀測
+    lats[1], lngs[1] = lats[0], lngs[0]
+    x = rng.normal(size=n)
+    return lats, lngs, x, 1.0 + 2.0 * x + rng.normal(scale=0.1, size=n)
+
+
+def neighbor_rows(selector):
+    """各評估位置的近鄰索引列表"""
+    if selector.indptr is None:
+        return list(selector.indices)
+    return [selector.indices[start:stop] for start, stop in zip(selector.indptr[:-1], selector.indptr[1:])]
+
+
+@pytest.mark.parametrize('adaptive, kernel', [(True, 'bisquare'), (False, 'bisquare'), (False, 'gaussian')])
+def test_bandwidth_selection_leaves_each_location_out(adaptive, kernel):
+    lats, lngs, x, y = selector_data()
+    selector = BandwidthSelector(lats, lngs, x, y, kernel=kernel, adaptive=adaptive, cv_sample=120)
+    rows = neighbor_rows(selector)
+    assert len(rows) == len(selector.sample)
+    for own, neighbors in zip(selector.sample, rows):
+        assert own not in neighbors
+    if 0 in selector.sample and 1 in selector.sample:
+        position = np.searchsorted(selector.sample, 0)
+        assert 1 in rows[position]
+
+    # 交叉驗證的擬合值不使用自身觀測：權重矩陣在評估位置自身的欄為 0
+    weights = kernel_weights(selector.distances, selector.indices, selector.bounds[1], len(y), kernel, adaptive,
+                             indptr=selector.indptr)
+    assert np.all(weights[np.arange(len(selector.sample)), selector.sample] == 0)
+
+
+@pytest.mark.parametrize('adaptive', [True, False])
+def test_bandwidth_selection_with_folds_uses_other_folds_only(adaptive):
+    lats, lngs, x, y = selector_data()
+    folds = np.arange(len(y)) % 4 - 1           # 折別 -1 的觀測不參與
+    selector = BandwidthSelector(lats, lngs, x, y, adaptive=adaptive, folds=folds)
+    assert np.all(folds[selector.sample] >= 0)
+    for own, neighbors in zip(selector.sample, neighbor_rows(selector)):
+        assert len(neighbors) > 0
+        assert np.all(folds[neighbors] >= 0)
+        assert np.all(folds[neighbors] != folds[own])
+
+
+def test_fixed_selection_neighbors_match_largest_cutoff():
+    lats, lngs, x, y = selector_data()
+    selector = BandwidthSelector(lats, lngs, x, y, adaptive=False, kernel='gaussian')
+    # 高斯核預設上限使截斷半徑與雙平方核同為 FIXED_RANGE 上限
+    assert truncation_radius(selector.bounds[1], 'gaussian') == pytest.approx(FIXED_RANGE[1])
+    coords = project_coordinates(lats, lngs)
+    for own, neighbors in zip(selector.sample, neighbor_rows(selector)):
+        distances = np.linalg.norm(coords - coords[own], axis=1)
+        expected = np.flatnonzero(distances <= FIXED_RANGE[1])
+        assert set(neighbors) == set(expected) - {own}
@@ -0,0 +1,68 @@
+import pandas as pd
+import pytest
+
+pytest.importorskip('pyarrow')
+
+START, END = '2023-12-01', '2024-01-31'
+
+
+def write_month(folder, year, month, stations):
+    """
+    寫出新格式月檔：stations 為 {測站: (TX01, {日期時間: PP01 字樣})}，每日 00、12 時各一筆
+    - 未列在 PP01 字樣中的時段降雨量為 0.5
+    """
+    lines = ['* synthetic']
+    for day in pd.date_range(pd.Timestamp(year, month, 1), pd.Timestamp(year, month, 1) + pd.offsets.MonthEnd(0)):
+        for hour in (0, 12, 23):
+            timestamp = day + pd.Timedelta(hours=hour)
+            for stno, (temperature, rainfall) in stations.items():
+                pp01 = rainfall.get(timestamp, '0.5')
+                lines.append(f"{stno} {timestamp:%Y%m%d%H} 1 {temperature} 1 1 1 1 1 {pp01}")
+    (folder / f"{year}{month:02d}99.auto_hr.txt").write_text('\n'.join(lines) + '\n', encoding='utf-8')
+
+
+def full_run(processor, folder):
+    """與 main() 的逐年處理相同：逐年產生日資料後計算各年度統計"""
+    frames = [processor.create_daily_data(hourly, year_start, year_end)
+              for _, year_start, year_end, hourly in processor.iter_yearly_data(folder, START, END)]
+    daily = pd.concat(frames, ignore_index=True)
+    return daily, processor.calculate_period_statistics(daily, processor.yearly_periods(START, END))
+
+
+def assert_same_output(processor, folder, state_dir):
+    daily, stats = processor.process_incremental(folder, START, END, state_dir)
+    expected_daily, expected_stats = full_run(processor, folder)
+
+    def ordered(df, keys):
+        # 由 Parquet 讀回的日期為秒精度，統一後比較
+        if 'date' in df.columns:
+            df = df.assign(date=df['date'].astype('datetime64[ns]'))
+        return df.sort_values(keys, kind='stable').reset_index(drop=True)
+
+    assert len(daily) == len(expected_daily)
+    pd.testing.assert_frame_equal(ordered(daily, ['stno', 'date']), ordered(expected_daily, ['stno', 'date']),
+                                  check_dtype=False)
+    pd.testing.assert_frame_equal(ordered(stats, ['期間', 'stno'])[expected_stats.columns],
+                                  ordered(expected_stats, ['期間', 'stno']), check_dtype=False)
+    return stats
+
+
+def test_incremental_matches_full_run(processor, tmp_path):
+    # A 兩年度都有資料，年底以 -9996 結束並由隔年第一筆 0 決定；B 只在 2024 年有資料
+    folder = tmp_path / 'data'
+    folder.mkdir()
+    write_month(folder, 2023, 12, {'C0A001': (20.0, {pd.Timestamp('2023-12-31 23:00'): '-99.6'})})
+    write_month(folder, 2024, 1, {'C0A001': (21.0, {pd.Timestamp('2024-01-01 00:00'): '0.0'}),
+                                  'C0B002': (19.0, {})})
+    state_dir = tmp_path / 'state'
+
+    stats = assert_same_output(processor, folder, state_dir)
+    # 只在 2024 年有資料的測站不可出現在 2023 年度的統計
+    (label_2023, _, _), (label_2024, _, _) = processor.yearly_periods(START, END)
+    assert sorted(zip(stats['期間'], stats['stno'])) == sorted(
+        [(label_2023, 'C0A001'), (label_2024, 'C0A001'), (label_2024, 'C0B002')])
+
+    # 修改一月檔案後再次增量處理，結果仍與全部重算相同
+    write_month(folder, 2024, 1, {'C0A001': (22.0, {pd.Timestamp('2024-01-01 00:00'): '3.0'}),
+                                  'C0B002': (18.0, {})})
+    assert_same_output(processor, folder, state_dir)
@@ -0,0 +1,22 @@
+import numpy as np
+
+
+def write_month(tmp_path, name, lines):
+    path = tmp_path / name
+    path.write_text('\n'.join(['* header'] + lines) + '\n', encoding='utf-8')
+    return path
+
+
+def test_new_format_keeps_temperature_when_rainfall_is_none(processor, tmp_path):
+    # 新格式的 PP01 可能是字樣 None：該列仍有完整欄位，TX01 不可因此變成 NA
+    path = write_month(tmp_path, '20231299.auto_hr.txt', [
+        '466920 2023120105 1 23.4 1 1 1 1 1 None',
+        '466920 2023120106 1 22.8 1 1 1 1 1 1.5',
+        '466920 2023120107 1 22.0',
+    ])
+    data = processor.read_monthly_file(path, 2023, 12)
+
+    assert data['hour'].tolist() == [6, 7, 8]
+    np.testing.assert_array_equal(data['TX01'].to_numpy(dtype=float), [23.4, 22.8, np.nan])
+    np.testing.assert_array_equal(data['PP01'].to_numpy(dtype=float), [np.nan, 1.5, np.nan])
+    assert data['PP01_raw'].astype(object).tolist()[:2] == ['None', '1.5']
@@ -0,0 +1,75 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from gwqr import project_coordinates
+from spatial_cv import BLOCK_COLUMN, FOLD_COLUMN, SpatialBlockCV
+
+
+def transactions(n=400, seed=5):
+    """台北附近約 10 公里見方的交易，前 10 筆缺座標、接著 5 筆缺村里"""
+    rng = np.random.default_rng(seed)
+    data = pd.DataFrame({
+        '緯度': 25.0 + rng.uniform(0, 0.09, n),
+        '經度': 121.5 + rng.uniform(0, 0.1, n),
+        '鄉鎮市區': rng.choice(['大安區', '中正區'], n),
+        '村里': rng.choice([f"第{i}里" for i in range(30)], n),
+    }, index=np.arange(n) * 3)
+    data.iloc[:10, [0, 1]] = np.nan
+    data.iloc[10:15, 3] = None
+    return data
+
+
+def assert_blocks_in_one_fold(assignment, n_splits):
+    valid = assignment[assignment[BLOCK_COLUMN] >= 0]
+    assert (valid.groupby(BLOCK_COLUMN)[FOLD_COLUMN].nunique() == 1).all()
+    assert sorted(valid[FOLD_COLUMN].unique()) == list(range(n_splits))
+    assert (assignment.loc[assignment[BLOCK_COLUMN] < 0, FOLD_COLUMN] == -1).all()
+
+
+@pytest.mark.parametrize('method', ['grid', 'kmeans'])
+def test_coordinate_blocks_fall_in_one_fold(method):
+    data = transactions()
+    assignment = SpatialBlockCV(method, n_splits=5, n_blocks=40).assign(data)
+
+    assert assignment.index.equals(data.index)
+    missing = data['緯度'].isna().to_numpy()
+    assert (assignment[FOLD_COLUMN].to_numpy()[missing] == -1).all()
+    assert (assignment[FOLD_COLUMN].to_numpy()[~missing] >= 0).all()
+    assert_blocks_in_one_fold(assignment, 5)
+
+
+def test_grid_cells_are_blocks():
+    data = transactions()
+    assignment = SpatialBlockCV('grid', cell_km=2.0).assign(data)
+    # 同一 2 公里網格內（投影座標）的交易屬於同一區塊，不同網格屬於不同區塊
+    valid = data['緯度'].notna().to_numpy()
+    cells = np.floor(project_coordinates(data['緯度'].to_numpy()[valid], data['經度'].to_numpy()[valid]) / 2.0)
+    pairs = set(zip(map(tuple, cells), assignment[BLOCK_COLUMN].to_numpy()[valid]))
+    assert len(pairs) == len({cell for cell, _ in pairs}) == len({block for _, block in pairs})
+
+
+def test_village_blocks_fall_in_one_fold():
+    data = transactions()
+    assignment = SpatialBlockCV('village', n_splits=4).assign(data)
+
+    assert (assignment[FOLD_COLUMN].iloc[10:15] == -1).all()
+    assert (assignment[FOLD_COLUMN].drop(index=data.index[10:15]) >= 0).all()
+    # 不同鄉鎮市區的同名村里為不同區塊
+    keys = data['鄉鎮市區'] + data['村里'].astype('string')
+    assert assignment[BLOCK_COLUMN][keys.notna()].groupby(keys[keys.notna()]).nunique().eq(1).all()
+    assert assignment[BLOCK_COLUMN].max() + 1 == keys.nunique()
+    assert_blocks_in_one_fold(assignment, 4)
+
+
+def test_assign_folds_balances_rows_and_skips_missing():
+    cv = SpatialBlockCV(n_splits=3)
+    blocks = np.repeat([0, 1, 2, 3, 4, 5, -1], [50, 40, 30, 20, 10, 10, 7])
+    folds = cv.assign_folds(blocks)
+
+    assert (folds[blocks == -1] == -1).all()
+    for block in range(6):
+        assert len(np.unique(folds[blocks == block])) == 1
+    # 由大至小放入筆數最少的折：50 | 40+10 | 30+20+10
+    assert sorted(np.bincount(folds[folds >= 0])) == [50, 50, 60]
+    assert (cv.assign_folds(np.full(5, -1)) == -1).all()
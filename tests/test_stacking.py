@@ -0,0 +1,87 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import stacking
+from stacking import QuantileForest, StackingPipeline, thread_budget
+
+TAUS = (0.1, 0.25, 0.5, 0.75, 0.9)
+
+
+def regression_data(n=200, seed=3):
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(n, 3))
+    return X, X[:, 0] + rng.normal(scale=0.5, size=n)
+
+
+def weighted_quantiles(forest, X_train, y_train, X_query, taus):
+    """逐點以 Meinshausen 權重（同葉節點的訓練樣本，各樹以葉節點大小平均）求加權分位數"""
+    train_leaves = forest.forest.apply(X_train)
+    query_leaves = forest.forest.apply(X_query)
+    n_trees = train_leaves.shape[1]
+    order = np.argsort(y_train, kind='stable')
+    result = np.empty((len(X_query), len(taus)))
+    for row, leaves in enumerate(query_leaves):
+        same_leaf = train_leaves == leaves
+        weights = (same_leaf / same_leaf.sum(axis=0)).sum(axis=1) / n_trees
+        cumulative = np.cumsum(weights[order])
+        for column, tau in enumerate(taus):
+            result[row, column] = y_train[order][np.argmax(cumulative >= tau - 1e-9)]
+    return result
+
+
+def test_quantile_forest_matches_brute_force_weighted_quantiles(monkeypatch):
+    X, y = regression_data()
+    X_query = regression_data(50, seed=4)[0]
+    # 小批次使預測跨越多個分批
+    monkeypatch.setattr(stacking, 'QRF_CHUNK_SIZE', 16)
+    forest = QuantileForest(TAUS, n_estimators=20, min_samples_leaf=5, random_state=0).fit(X, y)
+    prediction = forest.predict(X_query)
+
+    np.testing.assert_array_equal(prediction, weighted_quantiles(forest, X, y, X_query, TAUS))
+    assert np.all(np.diff(prediction, axis=1) >= 0)
+
+
+@pytest.mark.parametrize('n_jobs, workers, total, expected', [
+    (20, None, 8, (8, 1)), (3, None, 8, (3, 2)), (20, 2, 8, (2, 4)), (1, 4, 1, (1, 1))])
+def test_thread_budget_does_not_oversubscribe(n_jobs, workers, total, expected):
+    processes, threads = thread_budget(n_jobs, workers, total)
+    assert (processes, threads) == expected
+    assert processes * threads <= total
+
+
+def test_cached_jobs_are_not_refitted(tmp_path, monkeypatch):
+    pytest.importorskip('pyarrow')
+    X, y = regression_data()
+    pipeline = StackingPipeline(learners=['rf'], n_splits=3, params={'rf': {'n_estimators': 10}},
+                                workers=1, total_threads=1, cache_dir=tmp_path)
+    oof, test = pipeline.base_predictions(X, y, X_test=X[:20])
+    assert not oof.isna().any().any() and not test.isna().any().any()
+
+    # 刪除預測矩陣後重跑：各 (基學習器, 折) 工作皆由模型快取讀取，不再擬合
+    for path in tmp_path.glob('*.parquet'):
+        path.unlink()
+
+    def fail(job):
+        raise AssertionError("快取的工作不應重新擬合")
+
+    monkeypatch.setattr(stacking, 'fit_job', fail)
+    cached_oof, cached_test = pipeline.base_predictions(X, y, X_test=X[:20])
+    np.testing.assert_array_equal(cached_oof.to_numpy(), oof.to_numpy())
+    np.testing.assert_array_equal(cached_test.to_numpy(), test.to_numpy())
+
+
+def test_crossing_rates_are_reported_on_cache_hit(tmp_path):
+    pytest.importorskip('pyarrow')
+    X, y = regression_data()
+    params = {'rf': {'n_estimators': 10}}
+    fitted = StackingPipeline(learners=['rf'], n_splits=3, params=params, workers=1, total_threads=1,
+                              cache_dir=tmp_path, noncrossing=True)
+    oof, _ = fitted.base_predictions(X, y)
+
+    cached = StackingPipeline(learners=['rf'], n_splits=3, params=params, workers=1, total_threads=1,
+                              cache_dir=tmp_path, noncrossing=True)
+    cached_oof, _ = cached.base_predictions(X, y)
+    np.testing.assert_array_equal(cached_oof.to_numpy(), oof.to_numpy())
+    pd.testing.assert_frame_equal(cached.crossing_, fitted.crossing_)
+    assert list(cached.crossing_.index) == ['RF']
@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+
+
+def daily_frame():
+    """
+    兩個測站各 3 個日曆週（2023-01-02 週一至 2023-01-22 週日）的日資料，資料列索引由 3 開始
+    - A：第 1 週 30°C、第 2 週 15°C、第 3 週 19°C 但前兩日缺測 → 週均溫大於18度之週數為 2
+    - B：第 1 週 25°C、第 2、3 週 10°C，第 2 週有一日缺測 → 1
+    """
+    dates = pd.date_range('2023-01-02', '2023-01-22', freq='D')
+    temperature = {
+        'A': [30.0] * 7 + [15.0] * 7 + [np.nan, np.nan] + [19.0] * 5,
+        'B': [25.0] * 7 + [10.0] * 5 + [np.nan] + [10.0] * 8,
+    }
+    frames = [pd.DataFrame({'stno': stno, 'date': dates, 'month': dates.month, 'PP01': 0.0, 'TX01': values})
+              for stno, values in temperature.items()]
+    df = pd.concat(frames, ignore_index=True)
+    df.index = df.index + 3
+    return df
+
+
+def warm_weeks(processor, df):
+    stats = processor.calculate_station_statistics(df).set_index('stno')
+    return stats['週均溫大於18度之週數'].to_dict()
+
+
+def test_warm_weeks_count_calendar_weeks(processor):
+    assert warm_weeks(processor, daily_frame()) == {'A': 2, 'B': 1}
+
+
+def test_warm_weeks_ignore_row_order_and_index(processor):
+    df = daily_frame()
+    shuffled = df.sample(frac=1, random_state=0)
+    relabelled = shuffled.set_axis(np.arange(len(df))[::-1] * 5)
+    assert warm_weeks(processor, shuffled) == {'A': 2, 'B': 1}
+    assert warm_weeks(processor, relabelled) == {'A': 2, 'B': 1}
+
+
+def test_warm_weeks_differ_from_row_index_grouping(processor):
+    """舊版以資料列索引 // 7 分組：索引偏移後 A 的第 1、2 週被混在一起，得到 3 週"""
+    df = daily_frame()
+    valid = df[df['TX01'].notna()]
+    weekly = valid.groupby([valid['stno'], valid.index // 7])['TX01'].mean()
+    old = (weekly > 18).groupby(level=0).sum().to_dict()
+    assert old == {'A': 3, 'B': 1}
+    assert warm_weeks(processor, df) != old